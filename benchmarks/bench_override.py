@@ -0,0 +1,188 @@
+"""
+Synopsis: Benchmarks the override engine (override_resources, compiled plans and count_overrides_in_dict)
+against synthetic CloudFormation templates of 10 to 20,000 resources.
+
+Usage:
+    python benchmarks/bench_override.py [--sizes 10 1000] [--update-baseline]
+"""
+
+import json
+import sys
+
+from common import get_argument_parser, measure, report
+
+from bettercf.override import (
+    compile_overrides,
+    count_overrides_in_dict,
+    override_resources,
+)
+
+TEMPLATE_SIZES = [10, 100, 1000, 5000, 20000]
+
+# Every OVERRIDE_EVERY-th resource is overridden.
+OVERRIDE_EVERY = 10
+
+
+def generate_template(resource_count: int):
+    """
+    Synopsis: Returns a template of resource_count Lambda functions, each with nested properties, a dict of environment variables and a list of tags.
+    """
+    return {
+        "AWSTemplateFormatVersion": "2010-09-09",
+        "Resources": {
+            f"Function{index}": {
+                "Type": "AWS::Lambda::Function",
+                "Properties": {
+                    "FunctionName": f"function-{index}",
+                    "Handler": "index.handler",
+                    "Runtime": "python3.11",
+                    "Role": {"Fn::GetAtt": [f"Role{index}", "Arn"]},
+                    "Environment": {
+                        "Variables": {
+                            "TABLE_NAME": {"Ref": f"Table{index}"},
+                            "STAGE": "prod",
+                            "LOG_LEVEL": "INFO",
+                        }
+                    },
+                    "Tags": [
+                        {"Key": "Index", "Value": str(index)},
+                        {"Key": "Team", "Value": "platform"},
+                    ],
+                },
+            }
+            for index in range(resource_count)
+        },
+    }
+
+
+def insert_shallow(index: int):
+    return {
+        f">>Topic{index}": {
+            "Type": "AWS::SNS::Topic",
+            "Properties": {"TopicName": f"topic-{index}"},
+        }
+    }
+
+
+def insert_deep(index: int):
+    return {
+        f"Function{index}": {
+            "Properties": {"Environment": {"Variables": {">>FEATURE_FLAG": "on"}}}
+        }
+    }
+
+
+def delete(index: int):
+    return {
+        f"Function{index}": {
+            "Properties": {
+                "<<Role": None,
+                "Environment": {"Variables": {"<<LOG_LEVEL": None}},
+            }
+        }
+    }
+
+
+def merge(index: int):
+    return {
+        f"Function{index}": {
+            "Properties": {
+                "^^Tags": [{"Key": "Owner", "Value": "bench"}],
+                "Environment": {"^^Variables": {"EXTRA": "1"}},
+            }
+        }
+    }
+
+
+def mixed(index: int):
+    return {
+        f"Function{index}": {
+            "Properties": {
+                ">>MemorySize": 1024,
+                "<<Role": None,
+                "^^Tags": [{"Key": "Owner", "Value": "bench"}],
+                "Environment": {
+                    "Variables": {">>FEATURE_FLAG": "on", "<<LOG_LEVEL": None}
+                },
+            }
+        }
+    }
+
+
+# How each override set builds the override for one resource, and whether the per-resource overrides
+# are combined into one dict or given as a list of dicts.
+OVERRIDE_SETS = {
+    "insert-shallow": (insert_shallow, dict),
+    "insert-deep": (insert_deep, dict),
+    "delete": (delete, dict),
+    "merge": (merge, dict),
+    "mixed": (mixed, dict),
+    "mixed-list": (mixed, list),
+}
+
+
+def generate_overrides(resource_count: int, override_set: str):
+    """
+    Synopsis: Returns the ResourceOverrides (applying to a template's "Resources") for every OVERRIDE_EVERY-th resource.
+    """
+    generate_override, container = OVERRIDE_SETS[override_set]
+    overrides = [
+        generate_override(index) for index in range(0, resource_count, OVERRIDE_EVERY)
+    ]
+    if container == list:
+        return overrides
+    return {key: value for override in overrides for key, value in override.items()}
+
+
+def run(sizes: list[int], repeat: int):
+    results = {}
+    for size in sizes:
+        template = generate_template(size)
+        for override_set in OVERRIDE_SETS:
+            overrides = generate_overrides(size, override_set)
+            plan = compile_overrides(overrides)
+            # Small templates are cheap to run many times, which steadies their timings.
+            case_repeat = repeat * max(1, 1000 // size)
+
+            # Much faster than copy.deepcopy, which would dominate the run time for large templates.
+            resources_json = json.dumps(template["Resources"])
+
+            def copy_resources():
+                return json.loads(resources_json)
+
+            cases = {
+                "override_resources": (
+                    lambda resources: override_resources(resources, overrides),
+                    copy_resources,
+                ),
+                "compile_overrides": (lambda _: compile_overrides(overrides), None),
+                "plan.apply": (plan.apply, copy_resources),
+                "plan.render": (lambda _: plan.render(template["Resources"]), None),
+                "count_overrides_in_dict": (
+                    lambda _: count_overrides_in_dict(overrides),
+                    None,
+                ),
+            }
+            for function_name, (function, setup) in cases.items():
+                results[f"{function_name}[{size}-{override_set}]"] = measure(
+                    function, setup, case_repeat
+                )
+    return results
+
+
+def main():
+    parser = get_argument_parser(__doc__.split("\n")[1])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=TEMPLATE_SIZES,
+        help="the numbers of resources in the generated templates.",
+    )
+    args = parser.parse_args()
+    results = run(args.sizes, args.repeat)
+    sys.exit(report("override", results, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Synopsis: Benchmarks loading thousands of stack configs (as a batch deploy does), compared with also loading
+each template's dfm build config (as every stack config load did before it became lazy).
+
+Usage:
+    python benchmarks/bench_stack_configs.py [--counts 100 1000] [--update-baseline]
+"""
+
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+from common import get_argument_parser, measure, report
+
+from bettercf.stack import Stack
+
+STACK_CONFIG_COUNTS = [100, 1000, 5000]
+
+DFM_CONFIG_PATH = Path(__file__).parent.parent.joinpath(".dfm/template_builder.json")
+
+
+def write_stack_configs(directory: Path, count: int):
+    """
+    Synopsis: Writes count stack config files, spread over 10 templates, returning their paths.
+    """
+    paths = []
+    for index in range(count):
+        path = directory.joinpath(f"stack-{index}.json")
+        path.write_text(
+            json.dumps(
+                {
+                    "Version": "1.0",
+                    "Template": {"Name": f"template-{index % 10}", "Version": "0.1"},
+                    "EnvType": "Prod",
+                    "Region": "eu-west-2",
+                    "Identifier": f"stack-{index}",
+                    "RoleArn": None,
+                    "TemplateParameters": {},
+                    "ResourceOverrides": {},
+                }
+            )
+        )
+        paths.append(path)
+    return paths
+
+
+def load_stacks(paths: list[Path], load_dfm_config: bool = False):
+    # The stacks are kept, as a batch deploy holds them all, so peak memory reflects what each one costs.
+    stacks = [Stack.load_stack_config_from_file(path) for path in paths]
+    if load_dfm_config:
+        for stack in stacks:
+            stack.template.dfm_config_file_path = DFM_CONFIG_PATH
+            stack.template.dfm_config
+    return stacks
+
+
+def run(counts: list[int], repeat: int):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for count in counts:
+            count_directory = Path(directory).joinpath(str(count))
+            count_directory.mkdir()
+            paths = write_stack_configs(count_directory, count)
+            results[f"load_stack_config_from_file[{count}]"] = measure(
+                lambda _: load_stacks(paths), repeat=repeat
+            )
+            results[f"load_stack_config_from_file+dfm_config[{count}]"] = measure(
+                lambda _: load_stacks(paths, load_dfm_config=True), repeat=repeat
+            )
+    return results
+
+
+def main():
+    parser = get_argument_parser(__doc__.split("\n")[1])
+    parser.add_argument(
+        "--counts",
+        type=int,
+        nargs="+",
+        default=STACK_CONFIG_COUNTS,
+        help="the numbers of stack configs to load.",
+    )
+    args = parser.parse_args()
+    results = run(args.counts, args.repeat)
+    sys.exit(report("stack_configs", results, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Synopsis: Benchmarks the start up time and peak memory (RSS) of CLI commands that don't talk to AWS,
+against the start up of the interpreter itself.
+
+Usage:
+    python benchmarks/bench_startup.py [--update-baseline]
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+from common import get_argument_parser, report
+
+SRC_PATH = str(Path(__file__).parent.parent.joinpath("src"))
+
+COMMANDS = {
+    "python": ["-c", "pass"],
+    "import bettercf.cli": ["-c", "import bettercf.cli"],
+    "--help": ["-m", "bettercf.cli", "--help"],
+    "--version": ["-m", "bettercf.cli", "--version"],
+    "template --help": ["-m", "bettercf.cli", "template", "--help"],
+}
+
+
+def measure_command(args: list[str], repeat: int):
+    """
+    Synopsis: Runs the interpreter with args repeat times, returning the best wall time (in seconds) and the largest peak RSS (in bytes).
+    """
+    env = {**os.environ, "PYTHONPATH": SRC_PATH}
+    best = float("inf")
+    peak_bytes = 0
+    with open(os.devnull, "w") as devnull:
+        file_actions = [(os.POSIX_SPAWN_DUP2, devnull.fileno(), 1)]
+        for _ in range(repeat):
+            start = time.perf_counter()
+            pid = os.posix_spawn(
+                sys.executable, [sys.executable, *args], env, file_actions=file_actions
+            )
+            _, status, usage = os.wait4(pid, 0)
+            best = min(best, time.perf_counter() - start)
+            if os.waitstatus_to_exitcode(status) != 0:
+                raise Exception(f"'{' '.join(args)}' exited with status {status}.")
+            # ru_maxrss is in KiB on Linux.
+            peak_bytes = max(peak_bytes, usage.ru_maxrss * 1024)
+    return {"seconds": best, "peak_bytes": peak_bytes}
+
+
+def main():
+    parser = get_argument_parser(__doc__.split("\n")[1])
+    parser.set_defaults(repeat=10)
+    args = parser.parse_args()
+    results = {
+        name: measure_command(command, args.repeat)
+        for name, command in COMMANDS.items()
+    }
+    sys.exit(report("startup", results, args))
+
+
+if __name__ == "__main__":
+    main()
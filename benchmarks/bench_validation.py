@@ -0,0 +1,55 @@
+"""
+Synopsis: Benchmarks offline stack config validation (as run by "stack validate") over hundreds to thousands of configs.
+
+Usage:
+    python benchmarks/bench_validation.py [--counts 100 1000] [--update-baseline]
+"""
+
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+from bench_stack_configs import write_stack_configs
+from common import get_argument_parser, measure, report
+
+from bettercf.validation import validate_stack_config, validate_stack_configs
+
+STACK_CONFIG_COUNTS = [100, 1000, 5000]
+
+
+def run(counts: list[int], repeat: int):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for count in counts:
+            count_directory = Path(directory).joinpath(str(count))
+            count_directory.mkdir()
+            paths = write_stack_configs(count_directory, count)
+            configs = [json.loads(path.read_text()) for path in paths]
+            results[f"validate_stack_config[{count}]"] = measure(
+                lambda _: [validate_stack_config(config) for config in configs],
+                repeat=repeat,
+            )
+            # In process, as worker start up times vary too much between machines to compare against a baseline.
+            results[f"validate_stack_configs[{count}]"] = measure(
+                lambda _: validate_stack_configs(paths, max_parallel=1), repeat=repeat
+            )
+    return results
+
+
+def main():
+    parser = get_argument_parser(__doc__.split("\n")[1])
+    parser.add_argument(
+        "--counts",
+        type=int,
+        nargs="+",
+        default=STACK_CONFIG_COUNTS,
+        help="the numbers of stack configs to validate.",
+    )
+    args = parser.parse_args()
+    results = run(args.counts, args.repeat)
+    sys.exit(report("validation", results, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Synopsis: Benchmarks parsing, sorting and picking the latest of large numbers of template versions.
+
+Usage:
+    python benchmarks/bench_version.py [--counts 1000 100000] [--update-baseline]
+"""
+
+import random
+import sys
+
+from common import get_argument_parser, measure, report
+
+from bettercf.version import Version, get_latest_version, version_sort_key
+
+VERSION_COUNTS = [1000, 10000, 100000]
+
+
+def generate_version_strings(count: int):
+    """
+    Synopsis: Returns count distinct version strings in a random (but repeatable) order, mixing the 'X.Y' and 'X.Y.Z' formats.
+    """
+    version_strings = [
+        (
+            f"{index // 1000}.{index % 1000 // 10}.{index % 10}"
+            if index % 2
+            else f"{index // 1000}.{index % 1000}"
+        )
+        for index in range(count)
+    ]
+    random.Random(0).shuffle(version_strings)
+    return version_strings
+
+
+def run(counts: list[int], repeat: int):
+    results = {}
+    for count in counts:
+        version_strings = generate_version_strings(count)
+        keys = [f"foo/{version_string}" for version_string in version_strings]
+        versions = [Version(version_string) for version_string in version_strings]
+        cases = {
+            "Version": lambda _: [Version(v) for v in version_strings],
+            "get_latest_version": lambda _: get_latest_version(version_strings),
+            "get_latest_version(keys)": lambda _: get_latest_version(
+                keys, prefix="foo/"
+            ),
+            "sorted(version_sort_key)": lambda _: sorted(
+                version_strings, key=version_sort_key
+            ),
+            "sorted(Version)": lambda _: sorted(versions),
+            "set(Version)": lambda _: set(versions),
+        }
+        for name, function in cases.items():
+            results[f"{name}[{count}]"] = measure(function, repeat=repeat)
+    return results
+
+
+def main():
+    parser = get_argument_parser(__doc__.split("\n")[1])
+    parser.add_argument(
+        "--counts",
+        type=int,
+        nargs="+",
+        default=VERSION_COUNTS,
+        help="the numbers of versions.",
+    )
+    args = parser.parse_args()
+    results = run(args.counts, args.repeat)
+    sys.exit(report("version", results, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+# Benchmarks run against the working tree rather than whatever version of bettercf happens to be installed.
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath("src")))
+
+BASELINES_DIR = Path(__file__).parent.joinpath("baselines")
+
+# Differences below these are treated as noise, however large they are relative to the baseline.
+MIN_SECONDS_REGRESSION = 0.001
+MIN_BYTES_REGRESSION = 64 * 1024
+
+
+def measure(function, setup=None, repeat: int = 5):
+    """
+    Synopsis: Returns the best wall time (in seconds) and the peak traced memory (in bytes) of function(setup()).
+    setup runs outside the measurement, so e.g copying inputs doesn't count towards the result.
+    Memory is measured in a separate run, as tracing slows everything down.
+    """
+    setup = setup or (lambda: None)
+    best = float("inf")
+    for _ in range(repeat):
+        argument = setup()
+        start = time.perf_counter()
+        function(argument)
+        best = min(best, time.perf_counter() - start)
+
+    argument = setup()
+    tracemalloc.start()
+    try:
+        function(argument)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak_bytes}
+
+
+def get_argument_parser(description: str):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="overwrite the stored baseline with this run's results instead of comparing against it.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="how much slower/larger (as a fraction of the baseline) a case may be before it is reported as a regression.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="number of timed runs per case. The best is reported.",
+    )
+    return parser
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float):
+    """
+    Synopsis: Returns a message for each case in results that is slower or uses more memory than the baseline allows.
+    """
+    regressions = []
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        expected = baseline[case]
+        if (
+            result["seconds"] > expected["seconds"] * (1 + tolerance)
+            and result["seconds"] - expected["seconds"] > MIN_SECONDS_REGRESSION
+        ):
+            regressions.append(
+                f"{case}: {result['seconds'] * 1000:.2f}ms (baseline {expected['seconds'] * 1000:.2f}ms)"
+            )
+        if (
+            result["peak_bytes"] > expected["peak_bytes"] * (1 + tolerance)
+            and result["peak_bytes"] - expected["peak_bytes"] > MIN_BYTES_REGRESSION
+        ):
+            regressions.append(
+                f"{case}: {result['peak_bytes'] / 1024:.0f}KiB peak memory (baseline {expected['peak_bytes'] / 1024:.0f}KiB)"
+            )
+    return regressions
+
+
+def report(name: str, results: dict, args):
+    """
+    Synopsis: Prints the results, then either stores them as the new baseline or compares them against the stored one.
+
+    Returns:
+    The exit code: 1 if any case regressed, otherwise 0.
+    """
+    baseline_file = BASELINES_DIR.joinpath(f"{name}.json")
+    baseline = {}
+    if baseline_file.exists():
+        baseline = json.loads(baseline_file.read_text())["Results"]
+
+    print(f"{'case':<60} {'time':>12} {'baseline':>12} {'peak mem':>12}")
+    for case, result in results.items():
+        expected = (
+            f"{baseline[case]['seconds'] * 1000:.2f}ms" if case in baseline else "-"
+        )
+        print(
+            f"{case:<60} {result['seconds'] * 1000:>10.2f}ms {expected:>12} "
+            f"{result['peak_bytes'] / 1024:>9.0f}KiB"
+        )
+
+    if args.update_baseline:
+        BASELINES_DIR.mkdir(exist_ok=True)
+        baseline_file.write_text(
+            json.dumps(
+                {"Python": platform.python_version(), "Results": results},
+                indent=2,
+                sort_keys=True,
+            )
+            + "\n"
+        )
+        print(f"Baseline written to {baseline_file}.")
+        return 0
+
+    if not baseline:
+        print(f"No baseline found at {baseline_file}. Run with --update-baseline.")
+        return 0
+
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    print(f"{len(regressions)} regression(s) against {baseline_file}.")
+    return 1 if regressions else 0
@@ -0,0 +1,465 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+from dfm.file_types import JsonFileType
+
+from bettercf.clients import get_client
+from bettercf.graph import DependencyGraph, run_in_dependency_order
+from bettercf.package import package_template
+from bettercf.results import BatchResult, count_unsuccessful, print_result, summarise
+from bettercf.stack import Stack
+from bettercf.template import Template
+from bettercf.utils import get_management_bucket_name
+from bettercf.version import Version
+
+# The keys of each template in a push manifest. Version is optional: without it the template's next minor version is pushed.
+PUSH_MANIFEST_KEYS = ["Name", "TemplatePath", "Version"]
+
+
+@dataclass
+class StackResult(BatchResult):
+    """
+    Synopsis: The outcome of deploying a single stack config as part of a batch.
+    """
+
+    config_path: Path
+    stack_name: str
+    status: str
+    duration: float
+    error: str = None
+    region: str = None
+
+    @property
+    def name(self):
+        return self.stack_name
+
+
+def load_stacks(config_path: Path, regions: list[str] = None):
+    """
+    Synopsis: Loads one Stack for each region of a stack config. A config that fails to load is returned as a failed StackResult instead.
+    """
+    try:
+        return Stack.load_stack_configs_from_file(config_path, regions), None
+    except Exception as e:
+        return [], StackResult(config_path, str(config_path), "failed", 0.0, str(e))
+
+
+def run_stack_action(config_path: Path, stack: Stack, action):
+    """
+    Synopsis: Calls action() for one stack, capturing its status, or any failure, in the returned StackResult instead of raising it.
+    """
+    start = time.monotonic()
+    stack_name = stack.generate_stack_name()
+    try:
+        status = action()
+        return StackResult(
+            config_path,
+            stack_name,
+            status,
+            time.monotonic() - start,
+            region=stack.region.name,
+        )
+    except Exception as e:
+        return StackResult(
+            config_path,
+            stack_name,
+            "failed",
+            time.monotonic() - start,
+            str(e),
+            region=stack.region.name,
+        )
+
+
+def deploy_stack(config_path: Path, stack: Stack, force: bool = False):
+    """
+    Synopsis: Deploys one stack (to its region), capturing any failure in the returned StackResult instead of raising it.
+    """
+    return run_stack_action(config_path, stack, lambda: stack.deploy(force=force))
+
+
+def delete_stack(config_path: Path, stack: Stack):
+    """
+    Synopsis: Deletes one stack (from its region), capturing any failure in the returned StackResult instead of raising it.
+    """
+    return run_stack_action(config_path, stack, stack.delete)
+
+
+def load_stack_graph(config_paths: list[Path], regions: list[str] = None):
+    """
+    Synopsis: Loads every stack config and builds the graph of their stacks from each config's DependsOn.
+    A stack depends on the stacks of each of its config's dependencies in the same region or, if a dependency isn't deployed
+    to that region, on all of the dependency's stacks. Dependencies that aren't being deployed are assumed to be deployed already.
+    Raises an exception if the configs depend on each other in a cycle.
+
+    Returns:
+    The graph and a dict of each of its nodes to (config path, Stack). Nodes are (config path, region name) tuples.
+    A config that fails to load is a single (config path, None) node, with a failed StackResult in place of its Stack.
+    """
+    loaded = {}
+    for config_path in config_paths:
+        key = Path(config_path).resolve()
+        stacks, failed_load = load_stacks(config_path, regions)
+        if not failed_load:
+            for stack in stacks:
+                for dependency in stack.depends_on:
+                    if not key.parent.joinpath(dependency).is_file():
+                        failed_load = StackResult(
+                            config_path,
+                            str(config_path),
+                            "failed",
+                            0.0,
+                            f"Depends on '{dependency}', which isn't a stack config file.",
+                        )
+                        break
+        loaded[key] = (config_path, [] if failed_load else stacks, failed_load)
+
+    # Check for cycles between the configs first, as that is how they are written.
+    config_graph = DependencyGraph()
+    for key, (config_path, stacks, _) in loaded.items():
+        dependencies = stacks[0].depends_on if stacks else []
+        config_graph.add(
+            config_path,
+            [
+                loaded[dependency_key][0]
+                for dependency_key in (
+                    key.parent.joinpath(dependency).resolve()
+                    for dependency in dependencies
+                )
+                if dependency_key in loaded
+            ],
+        )
+    cycle = config_graph.find_cycle()
+    if cycle:
+        raise Exception(
+            f"Stack configs depend on each other in a cycle: {' -> '.join(str(config_path) for config_path in cycle)}."
+        )
+
+    graph = DependencyGraph()
+    nodes = {}
+    for key, (config_path, stacks, failed_load) in loaded.items():
+        if failed_load:
+            graph.add((key, None))
+            nodes[(key, None)] = (config_path, failed_load)
+            continue
+        for stack in stacks:
+            dependencies = []
+            for dependency in stack.depends_on:
+                dependency_key = key.parent.joinpath(dependency).resolve()
+                if dependency_key not in loaded:
+                    continue
+                _, dependency_stacks, dependency_failed_load = loaded[dependency_key]
+                if dependency_failed_load:
+                    dependencies.append((dependency_key, None))
+                    continue
+                same_region = [
+                    (dependency_key, dependency_stack.region.name)
+                    for dependency_stack in dependency_stacks
+                    if dependency_stack.region.name == stack.region.name
+                ]
+                dependencies.extend(
+                    same_region
+                    or [
+                        (dependency_key, dependency_stack.region.name)
+                        for dependency_stack in dependency_stacks
+                    ]
+                )
+            graph.add((key, stack.region.name), dependencies)
+            nodes[(key, stack.region.name)] = (config_path, stack)
+    return graph, nodes
+
+
+def deploy_stacks(
+    config_paths: list[Path],
+    max_parallel: int = 1,
+    on_result=None,
+    force: bool = False,
+    regions: list[str] = None,
+):
+    """
+    Synopsis: Deploys many stack configs on a bounded worker pool, in dependency order (see load_stack_graph).
+    Each stack starts as soon as every stack it depends on has deployed, so independent stacks deploy concurrently.
+    A config with several regions is deployed to all of them concurrently, as a separate stack per region.
+    A failed stack does not stop the others from deploying, but the stacks that depend on it are skipped.
+
+    Parameters:
+    - config_paths : the stack config files to deploy.
+    - max_parallel : the maximum number of stacks deploying at the same time, across all configs and regions.
+    - on_result : called with (result, completed, total) as each stack finishes. Defaults to printing the result.
+    - force : update stacks even if their fingerprint shows nothing changed.
+    - regions : deploy every config to these regions instead of the ones in the configs.
+
+    Returns:
+    A list of StackResult, in the order the stacks finished.
+    """
+    if max_parallel < 1:
+        raise Exception(f"max_parallel must be at least 1. Got {max_parallel}.")
+    if on_result is None:
+        on_result = print_result
+
+    graph, nodes = load_stack_graph(config_paths, regions)
+    return run_stack_graph(
+        graph,
+        nodes,
+        lambda config_path, stack: deploy_stack(config_path, stack, force),
+        max_parallel,
+        on_result,
+    )
+
+
+def delete_stacks(
+    config_paths: list[Path],
+    max_parallel: int = 1,
+    on_result=None,
+    regions: list[str] = None,
+):
+    """
+    Synopsis: Deletes the stacks of many stack configs on a bounded worker pool, in reverse dependency order (see load_stack_graph).
+    Each stack is deleted as soon as every stack that depends on it has been deleted, so independent stacks are deleted concurrently.
+    A stack that doesn't exist is reported as "absent". If a stack fails to delete, the stacks it depends on are skipped,
+    as it may still be using them.
+
+    Parameters:
+    - config_paths : the stack config files to delete the stacks of.
+    - max_parallel : the maximum number of stacks deleting at the same time, across all configs and regions.
+    - on_result : called with (result, completed, total) as each stack finishes. Defaults to printing the result.
+    - regions : delete every config's stacks from these regions instead of the ones in the configs.
+
+    Returns:
+    A list of StackResult, in the order the stacks finished.
+    """
+    if max_parallel < 1:
+        raise Exception(f"max_parallel must be at least 1. Got {max_parallel}.")
+    if on_result is None:
+        on_result = print_result
+
+    graph, nodes = load_stack_graph(config_paths, regions)
+    return run_stack_graph(
+        graph.reversed(), nodes, delete_stack, max_parallel, on_result
+    )
+
+
+def run_stack_graph(
+    graph: DependencyGraph, nodes: dict, run_stack, max_parallel: int, on_result
+):
+    """
+    Synopsis: Runs run_stack(config path, Stack) for every stack of a graph from load_stack_graph, in dependency order,
+    skipping those downstream of a failure. Configs that failed to load are reported as they are.
+    """
+
+    def run_node(node):
+        config_path, stack = nodes[node]
+        if isinstance(stack, StackResult):
+            return stack
+        return run_stack(config_path, stack)
+
+    def skip_node(node, failed_node):
+        config_path, stack = nodes[node]
+        if isinstance(stack, StackResult):
+            # A config that failed to load (reached when deleting, as it then depends on its dependents) reports its load failure.
+            return stack
+        _, failed_stack = nodes[failed_node]
+        failed_name = (
+            failed_stack.stack_name
+            if isinstance(failed_stack, StackResult)
+            else failed_stack.generate_stack_name()
+        )
+        return StackResult(
+            config_path,
+            stack.generate_stack_name(),
+            "skipped",
+            0.0,
+            f"Skipped as '{failed_name}' failed.",
+            region=stack.region.name,
+        )
+
+    results = []
+    for result in run_in_dependency_order(graph, run_node, skip_node, max_parallel):
+        results.append(result)
+        on_result(result, len(results), len(nodes))
+    return results
+
+
+def summarise_results(results: list[StackResult]):
+    """
+    Synopsis: Prints a summary of a batch of stack results, broken down by region if there are several, and returns the
+    combined exit code (0 if every stack succeeded, otherwise 1).
+    """
+    exit_code = summarise(results, "stack(s)", "succeeded")
+    regions = sorted({result.region for result in results if result.region})
+    if len(regions) > 1:
+        for region in regions:
+            region_results = [result for result in results if result.region == region]
+            region_unsuccessful = [
+                result for result in region_results if not result.succeeded
+            ]
+            print(
+                f"  {region}: {len(region_results) - len(region_unsuccessful)} succeeded, {count_unsuccessful(region_unsuccessful)}."
+            )
+    return exit_code
+
+
+@dataclass
+class TemplatePushResult(BatchResult):
+    """
+    Synopsis: The outcome of pushing a single template as part of a batch.
+    """
+
+    template_name: str
+    version: str
+    status: str
+    size: int
+    duration: float
+    error: str = None
+
+    @property
+    def name(self):
+        return f"{self.template_name} {self.version or ''}".rstrip()
+
+    def progress_details(self):
+        return f"{self.size / 1024:.1f}KiB, {self.duration:.1f}s"
+
+
+def load_push_manifest(manifest_path: Path):
+    """
+    Synopsis: Reads a push manifest: a JSON list of {"Name", "TemplatePath", "Version"} objects.
+    Relative template paths are relative to the manifest.
+    """
+    manifest = JsonFileType.load_from_file(manifest_path)
+    if type(manifest) != list:
+        raise Exception(f"Push manifest {manifest_path} must be a list of templates.")
+    templates = []
+    for entry in manifest:
+        if (
+            type(entry) != dict
+            or not entry.get("Name")
+            or not entry.get("TemplatePath")
+        ):
+            raise Exception(
+                f"Push manifest {manifest_path} entries must have a Name and a TemplatePath. Got {entry}."
+            )
+        unexpected_keys = set(entry) - set(PUSH_MANIFEST_KEYS)
+        if unexpected_keys:
+            raise Exception(
+                f"Unexpected keys {sorted(unexpected_keys)} in push manifest {manifest_path}."
+            )
+        templates.append(
+            {
+                **entry,
+                "TemplatePath": Path(manifest_path).parent.joinpath(
+                    entry["TemplatePath"]
+                ),
+            }
+        )
+    return templates
+
+
+def push_template(
+    entry: dict, dedupe: str = "off", package: bool = False, overwrite: bool = True
+):
+    """
+    Synopsis: Pushes one manifest entry, capturing any failure in the returned TemplatePushResult instead of raising it.
+    If package is set, the template's local artifacts are packaged and uploaded first (see package_template).
+    """
+    start = time.monotonic()
+    version_string = entry.get("Version")
+    size = 0
+    try:
+        template = JsonFileType.load_from_file(entry["TemplatePath"])
+        if package:
+            template = package_template(template, Path(entry["TemplatePath"]).parent)
+        template_body = json.dumps(template).encode("utf-8")
+        size = len(template_body)
+        if version_string:
+            version = Version(version_string)
+        else:
+            version = Version(
+                Template.detect_latest_version(entry["Name"])
+            ).auto_increment_version()
+        version_string = version.get_version_string()
+        status = Template.push_mechanism(
+            entry["Name"], version, template_body, dedupe, overwrite
+        )
+        return TemplatePushResult(
+            entry["Name"], version_string, status, size, time.monotonic() - start
+        )
+    except Exception as e:
+        return TemplatePushResult(
+            entry["Name"],
+            version_string,
+            "failed",
+            size,
+            time.monotonic() - start,
+            str(e),
+        )
+
+
+def push_templates(
+    templates: list[dict],
+    max_parallel: int = 8,
+    on_result=None,
+    dedupe: str = "off",
+    package: bool = False,
+    overwrite: bool = True,
+):
+    """
+    Synopsis: Pushes many templates concurrently, sharing one S3 client and one lookup of the management bucket.
+    Versions of the same template are pushed one after another (in the given order), as each push updates the template's index.
+    A failed push does not stop the others.
+
+    Parameters:
+    - templates : {"Name", "TemplatePath", "Version"} dicts, as read by load_push_manifest.
+    - max_parallel : the maximum number of templates uploading at the same time.
+    - on_result : called with (result, completed, total) as each push finishes. Defaults to printing the result.
+    - dedupe, overwrite : as for Template.push_mechanism.
+    - package : package and upload each template's local artifacts first (see package_template).
+
+    Returns:
+    A list of TemplatePushResult, in the order the pushes finished.
+    """
+    if max_parallel < 1:
+        raise Exception(f"max_parallel must be at least 1. Got {max_parallel}.")
+    if on_result is None:
+        on_result = print_result
+
+    # Resolved once up front, so the workers share them rather than racing to look them up.
+    get_client("s3")
+    get_management_bucket_name()
+
+    templates_by_name = {}
+    for entry in templates:
+        templates_by_name.setdefault(entry["Name"], []).append(entry)
+
+    def push_versions(entries: list[dict]):
+        return [push_template(entry, dedupe, package, overwrite) for entry in entries]
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        futures = [
+            executor.submit(push_versions, entries)
+            for entries in templates_by_name.values()
+        ]
+        for future in as_completed(futures):
+            for result in future.result():
+                results.append(result)
+                on_result(result, len(results), len(templates))
+    return results
+
+
+def summarise_push_results(results: list[TemplatePushResult], duration: float):
+    """
+    Synopsis: Prints a summary of a batch of template pushes, including the throughput over duration (in seconds),
+    and returns the combined exit code (0 if every push succeeded, otherwise 1).
+    """
+    pushed = len([result for result in results if result.succeeded])
+    pushed_bytes = sum(result.size for result in results if result.succeeded)
+    duration = max(duration, 1e-9)
+    return summarise(
+        results,
+        "template(s)",
+        "pushed",
+        details=f"{pushed_bytes / 1024 / 1024:.2f}MiB in {duration:.1f}s "
+        f"({pushed / duration:.1f} templates/s, {pushed_bytes / 1024 / 1024 / duration:.2f}MiB/s).",
+    )
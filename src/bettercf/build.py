@@ -0,0 +1,407 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+from dfm.config import BuildConfig
+from dfm.file_types import JsonFileType
+from dfm.json_merger import JsonMergerFactory
+from jsonpath_ng import parse
+
+from bettercf.cache import get_cache_dir
+from bettercf.results import BatchResult, print_result, summarise
+
+# The dfm parameter the template name is passed to configs as.
+TEMPLATE_NAME_PARAMETER = "TemplateName"
+
+
+class IncrementalBuilder:
+    """
+    Synopsis:
+        Builds a dfm config like BuildConfig.build, but keeps a build cache (under <cache dir>/builds) recording the
+        mtime, size, SHA-256 and extracted content of every source fragment, and the hash of the output it wrote.
+        - If no fragment, the config or the destination file has changed since the last build, the build is skipped.
+        - Otherwise only the new/changed fragments are read and parsed again. The destination is then re-merged from
+          the cached fragment contents, starting from the content the destination file had before it was first built
+          (dfm merges aren't idempotent, so merging into the previous output would duplicate values).
+        A builder can be kept alive (e.g in watch mode) to avoid reloading the cache between builds.
+    """
+
+    def __init__(self, dfm_config: BuildConfig, cache_file: Path = None):
+        self.dfm_config = dfm_config
+        self.destination_path = (
+            dfm_config.root_path / dfm_config.destination_file.location.substituted_path
+        )
+        self.cache_file = cache_file or get_cache_dir().joinpath(
+            "builds",
+            hashlib.sha256(str(self.destination_path.resolve()).encode()).hexdigest()
+            + ".json",
+        )
+        self.config_fingerprint = [
+            [src.location.substituted_path, src.node, src.destination_node]
+            for src in dfm_config.source_files
+        ]
+        self._cache = None
+        # The number of fragments read again by the last build (None if the build was skipped).
+        self.changed_fragments = None
+
+    def build(self, save_to_local_file: bool = True):
+        """
+        Synopsis: Builds the destination file (if anything changed) and returns its content.
+        """
+        cache = self._load_cache()
+        destination_sha256 = _hash_file(self.destination_path)
+        destination_unchanged = (
+            "OutputSha256" in cache and cache["OutputSha256"] == destination_sha256
+        )
+        if not destination_unchanged:
+            # The destination was edited (or deleted) outside of the incremental build, so merge into its current content like dfm would.
+            cache["InitialContent"] = (
+                JsonFileType.load_from_file(self.destination_path)
+                if destination_sha256
+                else {}
+            )
+            cache["Sources"] = []
+
+        sources = []
+        self.changed_fragments = 0
+        for index, src in enumerate(self.dfm_config.source_files):
+            cached_fragments = (
+                cache["Sources"][index] if index < len(cache["Sources"]) else {}
+            )
+            fragments = {}
+            # Globbed on every build (not cached like FileLocation.resolved_paths) so new fragments are picked up.
+            for fragment_path in self.dfm_config.root_path.glob(
+                src.location.substituted_path
+            ):
+                fragments[str(fragment_path)] = self._load_fragment(
+                    fragment_path, src.node, cached_fragments.get(str(fragment_path))
+                )
+            sources.append(fragments)
+
+        if (
+            destination_unchanged
+            and self.changed_fragments == 0
+            and sources == cache["Sources"]
+        ):
+            self.changed_fragments = None
+            return JsonFileType.load_from_file(self.destination_path)
+
+        content = self._merge(cache["InitialContent"], sources)
+        if save_to_local_file:
+            self.dfm_config.write_content(content)
+            cache["OutputSha256"] = _hash_file(self.destination_path)
+        cache["Sources"] = sources
+        self._save_cache(cache)
+        return content
+
+    def _load_fragment(self, fragment_path: Path, node: str, cached_fragment: dict):
+        stat = fragment_path.stat()
+        if (
+            cached_fragment
+            and cached_fragment["MtimeNs"] == stat.st_mtime_ns
+            and cached_fragment["Size"] == stat.st_size
+        ):
+            return cached_fragment
+
+        body = fragment_path.read_bytes()
+        sha256 = hashlib.sha256(body).hexdigest()
+        if cached_fragment and cached_fragment["Sha256"] == sha256:
+            # Touched but not changed.
+            content = cached_fragment["Content"]
+        else:
+            self.changed_fragments += 1
+            content = [match.value for match in parse(node).find(json.loads(body))]
+        return {
+            "MtimeNs": stat.st_mtime_ns,
+            "Size": stat.st_size,
+            "Sha256": sha256,
+            "Content": content,
+        }
+
+    def _merge(self, initial_content, sources: list[dict]):
+        """
+        Synopsis: The merge of BuildConfig.generate_new_dest_content, using the cached fragment contents instead of reading every source file.
+        """
+        # Merging modifies both the destination and the merged values, so work on copies of the cached content.
+        dest_content, sources = json.loads(json.dumps([initial_content, sources]))
+        for src, fragments in zip(self.dfm_config.source_files, sources):
+            jsonpath_expr = parse(src.destination_node)
+            dest_content_matches = [
+                match.value for match in jsonpath_expr.find(dest_content)
+            ]
+            if dest_content_matches == []:
+                dest_content_matches = [None]
+            for destination_match in dest_content_matches:
+                for fragment in fragments.values():
+                    for src_content in fragment["Content"]:
+                        dest_json_merger = JsonMergerFactory(
+                            destination_match
+                        ).generate_json_merger()
+                        dest_json_merger.merge_obj(src_content)
+                        destination_match = dest_json_merger.json_obj
+                        dest_content = jsonpath_expr.update_or_create(
+                            dest_content, dest_json_merger.json_obj
+                        )
+        return dest_content
+
+    def _load_cache(self):
+        if self._cache is None:
+            try:
+                self._cache = json.loads(self.cache_file.read_text())
+            except (FileNotFoundError, ValueError):
+                self._cache = {}
+            if self._cache.get("Config") != self.config_fingerprint:
+                self._cache = {"Config": self.config_fingerprint, "Sources": []}
+        return self._cache
+
+    def _save_cache(self, cache: dict):
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = self.cache_file.with_suffix(f".{os.getpid()}.tmp")
+        temp_file.write_text(json.dumps(cache))
+        os.replace(temp_file, self.cache_file)
+
+
+def _hash_file(file_path: Path):
+    try:
+        return hashlib.sha256(file_path.read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+class BuildWatcher:
+    """
+    Synopsis:
+        Keeps rebuilding a template (incrementally) as its source fragments change.
+        Every interval seconds the source files' mtimes and sizes are polled. Once they have changed and then stayed
+        the same for debounce seconds (so a burst of edits, e.g a branch checkout, causes a single build) the template is rebuilt.
+        A failed build (e.g a fragment saved mid-edit with invalid JSON) is reported and the watch carries on.
+
+    Parameters:
+    - builder : the IncrementalBuilder to build with. Kept alive between builds so its cache is never reloaded.
+    - name : the template name, used in messages.
+    - interval : seconds between polls.
+    - debounce : seconds the sources must be unchanged for before rebuilding.
+    - clock / sleep : injectable for testing. Default to time.monotonic and time.sleep.
+    """
+
+    def __init__(
+        self,
+        builder: IncrementalBuilder,
+        name: str,
+        interval: float = 0.2,
+        debounce: float = 0.3,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.builder = builder
+        self.name = name
+        self.interval = interval
+        self.debounce = debounce
+        self.clock = clock
+        self.sleep = sleep
+        self._snapshot = self.snapshot()
+        self._changed_at = None
+
+    def snapshot(self):
+        dfm_config = self.builder.dfm_config
+        snapshot = {}
+        for src in dfm_config.source_files:
+            for fragment_path in dfm_config.root_path.glob(
+                src.location.substituted_path
+            ):
+                try:
+                    stat = fragment_path.stat()
+                except FileNotFoundError:
+                    # Deleted since it was globbed. It'll be missing from the next snapshot.
+                    continue
+                snapshot[str(fragment_path)] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def check(self):
+        """
+        Synopsis: Polls the sources once. Returns True if they changed and have since settled, i.e a rebuild is due.
+        """
+        snapshot = self.snapshot()
+        if snapshot != self._snapshot:
+            self._snapshot = snapshot
+            self._changed_at = self.clock()
+            return False
+        if (
+            self._changed_at is not None
+            and self.clock() - self._changed_at >= self.debounce
+        ):
+            self._changed_at = None
+            return True
+        return False
+
+    def rebuild(self):
+        start = self.clock()
+        try:
+            self.builder.build()
+        except Exception as e:
+            print(f"Template '{self.name}' failed to build: {e}")
+            return False
+        if self.builder.changed_fragments is None:
+            print(f"Template '{self.name}' is unchanged.")
+        else:
+            print(
+                f"Template '{self.name}' built ({self.builder.changed_fragments} changed fragment(s)) in {self.clock() - start:.2f}s."
+            )
+        return True
+
+    def run(self, should_stop=lambda: False):
+        """
+        Synopsis: Builds the template, then rebuilds it whenever its sources change until should_stop() returns True (or the process is interrupted).
+        """
+        self.rebuild()
+        print(f"Watching template '{self.name}' for changes. Press Ctrl+C to stop.")
+        while not should_stop():
+            self.sleep(self.interval)
+            if self.check():
+                self.rebuild()
+
+
+@dataclass
+class TemplateBuildResult(BatchResult):
+    """
+    Synopsis: The outcome of building a single template as part of a batch.
+    """
+
+    template_name: str
+    status: str
+    duration: float
+    error: str = None
+
+    @property
+    def name(self):
+        return self.template_name
+
+    def progress_details(self):
+        return f"{self.duration:.2f}s"
+
+
+def discover_template_names(dfm_config_path: Path, dfm_root_path: Path):
+    """
+    Synopsis: Finds every template under the dfm root path, by listing the directories at the point where the
+    template name is substituted into the config's source file paths (e.g templates/${TEMPLATE_NAME}/resources/**/*.json).
+    """
+    config_dict = JsonFileType.load_from_file(dfm_config_path)
+    template_names = set()
+    for src in config_dict["SourceFiles"]:
+        location = src["SourceFileLocation"]
+        for sub_key, sub_dict in location.get("PathSubs", {}).items():
+            if (
+                sub_dict["Type"] != "Parameter"
+                or sub_dict["Value"] != TEMPLATE_NAME_PARAMETER
+            ):
+                continue
+            placeholder = f"${{{sub_key}}}"
+            if placeholder not in location["Path"]:
+                continue
+            prefix, suffix = location["Path"].split(placeholder, 1)
+            if not (prefix == "" or prefix.endswith("/")) or not (
+                suffix == "" or suffix.startswith("/")
+            ):
+                raise Exception(
+                    f"Can't discover templates from '{location['Path']}'. The template name must be a whole directory name."
+                )
+            template_names.update(
+                path.name
+                for path in Path(dfm_root_path).glob(f"{prefix}*")
+                if path.is_dir()
+            )
+    if not template_names:
+        raise Exception(f"No templates found under '{dfm_root_path}'.")
+    return sorted(template_names)
+
+
+def build_template(
+    template_name: str,
+    dfm_config_path: Path,
+    dfm_root_path: Path,
+    incremental: bool = False,
+):
+    """
+    Synopsis: Builds one template, capturing any failure in the returned TemplateBuildResult instead of raising it.
+    """
+    start = time.monotonic()
+    try:
+        dfm_config = BuildConfig.load_config_from_file(
+            file_path=Path(dfm_config_path),
+            root_path=Path(dfm_root_path),
+            parameters={TEMPLATE_NAME_PARAMETER: template_name},
+        )
+        if incremental:
+            builder = IncrementalBuilder(dfm_config)
+            builder.build()
+            status = "unchanged" if builder.changed_fragments is None else "built"
+        else:
+            dfm_config.build()
+            status = "built"
+        return TemplateBuildResult(template_name, status, time.monotonic() - start)
+    except Exception as e:
+        return TemplateBuildResult(
+            template_name, "failed", time.monotonic() - start, str(e)
+        )
+
+
+def build_templates(
+    template_names: list[str],
+    dfm_config_path: Path,
+    dfm_root_path: Path,
+    incremental: bool = False,
+    max_parallel: int = None,
+    on_result=None,
+):
+    """
+    Synopsis: Builds many templates on a pool of worker processes (merging is CPU bound, so threads wouldn't help).
+    A failed template does not stop the others from building.
+
+    Parameters:
+    - template_names : the templates to build.
+    - dfm_config_path / dfm_root_path : as for a single template build.
+    - incremental : build each template incrementally (see IncrementalBuilder).
+    - max_parallel : the maximum number of templates building at the same time. Defaults to the number of CPUs.
+    - on_result : called with (result, completed, total) as each template finishes. Defaults to printing the result.
+
+    Returns:
+    A list of TemplateBuildResult, in the order the templates finished.
+    """
+    if max_parallel is not None and max_parallel < 1:
+        raise Exception(f"max_parallel must be at least 1. Got {max_parallel}.")
+    if on_result is None:
+        on_result = print_result
+
+    results = []
+    with ProcessPoolExecutor(max_workers=max_parallel) as executor:
+        futures = [
+            executor.submit(
+                build_template,
+                template_name,
+                dfm_config_path,
+                dfm_root_path,
+                incremental,
+            )
+            for template_name in template_names
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            on_result(result, len(results), len(futures))
+    return results
+
+
+def summarise_build_results(results: list[TemplateBuildResult]):
+    """
+    Synopsis: Prints a summary of a batch of template builds and returns the combined exit code (0 if every template built, otherwise 1).
+    """
+    return summarise(
+        results,
+        "template(s)",
+        "built",
+        details=f"{sum(result.duration for result in results):.2f}s of build time.",
+    )
@@ -0,0 +1,257 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from bettercf.clients import get_client, get_region_name
+
+
+def get_cache_dir():
+    """
+    Synopsis: Returns the local directory BetterCF caches data in. Override it with the BETTERCF_CACHE_DIR environment variable.
+    """
+    return Path(
+        os.environ.get("BETTERCF_CACHE_DIR", Path.home().joinpath(".cache", "bettercf"))
+    )
+
+
+class ManagementBucketCache:
+    """
+    Synopsis:
+        Memoizes metadata about the BetterCF management bucket (its name, location etc.) for the life of the process.
+        Set the BETTERCF_BUCKET_CACHE_TTL environment variable to a number of seconds to also cache the metadata on disk,
+        keyed by AWS account and region, so repeated CLI calls don't look it up again.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._values = {}
+        self._disk_key = None
+
+    @staticmethod
+    def get_ttl():
+        return float(os.environ.get("BETTERCF_BUCKET_CACHE_TTL", 0))
+
+    @staticmethod
+    def get_disk_cache_dir():
+        return get_cache_dir().joinpath("management_bucket")
+
+    def get(self, field: str, resolver):
+        """
+        Synopsis: Returns the cached value for field, calling resolver() to look it up on a cache miss.
+        Failed lookups are not cached.
+        """
+        with self._lock:
+            if field in self._values:
+                return self._values[field]
+            value = self._read_from_disk(field)
+            if value is None:
+                value = resolver()
+                self._write_to_disk(field, value)
+            self._values[field] = value
+            return value
+
+    def invalidate(self):
+        """
+        Synopsis: Forgets every cached value, both in memory and on disk.
+        """
+        with self._lock:
+            self._values = {}
+            self._disk_key = None
+            disk_cache_dir = self.get_disk_cache_dir()
+            if disk_cache_dir.exists():
+                for cache_file in disk_cache_dir.glob("*.json"):
+                    cache_file.unlink(missing_ok=True)
+
+    def _get_disk_cache_file(self):
+        if not self._disk_key:
+            account_id = get_client("sts").get_caller_identity()["Account"]
+            region = get_region_name() or "us-east-1"
+            self._disk_key = f"{account_id}-{region}"
+        return self.get_disk_cache_dir().joinpath(f"{self._disk_key}.json")
+
+    def _load_disk_cache(self):
+        try:
+            return json.loads(self._get_disk_cache_file().read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _read_from_disk(self, field: str):
+        ttl = self.get_ttl()
+        if ttl <= 0:
+            return None
+        record = self._load_disk_cache().get(field)
+        if record and time.time() - record["CachedAt"] < ttl:
+            return record["Value"]
+        return None
+
+    def _write_to_disk(self, field: str, value):
+        if self.get_ttl() <= 0:
+            return
+        cache_file = self._get_disk_cache_file()
+        records = self._load_disk_cache()
+        records[field] = {"Value": value, "CachedAt": time.time()}
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so concurrent CLI calls never read a half written file.
+        temp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        temp_file.write_text(json.dumps(records))
+        os.replace(temp_file, cache_file)
+
+
+management_bucket_cache = ManagementBucketCache()
+
+
+# The number of parsed templates TemplateCache keeps in memory.
+PARSED_TEMPLATE_MEMO_SIZE = 16
+
+
+class TemplateCache:
+    """
+    Synopsis:
+        A local, content-addressed cache of template bodies downloaded from the management bucket.
+        Bodies are stored once per SHA-256 under <cache dir>/templates/objects and an index maps each bucket key
+        (i.e template name and version) to its body, ETag, size and last use.
+        Cached bodies are revalidated with a conditional GET (If-None-Match) unless the template is immutable,
+        in which case a hit makes no network call at all.
+        The cache holds at most max_size bytes (BETTERCF_TEMPLATE_CACHE_MAX_BYTES, default 100MB), evicting the least recently used templates first.
+    """
+
+    def __init__(self, cache_dir: Path = None, max_size: int = None):
+        self._cache_dir = cache_dir
+        self.max_size = max_size or int(
+            os.environ.get("BETTERCF_TEMPLATE_CACHE_MAX_BYTES", 100 * 1024 * 1024)
+        )
+        self._lock = threading.Lock()
+        self._parsed = {}
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir or get_cache_dir().joinpath("templates")
+
+    @property
+    def index_file(self):
+        return self.cache_dir.joinpath("index.json")
+
+    def get_object_file(self, sha256: str):
+        return self.cache_dir.joinpath("objects", sha256)
+
+    def get(self, s3_client, bucket: str, key: str, immutable: bool = False):
+        """
+        Synopsis: Returns the body (bytes) of s3://bucket/key, from the cache when it is still valid.
+        """
+        cache_key = f"{bucket}/{key}"
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(cache_key)
+            body = self._read_object(entry)
+
+        if body is not None and immutable:
+            self._touch(cache_key, entry)
+            return body
+
+        get_object_kwargs = {"Bucket": bucket, "Key": key}
+        if body is not None:
+            get_object_kwargs["IfNoneMatch"] = entry["ETag"]
+        try:
+            response = s3_client.get_object(**get_object_kwargs)
+        except s3_client.exceptions.ClientError as e:
+            if body is not None and e.response["Error"]["Code"] in [
+                "304",
+                "NotModified",
+            ]:
+                self._touch(cache_key, entry)
+                return body
+            raise
+
+        body = response["Body"].read()
+        self._store(cache_key, body, response["ETag"])
+        return body
+
+    def get_parsed(self, s3_client, bucket: str, key: str, immutable: bool = False):
+        """
+        Synopsis: Returns the parsed JSON body of s3://bucket/key (see get).
+        Parsed templates are memoized in-process by content hash, so stacks deploying the same template share one parsed copy.
+        The returned dict is shared and must not be modified.
+        """
+        body = self.get(s3_client, bucket, key, immutable)
+        sha256 = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            parsed = self._parsed.pop(sha256, None)
+            if parsed is None:
+                parsed = json.loads(body.decode("utf-8"))
+            # Re-inserting keeps the dict in least to most recently used order.
+            self._parsed[sha256] = parsed
+            while len(self._parsed) > PARSED_TEMPLATE_MEMO_SIZE:
+                del self._parsed[next(iter(self._parsed))]
+        return parsed
+
+    def clear(self):
+        with self._lock:
+            self._parsed.clear()
+            for object_file in self.cache_dir.glob("objects/*"):
+                object_file.unlink(missing_ok=True)
+            self.index_file.unlink(missing_ok=True)
+
+    def _load_index(self):
+        try:
+            return json.loads(self.index_file.read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_index(self, index: dict):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        temp_file = self.index_file.with_suffix(f".{os.getpid()}.tmp")
+        temp_file.write_text(json.dumps(index))
+        os.replace(temp_file, self.index_file)
+
+    def _read_object(self, entry: dict):
+        if not entry:
+            return None
+        try:
+            return self.get_object_file(entry["Sha256"]).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def _touch(self, cache_key: str, entry: dict):
+        with self._lock:
+            index = self._load_index()
+            index[cache_key] = {**entry, "LastUsed": time.time()}
+            self._save_index(index)
+
+    def _store(self, cache_key: str, body: bytes, etag: str):
+        sha256 = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            object_file = self.get_object_file(sha256)
+            if not object_file.exists():
+                object_file.parent.mkdir(parents=True, exist_ok=True)
+                temp_file = object_file.with_suffix(f".{os.getpid()}.tmp")
+                temp_file.write_bytes(body)
+                os.replace(temp_file, object_file)
+            index = self._load_index()
+            index[cache_key] = {
+                "Sha256": sha256,
+                "ETag": etag,
+                "Size": len(body),
+                "LastUsed": time.time(),
+            }
+            self._evict(index)
+            self._save_index(index)
+
+    def _evict(self, index: dict):
+        # Bodies are shared between keys with identical content so only count (and delete) each body once.
+        sizes = {entry["Sha256"]: entry["Size"] for entry in index.values()}
+        total_size = sum(sizes.values())
+        for cache_key, entry in sorted(
+            index.items(), key=lambda item: item[1]["LastUsed"]
+        ):
+            if total_size <= self.max_size:
+                break
+            del index[cache_key]
+            if all(other["Sha256"] != entry["Sha256"] for other in index.values()):
+                self.get_object_file(entry["Sha256"]).unlink(missing_ok=True)
+                total_size -= entry["Size"]
+
+
+template_cache = TemplateCache()
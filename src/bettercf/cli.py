@@ -1,16 +1,14 @@
 import argparse
-import json
+import sys
 from pathlib import Path
 
-from dfm.file_types import JsonFileType
+from bettercf.cli_version import __version__
+from bettercf.template_index import DEDUPE_MODES
 
-from bettercf.initialisation import BetterCfInstance
-from bettercf.stack import Stack
-from bettercf.template import Template
-from bettercf.version import Version
+# Everything else is imported by the command that needs it, so that e.g "--help" doesn't pay for importing boto3.
 
 
-def main():
+def build_parser():
 
     # create the top-level parser
     parser = argparse.ArgumentParser(description="#TODO")
@@ -18,7 +16,7 @@ def main():
         "--version",
         help="Reveal CLI version.",
         action="version",
-        version="%(prog)s {version}".format(version="TODO"),
+        version="%(prog)s {version}".format(version=__version__),
     )
 
     # create sub-parser
@@ -48,6 +46,33 @@ def main():
         action="store_true",
         help='Will attempt to empty S3 buckets before teardown. Note this will still fail if BetterCF was initialized in "compliance" or "governance" mode. You must delete all S3 objects manually.',
     )
+    parser_teardown.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only count the object versions --force would delete from the management bucket. Nothing is deleted.",
+    )
+    parser_teardown.add_argument(
+        "--max-parallel",
+        "-p",
+        type=int,
+        help="maximum number of delete requests (of up to 1000 object versions each) at the same time. Defaults to 8.",
+    )
+
+    # create the parser for the "cache" sub-command
+    parser_cache = sub_parsers.add_parser(
+        "cache", help="subcommand for managing BetterCF's local caches."
+    )
+
+    # create sub-parser for sub-command cache
+    cache_sub_parsers = parser_cache.add_subparsers(
+        dest="secondary_subparser_name", help="sub-sub-command help"
+    )
+
+    # create sub-command "clear" for sub-command cache
+    cache_sub_parsers.add_parser(
+        "clear",
+        help="forget the cached management bucket details and downloaded templates.",
+    )
 
     # create the parser for the "template" sub-command
     parser_template = sub_parsers.add_parser(
@@ -70,8 +95,15 @@ def main():
         "build",
         help="(optional step if using DFM) build template from directory files.",
     )
-    parser_def_build.add_argument(
-        "--name", "-n", required=True, help="name of the template"
+    build_names_group = parser_def_build.add_mutually_exclusive_group(required=True)
+    build_names_group.add_argument(
+        "--name", "-n", nargs="+", help="name(s) of the template(s) to build."
+    )
+    build_names_group.add_argument(
+        "--all",
+        "-a",
+        action="store_true",
+        help="build every template found under the dfm root path.",
     )
     parser_def_build.add_argument(
         "--dfm-config-path",
@@ -85,20 +117,48 @@ def main():
         required=True,
         help="complete local path to the root path the dfm merge should start from.",
     )
+    parser_def_build.add_argument(
+        "--incremental",
+        "-i",
+        action="store_true",
+        help="only re-read changed fragments, and skip the build if nothing changed since the last incremental build.",
+    )
+    parser_def_build.add_argument(
+        "--watch",
+        "-w",
+        action="store_true",
+        help="keep running, incrementally rebuilding the template whenever its source files change.",
+    )
+    parser_def_build.add_argument(
+        "--max-parallel",
+        "-p",
+        type=int,
+        default=None,
+        help="maximum number of templates to build at the same time when building several. Defaults to the number of CPUs.",
+    )
     # parser_def_build.add_argument('--auto-push', '-p', action='store_true', help='Will automatically push your built template to your BetterCF management bucket.')
 
     # create sub-command "push" for sub-command cool
     parser_def_push = template_sub_parsers.add_parser(
         "push", help="push CloudFormation template to the BetterCF management bucket."
     )
-    parser_def_push.add_argument(
-        "--name", "-n", required=True, help="name of the template"
+    push_names_group = parser_def_push.add_mutually_exclusive_group(required=True)
+    push_names_group.add_argument(
+        "--name",
+        "-n",
+        nargs="+",
+        help="names of the templates. The nth name is pushed from the nth --template-path.",
+    )
+    push_names_group.add_argument(
+        "--manifest",
+        "-m",
+        help='JSON file listing the templates to push, as [{"Name": ..., "TemplatePath": ..., "Version": ...}]. Version is optional.',
     )
     parser_def_push.add_argument(
         "--template-path",
         "-t",
-        required=True,
-        help="complete local path to the CloudFormation template to push.",
+        nargs="+",
+        help="complete local paths to the CloudFormation templates to push, one for each --name.",
     )
     parser_def_push.add_argument(
         "--template-version",
@@ -106,6 +166,46 @@ def main():
         default=False,
         help='The version tag that this template should be pushed with. E.g "1.0.0".',
     )
+    parser_def_push.add_argument(
+        "--max-parallel",
+        "-p",
+        type=int,
+        default=8,
+        help="maximum number of templates to upload at the same time.",
+    )
+    parser_def_push.add_argument(
+        "--package",
+        action="store_true",
+        help="zip the local Lambda code and nested templates the template refers to, upload them to the BetterCF management bucket and point the template at them.",
+    )
+    parser_def_push.add_argument(
+        "--dedupe",
+        "-d",
+        choices=DEDUPE_MODES,
+        default="off",
+        help="if an identical template was already pushed under another version: upload it anyway (off), push the new version as a server-side copy of it (alias) or don't push the new version (skip).",
+    )
+    parser_def_push.add_argument(
+        "--no-overwrite",
+        action="store_true",
+        help="fail instead of overwriting a version that has already been pushed.",
+    )
+
+    parser_def_list_versions = template_sub_parsers.add_parser(
+        "list-versions",
+        help="list the pushed versions of a template in the BetterCF management bucket.",
+    )
+    parser_def_list_versions.add_argument(
+        "--name", "-n", required=True, help="name of the template"
+    )
+
+    parser_def_reindex = template_sub_parsers.add_parser(
+        "reindex",
+        help="regenerate a template's version index from the objects in the BetterCF management bucket.",
+    )
+    parser_def_reindex.add_argument(
+        "--name", "-n", required=True, help="name of the template"
+    )
 
     # create sub-parser for sub-command stack
     stack_sub_parsers = parser_stack.add_subparsers(
@@ -121,29 +221,206 @@ def main():
         "--stack-config-path",
         "-c",
         required=True,
-        help="complete path to the stack config file.",
+        help="complete path to a stack config file, a directory of stack config files or a glob pattern matching stack config files.",
+    )
+    parser_stack_deploy.add_argument(
+        "--max-parallel",
+        "-p",
+        type=int,
+        default=1,
+        help="maximum number of stacks to deploy at the same time.",
+    )
+    parser_stack_deploy.add_argument(
+        "--force",
+        "-f",
+        action="store_true",
+        help="update stacks even when their template, parameters, role and capabilities are unchanged since the last deploy.",
+    )
+    parser_stack_deploy.add_argument(
+        "--regions",
+        "-r",
+        nargs="+",
+        help="deploy each stack config to these regions (concurrently, up to --max-parallel stacks at a time) instead of the regions in the config.",
+    )
+
+    parser_stack_delete = stack_sub_parsers.add_parser(
+        "delete",
+        help="delete the stacks deployed from stack config files, dependents first.",
+    )
+    parser_stack_delete.add_argument(
+        "--stack-config-path",
+        "-c",
+        required=True,
+        help="complete path to a stack config file, a directory of stack config files or a glob pattern matching stack config files.",
+    )
+    parser_stack_delete.add_argument(
+        "--max-parallel",
+        "-p",
+        type=int,
+        default=1,
+        help="maximum number of stacks to delete at the same time.",
+    )
+    parser_stack_delete.add_argument(
+        "--regions",
+        "-r",
+        nargs="+",
+        help="delete each stack config's stacks from these regions instead of the regions in the config.",
     )
 
-    args = parser.parse_args()
+    parser_stack_validate = stack_sub_parsers.add_parser(
+        "validate",
+        help="validate stack config files offline, without any AWS calls, reporting every error in every file.",
+    )
+    parser_stack_validate.add_argument(
+        "--stack-config-path",
+        "-c",
+        required=True,
+        nargs="+",
+        help="complete paths to stack config files, directories of stack config files or glob patterns matching stack config files.",
+    )
+    parser_stack_validate.add_argument(
+        "--output",
+        "-o",
+        choices=["text", "json"],
+        default="text",
+        help="report format. json prints a single document for tooling such as CI checks.",
+    )
+    parser_stack_validate.add_argument(
+        "--max-parallel",
+        "-p",
+        type=int,
+        help="maximum number of processes validating configs. Defaults to the number of CPUs.",
+    )
+
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
     if args.main_subparser_name == "init":
+        from bettercf.initialisation import BetterCfInstance
+
         cf = BetterCfInstance()
         cf.initialise(args.mode.upper())
     elif args.main_subparser_name == "teardown":
+        from bettercf.initialisation import BetterCfInstance
+
         cf = BetterCfInstance()
-        cf.teardown(args.force)
+        cf.teardown(args.force, dry_run=args.dry_run, max_parallel=args.max_parallel)
+    elif args.main_subparser_name == "cache":
+        if args.secondary_subparser_name == "clear":
+            from bettercf.cache import template_cache
+            from bettercf.utils import invalidate_management_bucket_cache
+
+            invalidate_management_bucket_cache()
+            template_cache.clear()
+        else:
+            raise Exception(
+                f"CLI command ({args.main_subparser_name} {args.secondary_subparser_name}) is not recognized."
+            )
     elif args.main_subparser_name == "template":
         if args.secondary_subparser_name == "build":
+            if args.watch and (args.all or len(args.name) > 1):
+                raise Exception("Only a single template can be built with --watch.")
+            if args.all or len(args.name) > 1:
+                from bettercf.build import (
+                    build_templates,
+                    discover_template_names,
+                    summarise_build_results,
+                )
+
+                template_names = args.name or discover_template_names(
+                    Path(args.dfm_config_path), Path(args.dfm_root_path)
+                )
+                results = build_templates(
+                    template_names,
+                    Path(args.dfm_config_path),
+                    Path(args.dfm_root_path),
+                    incremental=args.incremental,
+                    max_parallel=args.max_parallel,
+                )
+                sys.exit(summarise_build_results(results))
+            from bettercf.template import Template
+
             template = Template(
-                args.name, Path(args.dfm_config_path), Path(args.dfm_root_path)
+                args.name[0], Path(args.dfm_config_path), Path(args.dfm_root_path)
             )
-            template.build()
+            if args.watch:
+                template.watch()
+            else:
+                template.build(incremental=args.incremental)
         elif args.secondary_subparser_name == "push":
+            import json
+
+            from dfm.file_types import JsonFileType
+
+            from bettercf.template import Template
+            from bettercf.version import Version
+
+            if args.manifest and args.template_path:
+                raise Exception(
+                    "template push takes --template-path with --name, not --manifest."
+                )
+            if args.name and len(args.name) != len(args.template_path or []):
+                raise Exception(
+                    "template push needs one --template-path for each --name."
+                )
+            if args.manifest or len(args.name) > 1:
+                import time
+
+                from bettercf.batch import (
+                    load_push_manifest,
+                    push_templates,
+                    summarise_push_results,
+                )
+
+                if args.manifest:
+                    templates = load_push_manifest(Path(args.manifest))
+                else:
+                    templates = [
+                        {
+                            "Name": name,
+                            "TemplatePath": template_path,
+                            "Version": args.template_version or None,
+                        }
+                        for name, template_path in zip(args.name, args.template_path)
+                    ]
+                start = time.monotonic()
+                results = push_templates(
+                    templates,
+                    max_parallel=args.max_parallel,
+                    dedupe=args.dedupe,
+                    package=args.package,
+                    overwrite=not args.no_overwrite,
+                )
+                sys.exit(summarise_push_results(results, time.monotonic() - start))
+            template = JsonFileType.load_from_file(args.template_path[0])
+            if args.package:
+                from bettercf.package import package_template
+
+                template = package_template(
+                    template, Path(args.template_path[0]).parent
+                )
             Template.push_mechanism(
-                name=args.name,
+                name=args.name[0],
                 version=Version(args.template_version),
-                template_str=json.dumps(
-                    JsonFileType.load_from_file(args.template_path)
-                ).encode("utf-8"),
+                template_str=json.dumps(template).encode("utf-8"),
+                dedupe=args.dedupe,
+                overwrite=not args.no_overwrite,
+            )
+        elif args.secondary_subparser_name == "list-versions":
+            from bettercf.template import Template
+
+            for entry in Template.list_versions(args.name):
+                print(
+                    f"{entry['Version']}\t{entry['Size']}\t{entry.get('PushedAt') or ''}"
+                )
+        elif args.secondary_subparser_name == "reindex":
+            from bettercf.template import Template
+
+            index = Template.reindex(args.name)
+            print(
+                f"Indexed {len(index.versions)} version(s) of template '{args.name}'."
             )
         else:
             raise Exception(
@@ -151,8 +428,42 @@ def main():
             )
     elif args.main_subparser_name == "stack":
         if args.secondary_subparser_name == "deploy":
-            cfg = Stack.load_stack_config_from_file(Path(args.stack_config_path))
-            cfg.deploy()
+            from bettercf.batch import deploy_stacks, summarise_results
+            from bettercf.paths import resolve_stack_config_paths
+
+            results = deploy_stacks(
+                resolve_stack_config_paths(args.stack_config_path),
+                max_parallel=args.max_parallel,
+                force=args.force,
+                regions=args.regions,
+            )
+            sys.exit(summarise_results(results))
+        elif args.secondary_subparser_name == "delete":
+            from bettercf.batch import delete_stacks, summarise_results
+            from bettercf.paths import resolve_stack_config_paths
+
+            results = delete_stacks(
+                resolve_stack_config_paths(args.stack_config_path),
+                max_parallel=args.max_parallel,
+                regions=args.regions,
+            )
+            sys.exit(summarise_results(results))
+        elif args.secondary_subparser_name == "validate":
+            from bettercf.paths import resolve_stack_config_paths
+            from bettercf.validation import (
+                summarise_validation_results,
+                validate_stack_configs,
+            )
+
+            config_paths = [
+                config_path
+                for path_pattern in args.stack_config_path
+                for config_path in resolve_stack_config_paths(path_pattern)
+            ]
+            results = validate_stack_configs(
+                config_paths, max_parallel=args.max_parallel
+            )
+            sys.exit(summarise_validation_results(results, args.output))
         else:
             raise Exception(
                 f"CLI command ({args.main_subparser_name} {args.secondary_subparser_name}) is not recognized."
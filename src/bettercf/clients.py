@@ -0,0 +1,129 @@
+import os
+import threading
+
+
+class ClientRegistry:
+    """
+    Synopsis:
+        Creates and shares boto3 clients so that every module (and every thread) reuses the same HTTP connection pools
+        instead of paying for new endpoints, TLS handshakes and credential resolution on each call.
+        Clients are keyed by service, region and the access key of the resolved credentials. boto3 clients are thread safe
+        once created, so only their creation is serialised.
+
+    Parameters:
+    - max_pool_connections : connections kept open per client. Defaults to BETTERCF_MAX_POOL_CONNECTIONS, else 50.
+    - retry_mode : "legacy", "standard" or "adaptive". Defaults to BETTERCF_RETRY_MODE, else "standard".
+    - max_attempts : attempts per request, including the first. Defaults to BETTERCF_MAX_ATTEMPTS, else 5.
+    - connect_timeout : in seconds. Defaults to BETTERCF_CONNECT_TIMEOUT, else 10.
+    - read_timeout : in seconds. Defaults to BETTERCF_READ_TIMEOUT, else 60.
+    """
+
+    def __init__(
+        self,
+        max_pool_connections: int = None,
+        retry_mode: str = None,
+        max_attempts: int = None,
+        connect_timeout: float = None,
+        read_timeout: float = None,
+    ):
+        self.max_pool_connections = max_pool_connections or int(
+            os.environ.get("BETTERCF_MAX_POOL_CONNECTIONS", 50)
+        )
+        self.retry_mode = retry_mode or os.environ.get(
+            "BETTERCF_RETRY_MODE", "standard"
+        )
+        self.max_attempts = max_attempts or int(
+            os.environ.get("BETTERCF_MAX_ATTEMPTS", 5)
+        )
+        self.connect_timeout = connect_timeout or float(
+            os.environ.get("BETTERCF_CONNECT_TIMEOUT", 10)
+        )
+        self.read_timeout = read_timeout or float(
+            os.environ.get("BETTERCF_READ_TIMEOUT", 60)
+        )
+        self._lock = threading.Lock()
+        self._session = None
+        self._clients = {}
+
+    @property
+    def config(self):
+        from botocore.config import Config
+
+        return Config(
+            max_pool_connections=self.max_pool_connections,
+            retries={"mode": self.retry_mode, "max_attempts": self.max_attempts},
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+        )
+
+    def _get_session(self):
+        if self._session is None:
+            # Imported here as importing boto3 takes longer than most BetterCF commands that don't need it.
+            import boto3
+
+            self._session = boto3.session.Session()
+        return self._session
+
+    def get_region_name(self):
+        with self._lock:
+            return self._get_session().region_name
+
+    def _get(self, kind: str, service: str, region_name: str = None):
+        with self._lock:
+            session = self._get_session()
+            region_name = region_name or session.region_name
+            credentials = session.get_credentials()
+            access_key = credentials.access_key if credentials else None
+            key = (kind, service, region_name, access_key)
+            if key not in self._clients:
+                factory = session.client if kind == "client" else session.resource
+                self._clients[key] = factory(
+                    service, region_name=region_name, config=self.config
+                )
+            return self._clients[key]
+
+    def get_client(self, service: str, region_name: str = None):
+        return self._get("client", service, region_name)
+
+    def get_resource(self, service: str, region_name: str = None):
+        return self._get("resource", service, region_name)
+
+    def reset(self):
+        """
+        Synopsis: Drops every shared client and the session, so the next client is built from fresh credentials and config.
+        """
+        with self._lock:
+            self._session = None
+            self._clients = {}
+
+
+client_registry = ClientRegistry()
+
+
+def get_client(service: str, region_name: str = None):
+    """
+    Synopsis: Returns the shared boto3 client for service in region_name (defaults to the session's region).
+    """
+    return client_registry.get_client(service, region_name)
+
+
+def get_resource(service: str, region_name: str = None):
+    """
+    Synopsis: Returns the shared boto3 resource for service in region_name (defaults to the session's region).
+    """
+    return client_registry.get_resource(service, region_name)
+
+
+def get_region_name():
+    """
+    Synopsis: Returns the region the shared session resolves to when no region is given.
+    """
+    return client_registry.get_region_name()
+
+
+def configure_clients(**kwargs):
+    """
+    Synopsis: Replaces the shared client registry with one using the given ClientRegistry parameters.
+    """
+    global client_registry
+    client_registry = ClientRegistry(**kwargs)
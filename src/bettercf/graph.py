@@ -0,0 +1,129 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+_END = object()
+
+
+class DependencyGraph:
+    """
+    Synopsis: A directed acyclic graph of nodes (any hashable value) and the nodes each one depends on.
+    Nodes keep the order they were added in, so scheduling is deterministic.
+    """
+
+    def __init__(self):
+        self.dependencies = {}
+
+    def add(self, node, dependencies: list = ()):
+        self.dependencies.setdefault(node, [])
+        for dependency in dependencies:
+            if dependency not in self.dependencies[node]:
+                self.dependencies[node].append(dependency)
+
+    def dependents(self):
+        """
+        Synopsis: Returns a dict of every node to the nodes that depend on it.
+        """
+        dependents = {node: [] for node in self.dependencies}
+        for node, dependencies in self.dependencies.items():
+            for dependency in dependencies:
+                dependents[dependency].append(node)
+        return dependents
+
+    def reversed(self):
+        """
+        Synopsis: Returns the graph with every dependency reversed, e.g to tear down dependents before what they depend on.
+        """
+        reversed_graph = DependencyGraph()
+        for node, dependents in self.dependents().items():
+            reversed_graph.add(node, dependents)
+        return reversed_graph
+
+    def find_cycle(self):
+        """
+        Returns:
+        The nodes of a cycle, starting and ending with the same node, or None if the graph is acyclic.
+        """
+        finished = set()
+        for start in self.dependencies:
+            if start in finished:
+                continue
+            # An iterative depth first search, so deep graphs can't exceed the recursion limit.
+            path = [start]
+            on_path = {start}
+            stack = [iter(self.dependencies[start])]
+            while stack:
+                dependency = next(stack[-1], _END)
+                if dependency is _END:
+                    stack.pop()
+                    node = path.pop()
+                    on_path.discard(node)
+                    finished.add(node)
+                    continue
+                if dependency not in self.dependencies:
+                    raise Exception(
+                        f"{path[-1]} depends on {dependency}, which isn't in the graph."
+                    )
+                if dependency in on_path:
+                    return path[path.index(dependency) :] + [dependency]
+                if dependency not in finished:
+                    path.append(dependency)
+                    on_path.add(dependency)
+                    stack.append(iter(self.dependencies[dependency]))
+        return None
+
+    def check_acyclic(self):
+        cycle = self.find_cycle()
+        if cycle:
+            raise Exception(
+                f"Dependencies form a cycle: {' -> '.join(str(node) for node in cycle)}."
+            )
+
+
+def run_in_dependency_order(graph: DependencyGraph, run, skip, max_parallel: int = 1):
+    """
+    Synopsis: Runs every node of the graph on a bounded worker pool, each as soon as everything it depends on has succeeded,
+    so the whole run is bound by the graph's critical path rather than by its number of nodes.
+    A node that anything it depends on (directly or not) failed for is not run.
+
+    Parameters:
+    - graph : the nodes to run. Raises an exception, before running anything, if its dependencies form a cycle.
+    - run : called with a node, and returns its result. Results have a succeeded property.
+    - skip : called with a node and the failed node that stopped it from running, and returns its result.
+    - max_parallel : the maximum number of nodes running at the same time.
+
+    Returns:
+    A generator of results, in the order the nodes finished.
+    """
+    graph.check_acyclic()
+    dependents = graph.dependents()
+    waiting_on = {
+        node: len(dependencies) for node, dependencies in graph.dependencies.items()
+    }
+    ready = [node for node, count in waiting_on.items() if count == 0]
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        running = {}
+        while ready or running:
+            for node in ready:
+                running[executor.submit(run, node)] = node
+            ready = []
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                result = future.result()
+                yield result
+                if result.succeeded:
+                    for dependent in dependents[node]:
+                        if waiting_on[dependent] is None:
+                            continue
+                        waiting_on[dependent] -= 1
+                        if waiting_on[dependent] == 0:
+                            ready.append(dependent)
+                    continue
+                # Skip everything downstream. A skipped node's count never reaches 0, so it is never run.
+                to_skip = list(dependents[node])
+                while to_skip:
+                    dependent = to_skip.pop(0)
+                    if waiting_on[dependent] is None:
+                        continue
+                    waiting_on[dependent] = None
+                    yield skip(dependent, node)
+                    to_skip.extend(dependents[dependent])
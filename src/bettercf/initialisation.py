@@ -1,9 +1,14 @@
 from pathlib import Path
 
-import boto3
 from dfm.config import BuildConfig
 
-from bettercf.utils import cfn_create_or_update, cfn_delete_stack, get_management_bucket_name
+from bettercf.purge import purge_bucket
+from bettercf.utils import (
+    cfn_create_or_update,
+    cfn_delete_stack,
+    get_management_bucket_name,
+    invalidate_management_bucket_cache,
+)
 
 
 class BetterCfInstance:
@@ -44,13 +49,32 @@ class BetterCfInstance:
         }
 
         cfn_create_or_update(STACK_NAME, boto3_kwargs)
+        # The management bucket may have been (re)created so any cached bucket metadata is stale.
+        invalidate_management_bucket_cache()
 
-    def teardown(self, empty_bucket_first: bool = False):
+    def teardown(
+        self,
+        empty_bucket_first: bool = False,
+        dry_run: bool = False,
+        max_parallel: int = None,
+    ):
+        """
+        Synopsis:
+            Deletes the management stack. With empty_bucket_first, every object version in the management bucket is purged first
+            (see purge_bucket), as a bucket must be empty to be deleted. A dry run only reports what would be purged.
+        """
         BUCKET_NAME = get_management_bucket_name()
         STACK_NAME = "BetterCF-management"
+        if dry_run:
+            purge_bucket(BUCKET_NAME, dry_run=True, max_parallel=max_parallel)
+            return
         if empty_bucket_first:
-            s3 = boto3.resource("s3")
-            bucket = s3.Bucket(BUCKET_NAME)
-            bucket.object_versions.delete()  # Note this will fail for governance mode buckets
+            # Note objects can't be deleted from compliance (or, without bypassing it, governance) mode buckets.
+            result = purge_bucket(BUCKET_NAME, max_parallel=max_parallel)
+            if not result.succeeded:
+                raise Exception(
+                    f"Could not empty bucket {BUCKET_NAME}: {len(result.errors)} object version(s) could not be deleted. The stack was not deleted."
+                )
         cfn_delete_stack(STACK_NAME)
+        invalidate_management_bucket_cache()
         return
@@ -1,4 +1,186 @@
-def override_resources(resources:dict, overrides):
+from typing import NamedTuple
+
+INSERT = ">>"
+DELETE = "<<"
+MERGE = "^^"
+OPERATIONS = {INSERT, DELETE, MERGE}
+
+
+class OverrideOperation(NamedTuple):
+    """
+    Synopsis: A single insert/delete/merge of `key` in the dict found by following `path` (a tuple of keys) from the root of the resources.
+    """
+
+    path: tuple
+    op: str
+    key: str
+    value: object = None
+
+
+class OverridePlan:
+    """
+    Synopsis: A ResourceOverrides dict compiled into a flat list of operations, in the order override_resources has always applied them.
+    A plan holds no state about the resources it is applied to, so can be compiled once and applied to any number of templates.
+    """
+
+    def __init__(self, steps: list = None):
+        # Each step is (path, [(op, key, value, needs_copy), ...]): consecutive operations on the same path are grouped so apply() only walks to each dict once.
+        self.steps = steps or []
+
+    @property
+    def operations(self):
+        return [
+            OverrideOperation(path, op, key, value)
+            for path, operations in self.steps
+            for op, key, value, _ in operations
+        ]
+
+    def __len__(self):
+        return sum(len(operations) for _, operations in self.steps)
+
+    def apply(self, resources):
+        """
+        Synopsis: Applies every operation to resources (in place) and returns it.
+        Operations under a key that does not exist in resources are skipped.
+        Inserted/merged values are shared with the plan (like override_resources always shared them with the overrides dict),
+        except where a later operation of the plan would modify them.
+        """
+        for path, operations in self.steps:
+            node = resources
+            for key in path:
+                if key not in node:
+                    break
+                node = node[key]
+            else:
+                for op, key, value, needs_copy in operations:
+                    _apply_operation(
+                        node, op, key, _copy_value(value) if needs_copy else value
+                    )
+        return resources
+
+    def render(self, template):
+        """
+        Synopsis: Returns a new dict with every operation applied, leaving template untouched (copy-on-write).
+        Only the dicts/lists on the path to an operation are copied, so time and memory are proportional to the overrides rather than the template.
+        Every untouched subtree is shared with template (and inserted values with the plan), so the result should be treated as read-only.
+        """
+        # The containers created by this render, by id. Only these can be modified in place.
+        fresh = {}
+        result = _shallow_copy(template)
+        fresh[id(result)] = result
+        for path, operations in self.steps:
+            node = result
+            for key in path:
+                if key not in node:
+                    break
+                child = node[key]
+                if id(child) not in fresh and type(child) in [dict, list]:
+                    child = _shallow_copy(child)
+                    fresh[id(child)] = child
+                    node[key] = child
+                node = child
+            else:
+                for op, key, value, _ in operations:
+                    _apply_operation(node, op, key, value)
+                    # A merge always creates a new dict/list.
+                    if op == MERGE:
+                        fresh[id(node[key])] = node[key]
+        return result
+
+
+def _apply_operation(node, op: str, key: str, value):
+    if op == INSERT:
+        node[key] = value
+    elif op == DELETE:
+        if key not in node:
+            raise Exception(
+                f"Trying to delete key: {key} but it is not found in resources."
+            )
+        del node[key]
+    elif type(value) == dict:
+        node[key] = {**node[key], **value}
+    else:
+        node[key] = node[key] + value
+
+
+def compile_overrides(overrides):
+    """
+    Synopsis: Compiles a ResourceOverrides dict (or list of them) into an OverridePlan. See override_resources for the override syntax.
+    Merge (^^) values are validated here, so an invalid override fails before any of it is applied.
+    """
+    steps = []
+    _compile_overrides(overrides, (), steps)
+
+    # An inserted/merged dict or list must be copied on every apply if a later operation is nested inside it, otherwise applying the plan would modify the plan itself.
+    later_paths = set()
+    for path, operations in reversed(steps):
+        if later_paths:
+            for index, (op, key, value, _) in enumerate(operations):
+                if type(value) in [dict, list] and path + (key,) in later_paths:
+                    operations[index] = (op, key, value, True)
+
+        # If a prefix is already recorded, so are all the shorter ones.
+        for length in range(len(path), 0, -1):
+            prefix = path[:length]
+            if prefix in later_paths:
+                break
+            later_paths.add(prefix)
+    return OverridePlan(steps)
+
+
+def _compile_overrides(overrides, path: tuple, steps: list):
+    if type(overrides) == dict:
+        operations = None
+        for resource_key, resource_obj in overrides.items():
+            op = resource_key[:2]
+            if op in OPERATIONS:
+                if op == MERGE and type(resource_obj) not in [dict, list]:
+                    raise Exception(
+                        f"Trying to merge a non list/dict ({type(resource_obj)}"
+                    )
+                if operations is None:
+                    operations = []
+                    steps.append((path, operations))
+                operations.append(
+                    (op, resource_key.replace(op, ""), resource_obj, False)
+                )
+
+            # The key did not require any operations. The operations nested under it apply to the value at this key.
+            else:
+                _compile_overrides(resource_obj, path + (resource_key,), steps)
+                # Any later operations at this path must run after the nested ones, so start a new step.
+                operations = None
+
+    elif type(overrides) == list:
+        for override in overrides:
+            _compile_overrides(override, path, steps)
+
+
+def _shallow_copy(value):
+    return dict(value) if type(value) == dict else list(value)
+
+
+def _copy_value(value):
+    if type(value) == dict:
+        return {
+            key: (
+                _copy_value(nested_value)
+                if type(nested_value) in [dict, list]
+                else nested_value
+            )
+            for key, nested_value in value.items()
+        }
+    return [
+        (
+            _copy_value(nested_value)
+            if type(nested_value) in [dict, list]
+            else nested_value
+        )
+        for nested_value in value
+    ]
+
+
+def override_resources(resources: dict, overrides):
     """
     Synopsis: Overrides keys/values in a CloudFormation resource dictionary.
     It is possible to:
@@ -74,17 +256,17 @@ def override_resources(resources:dict, overrides):
 
     ...
 
-    "LoaderPiiTokenEmisLambdaFunction": {	
+    "LoaderPiiTokenEmisLambdaFunction": {
             ...
-                "Environment": {	
-                    "Variables": {	
+                "Environment": {
+                    "Variables": {
                         ...
-                        "DATABASE_HOST": {	
-                            "Fn::GetAtt": [	
-                                "RdsDbInstance",	
-                                "Endpoint.Address"	
-                            ]	
-                        }	
+                        "DATABASE_HOST": {
+                            "Fn::GetAtt": [
+                                "RdsDbInstance",
+                                "Endpoint.Address"
+                            ]
+                        }
                     }
 
     ...
@@ -92,57 +274,27 @@ def override_resources(resources:dict, overrides):
     Returns:
     The new resources dict including overrides.
     """
-    if type(overrides) == dict:
-        for resource_key, resource_obj in overrides.items():
+    return compile_overrides(overrides).apply(resources)
 
-            # A key is found that needs to be added/replaced.
-            if resource_key.startswith(">>"):
-                print(f"overwritting {resource_key}")
-                resources[resource_key.replace(">>", "")] = resource_obj
-
-            # A key is found that needs to be deleted.
-            elif resource_key.startswith("<<"):
-                if resource_key.replace("<<", "") in resources:
-                    print(f"deleting {resource_key}")
-                    del resources[resource_key.replace("<<", "")]
-                else:
-                    raise Exception(f"Trying to delete key: {resource_key.replace('<<', '')} but it is not found in resources.")
-
-            # A key is found that needs to be merged.
-            elif resource_key.startswith("^^"):
-                print(f"merging {resource_key}")
-                if type(resource_obj) == dict:
-                    resources[resource_key.replace("^^", "")] = {**resources[resource_key.replace("^^", "")], **resource_obj}
-                elif type(resource_obj) == list:
-                    resources[resource_key.replace("^^", "")] = resources[resource_key.replace("^^", "")] + resource_obj
-                else:
-                    raise Exception(f"Trying to merge a non list/dict ({type(resource_obj)}")
-
-            # The key did not require any operations. Now we rerun the function with the nested object from this key.
-            elif resource_key in resources:
-                nested_result = override_resources(resources[resource_key], resource_obj)
-
-    # ?
-    elif type(overrides) == list:
-        for override in overrides:
-            list_result = override_resources(resources, override)
-
-    return resources
 
 def count_overrides_in_dict(overrides):
-    '''
+    """
     Synposis: Returns the number of overrides found in an override dict. It has no use for now but may be handy in future
-    '''
+    """
     overrides_found = 0
     if type(overrides) == dict:
         for resource_key, resource_obj in overrides.items():
 
-            if resource_key.startswith(">>") or resource_key.startswith("<<") or resource_key.startswith("^^"):
+            if (
+                resource_key.startswith(">>")
+                or resource_key.startswith("<<")
+                or resource_key.startswith("^^")
+            ):
                 overrides_found = overrides_found + 1
-            
+
             overrides_found = overrides_found + count_overrides_in_dict(resource_obj)
 
     elif type(overrides) == list:
         for override in overrides:
-            overrides_found = overrides_found +  count_overrides_in_dict(override)
-    return overrides_found
\ No newline at end of file
+            overrides_found = overrides_found + count_overrides_in_dict(override)
+    return overrides_found
@@ -0,0 +1,267 @@
+import copy
+import hashlib
+import json
+import os
+import stat
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from bettercf.clients import get_client
+from bettercf.utils import get_management_bucket_name, get_management_bucket_url
+
+# Packaged artifacts live outside every template's prefix so they are never mistaken for template versions.
+ARTIFACTS_PREFIX = ".artifacts"
+
+# The properties that may point at a local path, by resource type, and how the uploaded artifact is referenced:
+# "s3-dict" as {"S3Bucket": ..., "S3Key": ...}, "s3-uri" as s3://bucket/key and "template-url" as the object's https URL.
+PACKAGEABLE_PROPERTIES = {
+    "AWS::Lambda::Function": [("Code", "s3-dict")],
+    "AWS::Lambda::LayerVersion": [("Content", "s3-dict")],
+    "AWS::Serverless::Function": [("CodeUri", "s3-uri")],
+    "AWS::Serverless::LayerVersion": [("ContentUri", "s3-uri")],
+    "AWS::CloudFormation::Stack": [("TemplateURL", "template-url")],
+}
+
+REMOTE_PREFIXES = ("s3://", "http://", "https://")
+
+# Files that are already archives are uploaded as they are, as Lambda and Glue can't unpack a zip inside a zip.
+ARCHIVE_EXTENSIONS = (".zip", ".jar")
+
+# Zip entries get a fixed timestamp (the earliest a zip can hold) and permissions, so unchanged code zips to identical bytes.
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class Artifact:
+    """
+    Synopsis: A packaged file waiting to be uploaded. body is an open, seekable file.
+    """
+
+    key: str
+    sha256: str
+    size: int
+    body: object
+
+
+def is_local_reference(value):
+    return type(value) == str and bool(value) and not value.startswith(REMOTE_PREFIXES)
+
+
+def zip_path(path: Path, destination):
+    """
+    Synopsis: Deterministically zips a file or (recursively) a directory into the destination file object.
+    Entries are sorted and carry a fixed timestamp, and only the executable bit of each file's permissions is kept.
+    """
+    path = Path(path)
+    if path.is_dir():
+        files = sorted(
+            (file for file in path.rglob("*") if file.is_file()),
+            key=lambda file: file.relative_to(path).as_posix(),
+        )
+        root = path
+    else:
+        files = [path]
+        root = path.parent
+    with zipfile.ZipFile(destination, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for file in files:
+            info = zipfile.ZipInfo(file.relative_to(root).as_posix(), ZIP_DATE_TIME)
+            executable = file.stat().st_mode & stat.S_IXUSR
+            info.external_attr = (0o755 if executable else 0o644) << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with open(file, "rb") as source, zip_file.open(info, "w") as target:
+                while chunk := source.read(HASH_CHUNK_SIZE):
+                    target.write(chunk)
+
+
+def hash_file(file):
+    """
+    Synopsis: Returns the SHA-256 and size of a seekable file object, leaving it at the start.
+    """
+    sha256 = hashlib.sha256()
+    file.seek(0)
+    size = 0
+    while chunk := file.read(HASH_CHUNK_SIZE):
+        sha256.update(chunk)
+        size += len(chunk)
+    file.seek(0)
+    return sha256.hexdigest(), size
+
+
+class TemplatePackager:
+    """
+    Synopsis:
+        Packages the local artifacts a template refers to (Lambda code, layers and nested templates) and uploads them,
+        content-addressed, to the management bucket at .artifacts/<sha256>.<zip|json>.
+        Directories and files are zipped deterministically, so an unchanged artifact hashes the same and is only uploaded once.
+        Files that are already archives (see ARCHIVE_EXTENSIONS) are uploaded as they are.
+        Nested templates are packaged recursively before being uploaded themselves.
+
+    Parameters:
+    - max_parallel : the maximum number of artifacts uploading at the same time. Defaults to BETTERCF_PACKAGE_MAX_PARALLEL, else 8.
+    - multipart_threshold : the size in bytes above which artifacts are uploaded in parts. Defaults to BETTERCF_MULTIPART_THRESHOLD, else 8MiB.
+    - multipart_chunksize : the size in bytes of each part. Defaults to BETTERCF_MULTIPART_CHUNKSIZE, else 8MiB.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        bucket: str,
+        bucket_url: str,
+        max_parallel: int = None,
+        multipart_threshold: int = None,
+        multipart_chunksize: int = None,
+    ):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.bucket_url = bucket_url
+        self.max_parallel = max_parallel or int(
+            os.environ.get("BETTERCF_PACKAGE_MAX_PARALLEL", 8)
+        )
+        self.multipart_threshold = multipart_threshold or int(
+            os.environ.get("BETTERCF_MULTIPART_THRESHOLD", 8 * 1024 * 1024)
+        )
+        self.multipart_chunksize = multipart_chunksize or int(
+            os.environ.get("BETTERCF_MULTIPART_CHUNKSIZE", 8 * 1024 * 1024)
+        )
+        self.artifacts = {}
+        self._packaging = []
+
+    def package(self, template: dict, base_path: Path):
+        """
+        Synopsis: Returns a copy of template with every local reference replaced by its (yet to be uploaded) artifact.
+        Relative paths are relative to base_path, normally the template's directory.
+        """
+        template = copy.deepcopy(template)
+        for logical_id, resource in (template.get("Resources") or {}).items():
+            if type(resource) != dict or type(resource.get("Properties")) != dict:
+                continue
+            properties = resource["Properties"]
+            for property_name, reference_format in PACKAGEABLE_PROPERTIES.get(
+                resource.get("Type"), []
+            ):
+                if not is_local_reference(properties.get(property_name)):
+                    continue
+                path = Path(base_path).joinpath(properties[property_name]).resolve()
+                if not path.exists():
+                    raise Exception(
+                        f"{logical_id}.{property_name} refers to local path {path}, which doesn't exist."
+                    )
+                if reference_format == "template-url":
+                    artifact = self.add_template(path)
+                else:
+                    artifact = self.add_zip(path)
+                properties[property_name] = self.reference(artifact, reference_format)
+        return template
+
+    def add_template(self, path: Path):
+        if path in self._packaging:
+            raise Exception(
+                f"Nested templates refer to each other in a cycle: {' -> '.join(str(p) for p in self._packaging + [path])}."
+            )
+        self._packaging.append(path)
+        try:
+            packaged = self.package(json.loads(path.read_bytes()), path.parent)
+        finally:
+            self._packaging.pop()
+        body = tempfile.TemporaryFile()
+        body.write(json.dumps(packaged, sort_keys=True).encode("utf-8"))
+        return self._add_artifact(body, "json")
+
+    def add_zip(self, path: Path):
+        if path.is_file() and path.suffix.lower() in ARCHIVE_EXTENSIONS:
+            return self._add_artifact(open(path, "rb"), path.suffix[1:].lower())
+        body = tempfile.TemporaryFile()
+        zip_path(path, body)
+        return self._add_artifact(body, "zip")
+
+    def _add_artifact(self, body, extension: str):
+        sha256, size = hash_file(body)
+        key = f"{ARTIFACTS_PREFIX}/{sha256}.{extension}"
+        if key in self.artifacts:
+            body.close()
+        else:
+            self.artifacts[key] = Artifact(key, sha256, size, body)
+        return self.artifacts[key]
+
+    def reference(self, artifact: Artifact, reference_format: str):
+        if reference_format == "s3-dict":
+            return {"S3Bucket": self.bucket, "S3Key": artifact.key}
+        if reference_format == "s3-uri":
+            return f"s3://{self.bucket}/{artifact.key}"
+        return f"{self.bucket_url}/{artifact.key}"
+
+    def upload_artifact(self, artifact: Artifact, transfer_config):
+        """
+        Returns:
+        "uploaded", or "exists" if an artifact with the same content is already in the bucket.
+        """
+        try:
+            self.s3_client.head_object(Bucket=self.bucket, Key=artifact.key)
+            return "exists"
+        except self.s3_client.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] not in ["404", "NoSuchKey", "NotFound"]:
+                raise
+        artifact.body.seek(0)
+        self.s3_client.upload_fileobj(
+            artifact.body, self.bucket, artifact.key, Config=transfer_config
+        )
+        return "uploaded"
+
+    def upload(self):
+        """
+        Synopsis: Uploads every packaged artifact in parallel, then closes them.
+
+        Returns:
+        A dict of artifact key to "uploaded" or "exists".
+        """
+        # Like the clients themselves, boto3 is only imported once something is uploaded.
+        from boto3.s3.transfer import TransferConfig
+
+        transfer_config = TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.multipart_chunksize,
+            # Parallelism comes from uploading several artifacts at once.
+            max_concurrency=4,
+        )
+        artifacts = list(self.artifacts.values())
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+                statuses = executor.map(
+                    lambda artifact: self.upload_artifact(artifact, transfer_config),
+                    artifacts,
+                )
+                return {
+                    artifact.key: status
+                    for artifact, status in zip(artifacts, statuses)
+                }
+        finally:
+            for artifact in artifacts:
+                artifact.body.close()
+            self.artifacts = {}
+
+
+def package_template(template: dict, base_path: Path, max_parallel: int = None):
+    """
+    Synopsis: Packages and uploads a template's local artifacts (see TemplatePackager) to the management bucket.
+
+    Returns:
+    The template, with its local references rewritten to the uploaded artifacts.
+    """
+    packager = TemplatePackager(
+        get_client("s3"),
+        get_management_bucket_name(),
+        get_management_bucket_url(),
+        max_parallel=max_parallel,
+    )
+    packaged = packager.package(template, base_path)
+    statuses = packager.upload()
+    uploaded = list(statuses.values()).count("uploaded")
+    print(
+        f"Packaged {len(statuses)} artifact(s): {uploaded} uploaded, {len(statuses) - uploaded} already in the bucket."
+    )
+    return packaged
@@ -0,0 +1,22 @@
+import glob
+from pathlib import Path
+
+
+def resolve_stack_config_paths(path_pattern: str):
+    """
+    Synopsis: Resolves a stack config file, a directory of stack config files or a glob pattern into a sorted list of config paths.
+    """
+    path = Path(path_pattern)
+    if path.is_file():
+        return [path]
+    if path.is_dir():
+        config_paths = sorted(path.rglob("*.json"))
+    else:
+        config_paths = sorted(
+            Path(match)
+            for match in glob.glob(path_pattern, recursive=True)
+            if Path(match).is_file()
+        )
+    if not config_paths:
+        raise Exception(f"No stack config files found at '{path_pattern}'.")
+    return config_paths
@@ -0,0 +1,195 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from bettercf.clients import get_client
+
+# The most keys a single DeleteObjects request can delete.
+DELETE_BATCH_SIZE = 1000
+
+
+@dataclass
+class PurgeResult:
+    """
+    Synopsis: The progress, and then the outcome, of purging every object version and delete marker from a bucket.
+    errors holds one {"Key", "VersionId", "Code", "Message"} dict per version that couldn't be deleted.
+    prefixes counts the listed versions by the first part of their key (e.g a template's name, ".artifacts" or ".index").
+    """
+
+    bucket: str
+    dry_run: bool = False
+    versions: int = 0
+    delete_markers: int = 0
+    size: int = 0
+    deleted: int = 0
+    batches: int = 0
+    duration: float = 0.0
+    prefixes: dict = field(default_factory=dict)
+    errors: list = field(default_factory=list)
+
+    @property
+    def listed(self):
+        return self.versions + self.delete_markers
+
+    @property
+    def succeeded(self):
+        return not self.errors
+
+
+def print_purge_progress(result: PurgeResult):
+    print(
+        f"[{result.deleted + len(result.errors)}/{result.listed}] {result.deleted} deleted, {len(result.errors)} failed ({result.batches} batch(es), {result.duration:.1f}s)"
+    )
+
+
+class BucketPurger:
+    """
+    Synopsis:
+        Deletes every object version and delete marker in a bucket (or under a prefix) as fast as S3 allows.
+        ListObjectVersions is paged through once, and each full batch of keys is deleted with a DeleteObjects request
+        while the listing carries on, with up to max_parallel requests in flight.
+        A dry run only lists, to count what would be deleted.
+
+    Parameters:
+    - max_parallel : the maximum number of DeleteObjects requests at the same time. Defaults to BETTERCF_PURGE_MAX_PARALLEL, else 8.
+    - batch_size : the number of keys per DeleteObjects request, at most (and by default) DELETE_BATCH_SIZE.
+    - on_progress : called with the PurgeResult so far after each batch is deleted. Defaults to printing it.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        bucket: str,
+        prefix: str = "",
+        max_parallel: int = None,
+        batch_size: int = DELETE_BATCH_SIZE,
+        on_progress=None,
+    ):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.max_parallel = max_parallel or int(
+            os.environ.get("BETTERCF_PURGE_MAX_PARALLEL", 8)
+        )
+        self.batch_size = batch_size
+        self.on_progress = on_progress or print_purge_progress
+
+        if not 0 < self.batch_size <= DELETE_BATCH_SIZE:
+            raise Exception(
+                f"batch_size must be between 1 and {DELETE_BATCH_SIZE}. Got {self.batch_size}."
+            )
+
+    def list_batches(self, result: PurgeResult):
+        """
+        Synopsis: Yields batches of {"Key", "VersionId"} dicts, counting what is listed into result as it goes.
+        """
+        batch = []
+        paginator = self.s3_client.get_paginator("list_object_versions")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for kind in ["Versions", "DeleteMarkers"]:
+                for version in page.get(kind, []):
+                    if kind == "Versions":
+                        result.versions += 1
+                        result.size += version.get("Size", 0)
+                    else:
+                        result.delete_markers += 1
+                    top_level = version["Key"].split("/", 1)[0]
+                    result.prefixes[top_level] = result.prefixes.get(top_level, 0) + 1
+                    batch.append(
+                        {"Key": version["Key"], "VersionId": version["VersionId"]}
+                    )
+                    if len(batch) == self.batch_size:
+                        yield batch
+                        batch = []
+        if batch:
+            yield batch
+
+    def delete_batch(self, batch: list):
+        """
+        Returns:
+        The number of versions deleted, and an error dict for each that wasn't.
+        """
+        try:
+            response = self.s3_client.delete_objects(
+                Bucket=self.bucket, Delete={"Objects": batch, "Quiet": True}
+            )
+        except Exception as e:
+            # The whole request failed (e.g it was throttled beyond its retries), so none of its keys were deleted.
+            return 0, [
+                {**version, "Code": type(e).__name__, "Message": str(e)}
+                for version in batch
+            ]
+        errors = response.get("Errors", [])
+        return len(batch) - len(errors), errors
+
+    def purge(self, dry_run: bool = False):
+        """
+        Returns:
+        The PurgeResult. Versions that couldn't be deleted are reported in its errors rather than raised.
+        """
+        start = time.monotonic()
+        result = PurgeResult(self.bucket, dry_run)
+        if dry_run:
+            for _ in self.list_batches(result):
+                pass
+            result.duration = time.monotonic() - start
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            in_flight = set()
+
+            def finish(futures):
+                for future in futures:
+                    deleted, errors = future.result()
+                    result.deleted += deleted
+                    result.errors.extend(errors)
+                    result.batches += 1
+                    result.duration = time.monotonic() - start
+                    self.on_progress(result)
+
+            for batch in self.list_batches(result):
+                # Bound the batches listed ahead of those being deleted, so memory doesn't grow with the bucket.
+                if len(in_flight) >= self.max_parallel * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    finish(done)
+                in_flight.add(executor.submit(self.delete_batch, batch))
+            finish(wait(in_flight).done)
+        result.duration = time.monotonic() - start
+        return result
+
+
+def summarise_purge_result(result: PurgeResult):
+    """
+    Synopsis: Prints what a purge deleted (or, for a dry run, would delete) and any errors, and returns the exit code
+    (0 if everything was deleted, otherwise 1).
+    """
+    listed = f"{result.versions} object version(s) ({result.size / 1024 / 1024:.1f}MiB) and {result.delete_markers} delete marker(s)"
+    if result.dry_run:
+        print(f"Dry run: would delete {listed} from bucket {result.bucket}.")
+    else:
+        print(
+            f"Deleted {result.deleted} of {result.listed} listed: {listed} from bucket {result.bucket} in {result.duration:.1f}s."
+        )
+    for prefix, count in sorted(result.prefixes.items()):
+        print(f"  {prefix}: {count}")
+    for error in result.errors:
+        print(
+            f"  FAILED {error['Key']} ({error.get('VersionId')}): {error.get('Code')} {error.get('Message')}"
+        )
+    return 1 if result.errors else 0
+
+
+def purge_bucket(bucket: str, dry_run: bool = False, max_parallel: int = None):
+    """
+    Synopsis: Deletes (or, for a dry run, counts) every object version and delete marker in a bucket, including
+    packaged artifacts under .artifacts and template indexes under .index, and prints a summary.
+
+    Returns:
+    The PurgeResult.
+    """
+    result = BucketPurger(get_client("s3"), bucket, max_parallel=max_parallel).purge(
+        dry_run
+    )
+    summarise_purge_result(result)
+    return result
@@ -0,0 +1,68 @@
+# Statuses of items that didn't succeed. Any other status (e.g "created", "uploaded" or "built") is a success.
+UNSUCCESSFUL_STATUSES = ["failed", "skipped", "invalid"]
+
+
+class BatchResult:
+    """
+    Synopsis: Base class for the outcome of one item (a stack, template or stack config) of a batch.
+    Subclasses are dataclasses with status and error attributes (error is None on success), and a name property naming the item.
+    """
+
+    @property
+    def succeeded(self):
+        return self.status not in UNSUCCESSFUL_STATUSES
+
+    def progress_details(self):
+        """
+        Synopsis: What the item's progress line shows in brackets after its name.
+        """
+        return f"{self.duration:.1f}s"
+
+    def unsuccessful_report(self):
+        """
+        Synopsis: How the item is reported in the batch's summary when it didn't succeed.
+        """
+        return f"  {self.status.upper()} {self.name}: {self.error}"
+
+
+def print_result(result: BatchResult, completed: int, total: int):
+    message = f"[{completed}/{total}] {result.status.upper()} {result.name} ({result.progress_details()})"
+    if result.error:
+        message += f": {result.error}"
+    print(message)
+
+
+def count_unsuccessful(results: list[BatchResult], always: str = "failed"):
+    """
+    Synopsis: Describes how many of the results didn't succeed, by status, e.g "1 failed, 2 skipped".
+    The always status is counted even if none of the results have it.
+    """
+    counts = {always: 0}
+    for result in results:
+        if not result.succeeded:
+            counts[result.status] = counts.get(result.status, 0) + 1
+    return ", ".join(f"{count} {status}" for status, count in counts.items())
+
+
+def summarise(
+    results: list[BatchResult],
+    noun: str,
+    outcome: str,
+    unsuccessful_status: str = "failed",
+    details: str = None,
+):
+    """
+    Synopsis: Prints a summary of a batch, e.g "2 of 3 template(s) built, 1 failed.", followed by details (if given) and then
+    by each unsuccessful result and its error.
+
+    Returns:
+    The combined exit code: 0 if every result succeeded, otherwise 1.
+    """
+    unsuccessful = [result for result in results if not result.succeeded]
+    summary = f"{len(results) - len(unsuccessful)} of {len(results)} {noun} {outcome}, {count_unsuccessful(unsuccessful, unsuccessful_status)}."
+    if details:
+        summary += f" {details}"
+    print(summary)
+    for result in unsuccessful:
+        print(result.unsuccessful_report())
+    return 1 if unsuccessful else 0
@@ -1,20 +1,26 @@
 import json
 from dataclasses import dataclass, field
+from functools import cached_property
 from pathlib import Path
-import boto3
 
 from dfm.file_types import JsonFileType
 
+from bettercf.cache import template_cache
+from bettercf.clients import get_client
+from bettercf.override import compile_overrides
 from bettercf.region import Region
 from bettercf.template import Template
 from bettercf.utils import (
+    FINGERPRINT_TAG_KEY,
     cfn_create_or_update,
-    get_management_bucket_url,
+    cfn_delete_stack,
+    generate_stack_fingerprint,
     get_management_bucket_name,
-    is_non_empty_string,
+    get_management_bucket_url,
+    is_management_bucket_immutable,
 )
+from bettercf.validation import validate_stack_config
 from bettercf.version import Version
-from bettercf.override import override_resources
 
 
 @dataclass
@@ -29,11 +35,16 @@ class Stack:
     role_arn: str = None
     template_parameters: dict = field(default_factory=dict)
     resource_overrides: dict = field(default_factory=dict)
+    # Paths (relative to the stack config) of the stack configs to deploy before this one.
+    depends_on: list = field(default_factory=list)
 
     # TODO add stack tags with version being deployed
-    def deploy(self, local_template_override: dict = None):
+    def deploy(self, local_template_override: dict = None, force: bool = False):
         """
-        Takes a cloudformation template from S3 and creates/updates the stack in AWS CloudFormation
+        Takes a cloudformation template from S3 and creates/updates the stack in AWS CloudFormation.
+        The stack is tagged with a fingerprint of its template and parameters. Unless force is set,
+        an existing stack whose fingerprint already matches is left alone.
+        Returns whether the stack was "created", "updated" or "unchanged".
         """
         # Check parameters
 
@@ -73,22 +84,53 @@ class Stack:
             boto3_kwargs.pop("TemplateURL")
 
         if self.resource_overrides:
-            data_to_override = {}
             if local_template_override:
-                data_to_override = json.dumps(local_template_override)
+                base_template = local_template_override
             else:
-                s3_client = boto3.client("s3")
-                data_to_override = json.loads(
-                    s3_client.get_object(
-                        Bucket = get_management_bucket_name(),
-                        Key = object_key
-                    )["Body"].read().decode('utf-8')
+                # Template versions can't change in compliance mode, so a cached copy never needs revalidating.
+                base_template = template_cache.get_parsed(
+                    get_client("s3"),
+                    get_management_bucket_name(),
+                    object_key,
+                    immutable=is_management_bucket_immutable(),
                 )
-            overridden_data = override_resources(data_to_override, self.resource_overrides)
+            # The base template may be shared with other stacks so is rendered copy-on-write rather than overridden in place.
+            overridden_data = self.override_plan.render(base_template)
             boto3_kwargs["TemplateBody"] = json.dumps(overridden_data)
-            boto3_kwargs.pop("TemplateURL")
+            boto3_kwargs.pop("TemplateURL", None)
+
+        template_etag = None
+        if "TemplateURL" in boto3_kwargs:
+            # The URL alone doesn't change when a template version is re-pushed (outside compliance mode), so include its ETag.
+            template_etag = get_client("s3").head_object(
+                Bucket=get_management_bucket_name(), Key=object_key
+            )["ETag"]
+        boto3_kwargs["Tags"] = [
+            {
+                "Key": FINGERPRINT_TAG_KEY,
+                "Value": generate_stack_fingerprint(boto3_kwargs, template_etag),
+            }
+        ]
 
-        cfn_create_or_update(STACK_NAME, boto3_kwargs)
+        return cfn_create_or_update(
+            STACK_NAME,
+            boto3_kwargs,
+            skip_unchanged=not force,
+            region_name=self.region.name,
+        )
+
+    def delete(self):
+        """
+        Deletes the stack from its region and waits for the deletion to finish.
+        Returns "deleted", or "absent" if the stack doesn't exist.
+        """
+        return cfn_delete_stack(
+            self.generate_stack_name(), region_name=self.region.name, missing_ok=True
+        )
+
+    @cached_property
+    def override_plan(self):
+        return compile_overrides(self.resource_overrides)
 
     def generate_stack_name(self):
         return "-".join(
@@ -97,84 +139,52 @@ class Stack:
 
     @staticmethod
     def load_stack_config_from_file(file_path: Path):
-        stack_config_dict = JsonFileType.load_from_file(file_path)
-
-        # Check for unexpected keys
-        ALL_EXPECTED_KEYS = [
-            "Version",
-            "Template",
-            "EnvType",
-            "Region",
-            "Identifier",
-            "RoleArn",
-            "TemplateParameters",
-            "ResourceOverrides",
-        ]
-        for key in stack_config_dict:
-            if key not in ALL_EXPECTED_KEYS:
-                raise Exception("Unexpected key '{key}' detected in stack config file.")
-
-        # Check all expected keys are present
-        for key in ALL_EXPECTED_KEYS:
-            if key not in stack_config_dict:
-                raise Exception(
-                    f"Stack Config Parsing Failure: Stack config file is missing required {key} key."
-                )
-
-        # String key checks
-        STRING_KEYS = [
-            "Version",
-            "EnvType",
-            "Region",
-            "Identifier",
-        ]
+        stacks = Stack.load_stack_configs_from_file(file_path)
+        if len(stacks) != 1:
+            raise Exception(
+                f"Stack config file {file_path} deploys to {len(stacks)} regions. Load it with Stack.load_stack_configs_from_file."
+            )
+        return stacks[0]
 
-        for key in STRING_KEYS:
-            if not is_non_empty_string(stack_config_dict[key]):
-                raise Exception(
-                    f"Stack Config Parsing Failure: Stack config {key} value: {stack_config_dict[key]} must be a non-empty string."
-                )
+    @staticmethod
+    def load_stack_configs_from_file(file_path: Path, region_names: list[str] = None):
+        """
+        Synopsis: Loads a stack config, returning one Stack for each of its regions (in order).
+        A config's Region is either a region name or a list of region names.
 
-        # Template checks
-        TEMPLATE_KEYS = ["Name", "Version"]
-        for key in TEMPLATE_KEYS:
-            if key not in stack_config_dict["Template"]:
-                raise Exception(
-                    f"Stack Config Parsing Failure: Stack config file's Template is missing required {key} key."
-                )
-            if not is_non_empty_string(stack_config_dict["Template"][key]):
-                raise Exception(
-                    f'Stack Config Parsing Failure: Stack config Template\'s {key} value: {stack_config_dict["Template"][key]} must be a non-empty string.'
-                )
+        Parameters:
+        - region_names : deploy to these regions instead of the ones in the config.
+        """
+        stack_config_dict = JsonFileType.load_from_file(file_path)
+        if region_names:
+            stack_config_dict = {**stack_config_dict, "Region": list(region_names)}
 
-        # Role Arn checks
-        if not (
-            is_non_empty_string(stack_config_dict["RoleArn"])
-            or stack_config_dict["RoleArn"] is None
-        ):
+        errors = validate_stack_config(stack_config_dict)
+        if errors:
             raise Exception(
-                f'Stack Config Parsing Failure: Stack config RoleArn value {stack_config_dict["RoleArn"]} must be a non-empty string or null.'
+                f"Stack Config Parsing Failure: Stack config file {file_path} is invalid: {' '.join(errors)}"
             )
 
-        # Dict key checks
-        EXPECTED_DICT_KEYS = ["TemplateParameters", "ResourceOverrides"]
-        for key in EXPECTED_DICT_KEYS:
-            if not (
-                type(stack_config_dict[key]) == dict or stack_config_dict[key] is None
-            ):
-                raise Exception(
-                    f"Stack Config Parsing Failure: Stack config {key} value {str(stack_config_dict[key])} must be a dictionary or null."
-                )
-
-        return Stack(
-            version=Version(stack_config_dict["Version"]),
-            template=Template(template_name=stack_config_dict["Template"]["Name"]),
-            template_version=Version(stack_config_dict["Template"]["Version"]),
-            env_type=stack_config_dict["EnvType"],
-            region=Region(name=stack_config_dict["Region"]),
-            identifier=stack_config_dict["Identifier"],
-            # account=config_dict["Account"],
-            role_arn=stack_config_dict["RoleArn"],
-            template_parameters=stack_config_dict["TemplateParameters"],
-            resource_overrides=stack_config_dict["ResourceOverrides"],
-        )
+        region_names = stack_config_dict["Region"]
+        if type(region_names) == str:
+            region_names = [region_names]
+        # The stacks differ only by region, so share everything else.
+        template = Template(template_name=stack_config_dict["Template"]["Name"])
+        version = Version(stack_config_dict["Version"])
+        template_version = Version(stack_config_dict["Template"]["Version"])
+        return [
+            Stack(
+                version=version,
+                template=template,
+                template_version=template_version,
+                env_type=stack_config_dict["EnvType"],
+                region=Region(name=region_name),
+                identifier=stack_config_dict["Identifier"],
+                # account=config_dict["Account"],
+                role_arn=stack_config_dict["RoleArn"],
+                template_parameters=stack_config_dict["TemplateParameters"],
+                resource_overrides=stack_config_dict["ResourceOverrides"],
+                depends_on=stack_config_dict.get("DependsOn", []),
+            )
+            for region_name in region_names
+        ]
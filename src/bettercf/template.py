@@ -1,17 +1,30 @@
 import json
+from functools import cached_property
 from pathlib import Path
 
-import boto3
 from dfm.config import BuildConfig
 from dfm.file_types import JsonFileType
 
-from bettercf.utils import get_latest_version, get_management_bucket_name
+from bettercf.build import BuildWatcher, IncrementalBuilder
+from bettercf.clients import get_client
+from bettercf.template_index import (
+    DEDUPE_MODES,
+    TemplateIndex,
+    is_conditional_write_conflict,
+    supports_conditional_writes,
+)
+from bettercf.utils import (
+    TEMPLATE_HASH_METADATA_KEY,
+    generate_template_hash,
+    get_management_bucket_name,
+)
 from bettercf.version import Version
 
 
 class Template:
     name: str
-    dfm_config: BuildConfig
+    dfm_config_file_path: Path
+    dfm_root_path: Path
 
     def __init__(
         self,
@@ -22,13 +35,28 @@ class Template:
         dfm_root_path: Path = Path(__file__).parent.parent.resolve(),
     ):
         self.name = template_name
-        self.dfm_config = BuildConfig.load_config_from_file(
-            file_path=dfm_config_file_path,
-            root_path=dfm_root_path,
-            parameters={"TemplateName": template_name},
+        self.dfm_config_file_path = dfm_config_file_path
+        self.dfm_root_path = dfm_root_path
+
+    @cached_property
+    def dfm_config(self) -> BuildConfig:
+        """
+        Synopsis: The dfm build config for this template.
+        Loaded on first use, as only building (and pushing the built file) need it - a Template held by a Stack never does.
+        """
+        return BuildConfig.load_config_from_file(
+            file_path=self.dfm_config_file_path,
+            root_path=self.dfm_root_path,
+            parameters={"TemplateName": self.name},
         )
 
-    def push(self, version: Version = None, template_str: str = None):
+    def push(
+        self,
+        version: Version = None,
+        template_str: str = None,
+        dedupe: str = "off",
+        overwrite: bool = True,
+    ):
 
         # TODO remove this? Forces user to use DFM...
         if not template_str:
@@ -41,46 +69,219 @@ class Template:
         # End TODO
 
         if not version:
-            version = Version(Template.detect_latest_version(self.name))
-            version.auto_increment_version()
+            version = Version(
+                Template.detect_latest_version(self.name)
+            ).auto_increment_version()
 
-        Template.push_mechanism(self.name, version, template_str)
-
-        return
+        return Template.push_mechanism(
+            self.name, version, template_str, dedupe, overwrite
+        )
 
     @staticmethod
-    def push_mechanism(name: str, version: Version, template_str: str):
+    def push_mechanism(
+        name: str,
+        version: Version,
+        template_str: str,
+        dedupe: str = "off",
+        overwrite: bool = True,
+    ):
+        """
+        Synopsis: Uploads a template version to the management bucket and records it in the template's index.
+
+        Parameters:
+        - dedupe : what to do when an identical template (by canonical content hash) has already been pushed under another version.
+            - "off" : upload it anyway.
+            - "alias" : record the new version as a server-side copy of the existing one, so the body is not uploaded again.
+            - "skip" : don't create the new version at all.
+        - overwrite : if False, refuse to push a version that already exists, even if it is pushed at the same time
+            (with a conditional write where the client's botocore supports them, otherwise a HEAD request first).
+
+        Returns:
+        "uploaded" or "deduplicated".
+        """
+        if dedupe not in DEDUPE_MODES:
+            raise Exception(
+                f"Dedupe mode must be one of {DEDUPE_MODES}. Got '{dedupe}'."
+            )
         BUCKET_NAME = get_management_bucket_name()
-        s3_client = boto3.client("s3")
-        s3_client.put_object(
-            Body=template_str,
-            Bucket=BUCKET_NAME,
-            Key=f"{name}/{version.get_version_string()}",
+        s3_client = get_client("s3")
+        if isinstance(template_str, str):
+            template_str = template_str.encode("utf-8")
+        version_string = version.get_version_string()
+        template_hash = generate_template_hash(template_str)
+
+        # Templates pushed before indexing existed are picked up from a one-off listing, saved with the new version.
+        index = TemplateIndex.load(s3_client, BUCKET_NAME, name)
+        if index is None:
+            index = TemplateIndex(name)
+            index.index_listed_versions(s3_client, BUCKET_NAME)
+
+        duplicate = None
+        if dedupe != "off":
+            duplicate = Template.find_duplicate(
+                s3_client, BUCKET_NAME, index, template_hash
+            )
+        if duplicate and dedupe == "skip":
+            print(
+                f"Template '{name}' is identical to version {duplicate['Version']}. Skipping push of version {version_string}."
+            )
+            return "deduplicated"
+
+        key = f"{name}/{version_string}"
+        condition = {}
+        if not overwrite:
+            # CopyObject gained conditional writes in a later botocore release than PutObject.
+            if supports_conditional_writes(
+                s3_client, "CopyObject" if duplicate else "PutObject"
+            ):
+                condition = {"IfNoneMatch": "*"}
+            elif Template.version_exists(s3_client, BUCKET_NAME, key):
+                raise Template.version_exists_error(name, version_string)
+        try:
+            if duplicate:
+                response = s3_client.copy_object(
+                    Bucket=BUCKET_NAME,
+                    Key=key,
+                    CopySource={
+                        "Bucket": BUCKET_NAME,
+                        "Key": f"{name}/{duplicate['Version']}",
+                    },
+                    **condition,
+                )["CopyObjectResult"]
+            else:
+                response = s3_client.put_object(
+                    Body=template_str,
+                    Bucket=BUCKET_NAME,
+                    Key=key,
+                    Metadata={TEMPLATE_HASH_METADATA_KEY: template_hash},
+                    **condition,
+                )
+        except s3_client.exceptions.ClientError as e:
+            if condition and is_conditional_write_conflict(e):
+                raise Template.version_exists_error(name, version_string)
+            raise
+        if duplicate:
+            print(
+                f"Template '{name}' is identical to version {duplicate['Version']}. Pushed version {version_string} as an alias."
+            )
+        else:
+            print(f"Template '{name}' version {version_string} uploaded.")
+
+        TemplateIndex.update(
+            s3_client,
+            BUCKET_NAME,
+            name,
+            lambda index: index.add_version(
+                version_string,
+                size=len(template_str),
+                sha256=template_hash,
+                etag=response["ETag"],
+                alias_of=duplicate["Version"] if duplicate else None,
+            ),
+            index=index,
         )
-        return
+        return "deduplicated" if duplicate else "uploaded"
 
-    def build(self):
-        return self.dfm_config.build()
+    @staticmethod
+    def version_exists(s3_client, bucket: str, key: str):
+        try:
+            s3_client.head_object(Bucket=bucket, Key=key)
+            return True
+        except s3_client.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] not in ["404", "NoSuchKey", "NotFound"]:
+                raise
+        return False
 
     @staticmethod
-    def detect_latest_version(template_name: str):
-        BUCKET_NAME = get_management_bucket_name()
-        s3_client = boto3.client("s3")
-        response = s3_client.list_objects_v2(
-            Bucket=BUCKET_NAME,
-            Prefix=f"{template_name}/",
-            # ContinuationToken='string' #TODO deal with continuation
+    def version_exists_error(name: str, version_string: str):
+        return Exception(
+            f"Template '{name}' version {version_string} already exists and overwriting is disabled. Push a new version instead."
         )
-        versions_present = []
-        if "Contents" not in response:
+
+    @staticmethod
+    def find_duplicate(
+        s3_client, bucket: str, index: TemplateIndex, template_hash: str
+    ):
+        """
+        Synopsis: Returns the index entry of the newest version with the given content hash, or None.
+        Versions indexed without a hash are only checked (with a HEAD request) if they are the latest version.
+        """
+        for entry in reversed(index.versions):
+            if entry.get("Sha256") == template_hash:
+                return entry
+        if index.versions and not index.versions[-1].get("Sha256"):
+            latest = index.versions[-1]
+            metadata = s3_client.head_object(
+                Bucket=bucket, Key=f"{index.template_name}/{latest['Version']}"
+            )["Metadata"]
+            if metadata.get(TEMPLATE_HASH_METADATA_KEY) == template_hash:
+                return latest
+        return None
+
+    def build(self, incremental: bool = False):
+        """
+        Synopsis: Builds the template's destination file with dfm and returns its content.
+        If incremental is set, only changed fragments are re-read, and the build is skipped entirely if nothing changed (see IncrementalBuilder).
+        """
+        if not incremental:
+            return self.dfm_config.build()
+        builder = IncrementalBuilder(self.dfm_config)
+        content = builder.build()
+        if builder.changed_fragments is None:
+            print(f"Template '{self.name}' is unchanged. Skipping build.")
+        else:
+            print(
+                f"Template '{self.name}' built ({builder.changed_fragments} changed fragment(s))."
+            )
+        return content
+
+    def watch(self):
+        """
+        Synopsis: Rebuilds the template incrementally every time its source fragments change, until interrupted.
+        """
+        watcher = BuildWatcher(IncrementalBuilder(self.dfm_config), self.name)
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            print(f"Stopped watching template '{self.name}'.")
+
+    @staticmethod
+    def get_index(template_name: str):
+        """
+        Synopsis: Returns the template's version index. If the template has never been indexed, one is generated from a full listing (without saving it).
+        """
+        BUCKET_NAME = get_management_bucket_name()
+        s3_client = get_client("s3")
+        index = TemplateIndex.load(s3_client, BUCKET_NAME, template_name)
+        if index is None:
+            index = TemplateIndex(
+                template_name,
+                [
+                    {"Version": version_string, "Size": file["Size"]}
+                    for version_string, file in TemplateIndex.list_version_objects(
+                        s3_client, BUCKET_NAME, template_name
+                    )
+                ],
+            )
+        if not index.versions:
             raise Exception(
                 f"No versions of template: {template_name} detected in management bucket: {BUCKET_NAME}"
             )
-        for file in response["Contents"]:
-            if file["Key"].split("/")[
-                -1
-            ]:  # This will be an empty string when s3.list_objects_v2 provides a subfolder instead of an object. Must skip this scenario.
-                versions_present.append(  # Tuple of major, minor
-                    file["Key"].split("/")[-1]
-                )
-        return get_latest_version(versions_present)
+        return index
+
+    @staticmethod
+    def detect_latest_version(template_name: str):
+        return Template.get_index(template_name).get_latest_version()
+
+    @staticmethod
+    def list_versions(template_name: str):
+        return Template.get_index(template_name).versions
+
+    @staticmethod
+    def reindex(template_name: str):
+        """
+        Synopsis: Regenerates (and saves) the template's version index from a full paginated listing of the management bucket.
+        """
+        return TemplateIndex.rebuild(
+            get_client("s3"), get_management_bucket_name(), template_name
+        )
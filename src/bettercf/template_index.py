@@ -0,0 +1,240 @@
+import json
+from datetime import datetime, timezone
+
+from bettercf.version import version_sort_key
+
+INDEX_PREFIX = ".index"
+
+# What to do when pushing a template identical to an already pushed version (see Template.push_mechanism).
+DEDUPE_MODES = ["off", "alias", "skip"]
+
+# The error codes S3 returns when a conditional write loses to another write of the same key.
+CONDITIONAL_WRITE_CONFLICT_CODES = ["PreconditionFailed", "ConditionalRequestConflict"]
+
+MAX_INDEX_UPDATE_ATTEMPTS = 10
+
+
+def supports_conditional_writes(s3_client, operation: str = "PutObject"):
+    """
+    Synopsis: Returns whether the client's botocore can send IfMatch / IfNoneMatch on the S3 operation.
+    Releases from before S3 supported conditional writes reject them with a ParamValidationError.
+    """
+    members = s3_client.meta.service_model.operation_model(
+        operation
+    ).input_shape.members
+    return "IfMatch" in members and "IfNoneMatch" in members
+
+
+def is_conditional_write_conflict(error: Exception):
+    return (
+        getattr(error, "response", {}).get("Error", {}).get("Code")
+        in CONDITIONAL_WRITE_CONFLICT_CODES
+    )
+
+
+class TemplateIndex:
+    """
+    Synopsis:
+        A small manifest object, stored in the management bucket at .index/<template name>.json, listing every pushed
+        version of a template (sorted oldest to newest) with its size, SHA-256, ETag and push time.
+        It lets latest-version and list queries be answered with a single GET instead of listing every object under the template's prefix.
+        It lives outside the template's prefix so it is never mistaken for a template version.
+        etag is the ETag of the index object it was loaded from (None if it hasn't been saved yet). Saves are conditional on it,
+        so concurrent pushes can never overwrite each other's entries.
+    """
+
+    def __init__(
+        self, template_name: str, versions: list[dict] = None, etag: str = None
+    ):
+        self.template_name = template_name
+        self.etag = etag
+        self.versions = sorted(
+            versions or [], key=lambda entry: version_sort_key(entry["Version"])
+        )
+
+    @property
+    def key(self):
+        return f"{INDEX_PREFIX}/{self.template_name}.json"
+
+    def get_version_strings(self):
+        return [entry["Version"] for entry in self.versions]
+
+    def get_latest_version(self):
+        if not self.versions:
+            raise Exception(f"No versions of template: {self.template_name} indexed.")
+        return self.versions[-1]["Version"]
+
+    def get_version(self, version_string: str):
+        for entry in self.versions:
+            if entry["Version"] == version_string:
+                return entry
+        return None
+
+    def add_version(
+        self,
+        version_string: str,
+        size: int,
+        sha256: str = None,
+        etag: str = None,
+        pushed_at: str = None,
+        alias_of: str = None,
+    ):
+        """
+        Synopsis: Records a pushed version, replacing any existing entry for the same version.
+        alias_of names the version it was copied from when it was deduplicated on push.
+        """
+        self.versions = [
+            entry for entry in self.versions if entry["Version"] != version_string
+        ]
+        self.versions.append(
+            {
+                "Version": version_string,
+                "Size": size,
+                "Sha256": sha256,
+                "ETag": etag,
+                "PushedAt": pushed_at or datetime.now(timezone.utc).isoformat(),
+            }
+        )
+        if alias_of:
+            self.versions[-1]["AliasOf"] = alias_of
+        self.versions.sort(key=lambda entry: version_sort_key(entry["Version"]))
+
+    def to_dict(self):
+        return {"TemplateName": self.template_name, "Versions": self.versions}
+
+    def save(self, s3_client, bucket: str):
+        """
+        Synopsis: Saves the index, only if it hasn't changed in the bucket since it was loaded (or, for a new index, only if
+        no index has been saved since). Otherwise the conditional write fails (see is_conditional_write_conflict).
+        If the client's botocore can't send conditional writes, the index is saved unconditionally.
+        """
+        condition = {}
+        if supports_conditional_writes(s3_client):
+            condition = {"IfMatch": self.etag} if self.etag else {"IfNoneMatch": "*"}
+        response = s3_client.put_object(
+            Body=json.dumps(self.to_dict()).encode("utf-8"),
+            Bucket=bucket,
+            Key=self.key,
+            ContentType="application/json",
+            **condition,
+        )
+        self.etag = response["ETag"]
+
+    @staticmethod
+    def update(
+        s3_client,
+        bucket: str,
+        template_name: str,
+        change,
+        index=None,
+        index_unindexed: bool = True,
+        max_attempts: int = MAX_INDEX_UPDATE_ATTEMPTS,
+    ):
+        """
+        Synopsis: Applies change(index) to the template's index and saves it. If another update saved the index first, it is
+        reloaded and the change applied again, so concurrent updates are never lost.
+
+        Parameters:
+        - index : an already loaded index to try first, saving a GET.
+        - index_unindexed : if the template has never been indexed, start from a full listing of its versions.
+
+        Returns:
+        The saved index.
+        """
+        for _ in range(max_attempts):
+            if index is None:
+                index = TemplateIndex.load(s3_client, bucket, template_name)
+            if index is None:
+                index = TemplateIndex(template_name)
+                if index_unindexed:
+                    index.index_listed_versions(s3_client, bucket)
+            change(index)
+            try:
+                index.save(s3_client, bucket)
+                return index
+            except s3_client.exceptions.ClientError as e:
+                if not is_conditional_write_conflict(e):
+                    raise
+            index = None
+        raise Exception(
+            f"Could not update the index of template '{template_name}' after {max_attempts} attempts, as it kept being updated at the same time."
+        )
+
+    @staticmethod
+    def load(s3_client, bucket: str, template_name: str):
+        """
+        Synopsis: Returns the template's index from the bucket, or None if it has never been indexed.
+        """
+        try:
+            response = s3_client.get_object(
+                Bucket=bucket, Key=TemplateIndex(template_name).key
+            )
+        except s3_client.exceptions.NoSuchKey:
+            return None
+        index_dict = json.loads(response["Body"].read())
+        return TemplateIndex(
+            index_dict["TemplateName"], index_dict["Versions"], response["ETag"]
+        )
+
+    @staticmethod
+    def list_version_objects(
+        s3_client, bucket: str, template_name: str, page_size: int = 1000
+    ):
+        """
+        Synopsis: Pages through every object stored under the template's prefix, yielding (version string, object summary).
+        """
+        paginator = s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(
+            Bucket=bucket,
+            Prefix=f"{template_name}/",
+            PaginationConfig={"PageSize": page_size},
+        ):
+            for file in page.get("Contents", []):
+                version_string = file["Key"].split("/")[-1]
+                # This will be an empty string when s3.list_objects_v2 provides a subfolder instead of an object. Must skip this scenario.
+                if version_string:
+                    yield version_string, file
+
+    def index_listed_versions(self, s3_client, bucket: str, page_size: int = 1000):
+        """
+        Synopsis: Replaces the indexed versions with those found by a full (paginated) listing of the template's prefix.
+        SHA-256s are only known for versions pushed since indexing was introduced, so are carried over from the current entries
+        for objects that haven't changed since.
+        """
+        existing_entries = {entry["Version"]: entry for entry in self.versions}
+        versions = []
+        for version_string, file in TemplateIndex.list_version_objects(
+            s3_client, bucket, self.template_name, page_size
+        ):
+            existing_entry = existing_entries.get(version_string)
+            # If the object was overwritten since, its recorded hash is stale.
+            sha256 = (
+                existing_entry.get("Sha256")
+                if existing_entry and existing_entry.get("ETag") == file["ETag"]
+                else None
+            )
+            versions.append(
+                {
+                    "Version": version_string,
+                    "Size": file["Size"],
+                    "Sha256": sha256,
+                    "ETag": file["ETag"],
+                    "PushedAt": file["LastModified"].isoformat(),
+                }
+            )
+        self.versions = sorted(
+            versions, key=lambda entry: version_sort_key(entry["Version"])
+        )
+
+    @staticmethod
+    def rebuild(s3_client, bucket: str, template_name: str, page_size: int = 1000):
+        """
+        Synopsis: Regenerates the template's index from a full (paginated) listing of its versions and saves it.
+        """
+        return TemplateIndex.update(
+            s3_client,
+            bucket,
+            template_name,
+            lambda index: index.index_listed_versions(s3_client, bucket, page_size),
+            index_unindexed=False,
+        )
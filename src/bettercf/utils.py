@@ -1,25 +1,28 @@
-import time
+import hashlib
+import json
 
-import boto3
+from bettercf.cache import management_bucket_cache
+from bettercf.clients import get_client
+from bettercf.version import get_latest_version  # noqa: F401 (re-exported)
+from bettercf.waiter import Waiter, stack_status_poller
 
-from bettercf.version import Version
+FINGERPRINT_TAG_KEY = "BetterCF:Fingerprint"
 
+# S3 object metadata key holding a pushed template's canonical content hash.
+TEMPLATE_HASH_METADATA_KEY = "bettercf-sha256"
 
-def get_latest_version(versions: list[str]):
-    try:  # TODO this assumed that all versions are of the same syntax. Perhaps we need a better check?
-        return max(versions, key=Version.major_minor)
-    except Exception:
-        pass  # TODO I don't think this is a good pattern
-    try:
-        return max(versions, key=Version.major_minor_micro)
-    except Exception:
-        raise Exception(
-            f"Versions (e.g '{versions[0]}' are not of the 'X.Y' or 'X.Y.Z' format"
-        )
+# Stack states in which the deployed template and parameters are known to match the stack's tags.
+STABLE_STACK_STATUSES = ["CREATE_COMPLETE", "UPDATE_COMPLETE", "IMPORT_COMPLETE"]
 
 
 def get_management_bucket_name():
-    client = boto3.client("ssm")
+    return management_bucket_cache.get(
+        "BucketName", _get_management_bucket_name_from_ssm
+    )
+
+
+def _get_management_bucket_name_from_ssm():
+    client = get_client("ssm")
     try:
         to_return = client.get_parameter(
             Name="/BetterCF/.management/BetterCF-management-bucket-name",
@@ -30,7 +33,13 @@ def get_management_bucket_name():
 
 
 def get_management_bucket_location():
-    client = boto3.client("s3")
+    return management_bucket_cache.get(
+        "BucketLocation", _get_management_bucket_location_from_s3
+    )
+
+
+def _get_management_bucket_location_from_s3():
+    client = get_client("s3")
     bucket_name = get_management_bucket_name()
     try:
         to_return = client.get_bucket_location(Bucket=bucket_name)["LocationConstraint"]
@@ -47,55 +56,220 @@ def get_management_bucket_url():
     return f"https://{bucket_name}.s3.{bucket_region}.amazonaws.com"
 
 
-def cfn_create_or_update(StackName: str, boto3_kwargs: dict):
+def get_management_bucket_mode():
+    """
+    Synopsis: Returns the object lock mode of the management bucket ("COMPLIANCE", "GOVERNANCE" or "STANDARD").
+    """
+    return management_bucket_cache.get(
+        "BucketMode", _get_management_bucket_mode_from_s3
+    )
+
+
+def _get_management_bucket_mode_from_s3():
+    client = get_client("s3")
+    try:
+        lock_configuration = client.get_object_lock_configuration(
+            Bucket=get_management_bucket_name()
+        )["ObjectLockConfiguration"]
+    except client.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] == "ObjectLockConfigurationNotFoundError":
+            return "STANDARD"
+        raise
+    return (
+        lock_configuration.get("Rule", {})
+        .get("DefaultRetention", {})
+        .get("Mode", "STANDARD")
+    )
+
+
+def is_management_bucket_immutable():
+    """
+    Synopsis: Returns whether pushed templates can never change, as the management bucket is in COMPLIANCE mode.
+    This is only a cache hint, so if the mode can't be read (e.g without s3:GetBucketObjectLockConfiguration) the bucket
+    is treated as mutable rather than failing.
+    """
+    try:
+        return get_management_bucket_mode() == "COMPLIANCE"
+    except Exception as e:
+        print(
+            f"Could not read the management bucket's object lock mode, so cached templates will be revalidated: {e}"
+        )
+        return False
+
+
+def invalidate_management_bucket_cache():
+    management_bucket_cache.invalidate()
+
+
+def get_stack_status(client, StackName: str):
+    return client.describe_stacks(StackName=StackName)["Stacks"][0]["StackStatus"]
+
+
+def is_stack_status_terminal(stack_state: str):
+    return "IN_PROGRESS" not in stack_state
+
+
+def wait_for_stack(client, StackName: str, waiter: Waiter = None):
+    """
+    Synopsis: Polls a stack (by name or id) until it leaves every *_IN_PROGRESS state, then returns its status.
+    Without a waiter, the stack is watched by the shared stack_status_poller, so stacks deploying at the same time share each poll.
+    """
+    if waiter is None:
+        return stack_status_poller.wait(client, StackName)
+    return waiter.wait(
+        lambda: get_stack_status(client, StackName), is_stack_status_terminal
+    )
+
+
+def generate_stack_fingerprint(boto3_kwargs: dict, template_etag: str = None):
+    """
+    Synopsis: Returns a canonical hash of everything that determines the outcome of a stack deployment:
+    the template (its body, or its URL plus the S3 object's ETag), the parameters, the role ARN and the capabilities.
+    """
+    template_body = boto3_kwargs.get("TemplateBody")
+    if template_body is not None:
+        try:
+            template_body = json.loads(template_body)
+        except ValueError:
+            pass  # Not JSON (e.g YAML). Hash it as it is.
+    fingerprint_source = {
+        "TemplateBody": template_body,
+        "TemplateURL": None if template_body else boto3_kwargs.get("TemplateURL"),
+        "TemplateETag": None if template_body else template_etag,
+        "Parameters": sorted(
+            [parameter["ParameterKey"], parameter.get("ParameterValue")]
+            for parameter in boto3_kwargs.get("Parameters", [])
+        ),
+        "RoleARN": boto3_kwargs.get("RoleARN"),
+        "Capabilities": sorted(boto3_kwargs.get("Capabilities", [])),
+    }
+    return hashlib.sha256(
+        json.dumps(fingerprint_source, sort_keys=True, separators=(",", ":")).encode(
+            "utf-8"
+        )
+    ).hexdigest()
+
+
+def generate_template_hash(template_body: bytes):
+    """
+    Synopsis: Returns a SHA-256 of the template's canonical form, so re-serialising a JSON template (key order, whitespace) doesn't change its hash.
+    Templates that aren't JSON (e.g YAML) are hashed as they are.
+    """
+    try:
+        template_body = json.dumps(
+            json.loads(template_body), sort_keys=True, separators=(",", ":")
+        ).encode("utf-8")
+    except ValueError:
+        pass
+    return hashlib.sha256(template_body).hexdigest()
+
+
+def get_tag_value(tags: list[dict], key: str):
+    for tag in tags:
+        if tag["Key"] == key:
+            return tag["Value"]
+    return None
+
+
+def cfn_create_or_update(
+    StackName: str,
+    boto3_kwargs: dict,
+    waiter: Waiter = None,
+    skip_unchanged: bool = True,
+    region_name: str = None,
+):
+    """
+    Synopsis: Creates the stack, or updates it if it already exists, and waits for the operation to finish.
+    If boto3_kwargs carries a BetterCF:Fingerprint tag matching the one on a stable existing stack, the update is skipped.
+    The stack is deployed to region_name (defaults to the session's region).
+
+    Returns:
+    "created", "updated" or "unchanged".
+    """
+    client = get_client("cloudformation", region_name)
     try:
-        client = boto3.client("cloudformation")
-        client.get_template(StackName=StackName)
+        existing_stack = client.describe_stacks(StackName=StackName)["Stacks"][0]
 
-        # If get_template does not error, the stack already exists so we need to update_stack
+    # If ClientError if thrown, the stack doesn't exist yet and we need to create_stack
+    except client.exceptions.ClientError:
+        existing_stack = None
+
+    if existing_stack:
+        fingerprint = get_tag_value(boto3_kwargs.get("Tags", []), FINGERPRINT_TAG_KEY)
+        if (
+            skip_unchanged
+            and fingerprint
+            and existing_stack["StackStatus"] in STABLE_STACK_STATUSES
+            and get_tag_value(existing_stack.get("Tags", []), FINGERPRINT_TAG_KEY)
+            == fingerprint
+        ):
+            print(f"Stack '{StackName}' is unchanged. Skipping update.")
+            return "unchanged"
+
+        # The stack already exists so we need to update_stack
         print(f"Beginning CloudFormation template update for {StackName}")
         boto3_function = client.update_stack
+        operation = "updated"
         boto3_kwargs.pop("OnFailure")
         boto3_kwargs.pop("TimeoutInMinutes")
-
-    # If ClientError if thrown, the stack doesn't exist yet and we need to create_stack
-    except client.exceptions.ClientError:
+    else:
         print(f"Beginning CloudFormation template creation for {StackName}")
         boto3_function = client.create_stack
+        operation = "created"
 
-    boto3_function(**boto3_kwargs)
+    try:
+        boto3_function(**boto3_kwargs)
+    except client.exceptions.ClientError as e:
+        if operation == "updated" and "No updates are to be performed" in str(e):
+            print(f"Stack '{StackName}' is unchanged. Skipping update.")
+            return "unchanged"
+        raise
 
-    stack_state = "IN_PROGRESS"
-    while "IN_PROGRESS" in stack_state:
-        time.sleep(5)
-        stack_state = client.describe_stacks(StackName=StackName)["Stacks"][0][
-            "StackStatus"
-        ]
+    stack_state = wait_for_stack(client, StackName, waiter)
 
     if stack_state not in ["CREATE_COMPLETE", "UPDATE_COMPLETE"]:
         raise Exception(f"Stack creation failed: {stack_state}")
     else:
-        print(f"Stack '{StackName}' created/updated successfully.")
+        print(f"Stack '{StackName}' {operation} successfully.")
+        return operation
 
 
-def cfn_delete_stack(StackName: str):
-    client = boto3.client("cloudformation")
-    if len(client.describe_stacks(StackName=StackName)["Stacks"]) != 1:
+def cfn_delete_stack(
+    StackName: str,
+    waiter: Waiter = None,
+    region_name: str = None,
+    missing_ok: bool = False,
+):
+    """
+    Synopsis: Deletes the stack in region_name (defaults to the session's region) and waits for the deletion to finish.
+    The stack is described once, and then followed by its id, as a deleted stack can no longer be described by name.
+
+    Parameters:
+    - missing_ok : return "absent" instead of raising an exception if the stack doesn't exist.
+
+    Returns:
+    "deleted", or "absent".
+    """
+    client = get_client("cloudformation", region_name)
+    try:
+        stacks = client.describe_stacks(StackName=StackName)["Stacks"]
+    except client.exceptions.ClientError as e:
+        if missing_ok and "does not exist" in str(e):
+            print(f"Stack '{StackName}' does not exist. Nothing to delete.")
+            return "absent"
+        raise
+    if len(stacks) != 1:
         raise Exception(
-            f"Expected exactly one instance of {StackName} stack. Instead {len(client.describe_stacks(StackName=StackName)['Stacks'])} were found."
+            f"Expected exactly one instance of {StackName} stack. Instead {len(stacks)} were found."
         )
-    stack_id = client.describe_stacks(StackName=StackName)["Stacks"][0]["StackId"]
+    stack_id = stacks[0]["StackId"]
 
-    client.delete_stack(StackName=StackName)
-    stack_state = "IN_PROGRESS"
+    client.delete_stack(StackName=stack_id)
 
-    while "IN_PROGRESS" in stack_state:
-        time.sleep(5)
-        stack_state = client.describe_stacks(StackName=stack_id)["Stacks"][0][
-            "StackStatus"
-        ]
+    stack_state = wait_for_stack(client, stack_id, waiter)
     if stack_state in ["DELETE_COMPLETE"]:
         print(f"Stack '{StackName}' deleted successfully.")
+        return "deleted"
     else:
         raise Exception(f"Stack deletion failed: {stack_state}")
 
@@ -0,0 +1,234 @@
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from bettercf.override import compile_overrides
+from bettercf.region import Region
+from bettercf.results import BatchResult, summarise
+from bettercf.utils import is_non_empty_string
+
+OUTPUT_FORMATS = ["text", "json"]
+
+# Below this many configs, starting worker processes costs more than validating them all in this one.
+PARALLEL_VALIDATION_THRESHOLD = 1000
+
+VERSION_PATTERN = re.compile(r"^\d+\.\d+(\.\d+)?$")
+REGION_NAMES = frozenset(name for _, name, _ in Region.AWS_REGIONS_MAPPING)
+
+# Each rule is (check, description of the values the check accepts).
+NON_EMPTY_STRING = (is_non_empty_string, "a non-empty string")
+NON_EMPTY_STRING_OR_NULL = (
+    lambda value: value is None or is_non_empty_string(value),
+    "a non-empty string or null",
+)
+VERSION_STRING = (
+    lambda value: type(value) == str and VERSION_PATTERN.match(value) is not None,
+    "a version of the 'X.Y' or 'X.Y.Z' format",
+)
+REGION_NAMES_OR_LIST = (
+    lambda value: (type(value) == str and value in REGION_NAMES)
+    or (
+        type(value) == list
+        and len(value) > 0
+        and len(set(value)) == len(value)
+        and all(type(item) == str and item in REGION_NAMES for item in value)
+    ),
+    "an AWS region name, e.g 'eu-west-2', or a non-empty list of distinct AWS region names",
+)
+DICT_OR_NULL = (
+    lambda value: value is None or type(value) == dict,
+    "a dictionary or null",
+)
+NON_EMPTY_STRING_LIST = (
+    lambda value: type(value) == list
+    and all(is_non_empty_string(item) for item in value)
+    and len(set(value)) == len(value),
+    "a list of distinct non-empty strings",
+)
+
+# Every key is required, unless it is in OPTIONAL_STACK_CONFIG_KEYS. Nested dicts are objects with their own required keys.
+STACK_CONFIG_SCHEMA = {
+    "Version": VERSION_STRING,
+    "Template": {"Name": NON_EMPTY_STRING, "Version": VERSION_STRING},
+    "EnvType": NON_EMPTY_STRING,
+    "Region": REGION_NAMES_OR_LIST,
+    "Identifier": NON_EMPTY_STRING,
+    "RoleArn": NON_EMPTY_STRING_OR_NULL,
+    "TemplateParameters": DICT_OR_NULL,
+    "ResourceOverrides": DICT_OR_NULL,
+    # Paths, relative to the config, of the stack configs this one must be deployed after.
+    "DependsOn": NON_EMPTY_STRING_LIST,
+}
+OPTIONAL_STACK_CONFIG_KEYS = frozenset(["DependsOn"])
+
+
+class CompiledSchema:
+    """
+    Synopsis: A schema (as STACK_CONFIG_SCHEMA) compiled once into flat tuples, so validating each config is a single pass
+    with no per-config set up.
+    """
+
+    def __init__(self, schema: dict, path: str = "", optional_keys=frozenset()):
+        self.path = path
+        self.keys = tuple(key for key in schema if key not in optional_keys)
+        self.key_set = frozenset(schema)
+        self.rules = tuple(
+            (key, f"{path}{key}", rule)
+            for key, rule in schema.items()
+            if not isinstance(rule, dict)
+        )
+        self.children = tuple(
+            (key, CompiledSchema(rule, f"{path}{key}."))
+            for key, rule in schema.items()
+            if isinstance(rule, dict)
+        )
+
+    def validate(self, config, errors: list):
+        """
+        Synopsis: Appends a message to errors for every problem found in config, rather than stopping at the first.
+        """
+        for key in config:
+            if key not in self.key_set:
+                errors.append(f"Unexpected key '{self.path}{key}'.")
+        for key in self.keys:
+            if key not in config:
+                errors.append(f"Missing required key '{self.path}{key}'.")
+        for key, key_path, (check, description) in self.rules:
+            if key in config and not check(config[key]):
+                errors.append(
+                    f"'{key_path}' value {json.dumps(config[key])} must be {description}."
+                )
+        for key, child in self.children:
+            if key not in config:
+                continue
+            if type(config[key]) != dict:
+                errors.append(
+                    f"'{child.path[:-1]}' value {json.dumps(config[key])} must be a dictionary."
+                )
+                continue
+            child.validate(config[key], errors)
+        return errors
+
+
+COMPILED_STACK_CONFIG_SCHEMA = CompiledSchema(
+    STACK_CONFIG_SCHEMA, optional_keys=OPTIONAL_STACK_CONFIG_KEYS
+)
+
+
+def validate_stack_config(stack_config_dict):
+    """
+    Synopsis: Validates a parsed stack config without any AWS calls.
+
+    Returns:
+    A list of error messages. Empty if the config is valid.
+    """
+    if type(stack_config_dict) != dict:
+        return ["A stack config must be a JSON object."]
+    errors = COMPILED_STACK_CONFIG_SCHEMA.validate(stack_config_dict, [])
+    if type(stack_config_dict.get("ResourceOverrides")) == dict:
+        try:
+            compile_overrides(stack_config_dict["ResourceOverrides"])
+        except Exception as e:
+            errors.append(f"'ResourceOverrides' are invalid: {e}")
+    return errors
+
+
+@dataclass
+class StackConfigValidationResult(BatchResult):
+    """
+    Synopsis: The outcome of validating a single stack config file.
+    """
+
+    config_path: Path
+    errors: list[str] = field(default_factory=list)
+
+    @property
+    def name(self):
+        return str(self.config_path)
+
+    @property
+    def status(self):
+        return "invalid" if self.errors else "valid"
+
+    @property
+    def error(self):
+        return "; ".join(self.errors) or None
+
+    def unsuccessful_report(self):
+        return "\n".join(
+            [f"  INVALID {self.config_path}"]
+            + [f"    - {error}" for error in self.errors]
+        )
+
+    def to_dict(self):
+        return {
+            "ConfigPath": str(self.config_path),
+            "Valid": self.succeeded,
+            "Errors": self.errors,
+        }
+
+
+def validate_stack_config_file(config_path: Path):
+    """
+    Synopsis: Reads and validates one stack config file, reporting unreadable or malformed files as errors instead of raising them.
+    """
+    try:
+        stack_config_dict = json.loads(Path(config_path).read_bytes())
+    except (OSError, ValueError) as e:
+        return StackConfigValidationResult(config_path, [f"Could not read: {e}"])
+    return StackConfigValidationResult(
+        config_path, validate_stack_config(stack_config_dict)
+    )
+
+
+def validate_stack_configs(config_paths: list[Path], max_parallel: int = None):
+    """
+    Synopsis: Validates many stack config files, spread over worker processes when there are enough of them to be worth it.
+
+    Parameters:
+    - config_paths : the stack config files to validate.
+    - max_parallel : the maximum number of worker processes. Defaults to the number of CPUs. 1 validates everything in this process.
+
+    Returns:
+    A list of StackConfigValidationResult, in the order of config_paths.
+    """
+    if max_parallel is not None and max_parallel < 1:
+        raise Exception(f"max_parallel must be at least 1. Got {max_parallel}.")
+    max_parallel = max_parallel or os.cpu_count() or 1
+    if max_parallel == 1 or len(config_paths) < PARALLEL_VALIDATION_THRESHOLD:
+        return [validate_stack_config_file(config_path) for config_path in config_paths]
+
+    # Large chunks keep the cost of passing work between processes low compared to validating it.
+    chunk_size = max(1, len(config_paths) // (max_parallel * 4))
+    with ProcessPoolExecutor(max_workers=max_parallel) as executor:
+        return list(
+            executor.map(validate_stack_config_file, config_paths, chunksize=chunk_size)
+        )
+
+
+def summarise_validation_results(
+    results: list[StackConfigValidationResult], output_format: str = "text"
+):
+    """
+    Synopsis: Prints every error in every invalid config, either as text or (for tooling) as a JSON document,
+    and returns the combined exit code (0 if every config is valid, otherwise 1).
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise Exception(
+            f"Output format must be one of {OUTPUT_FORMATS}. Got '{output_format}'."
+        )
+    if output_format == "text":
+        return summarise(
+            results, "stack config(s)", "valid", unsuccessful_status="invalid"
+        )
+    valid = all(result.succeeded for result in results)
+    print(
+        json.dumps(
+            {"Valid": valid, "Results": [result.to_dict() for result in results]},
+            indent=2,
+        )
+    )
+    return 0 if valid else 1
@@ -1,76 +1,169 @@
 import re
 
+# Compiled once. The micro group is None for versions of the 'X.Y' format.
+VERSION_PATTERN = re.compile(r"(\d+)\.(\d+)(?:\.(\d+))?")
+MAJOR_MINOR_PATTERN = re.compile(r"(\d+)\.(\d+)")
+MAJOR_MINOR_MICRO_PATTERN = re.compile(r"(\d+)\.(\d+)\.(\d+)")
 
-class Version:
-    def __init__(self, version_string: str):
-        try:
-            parsed_version = self.major_minor_micro(version_string)
-            self.major = parsed_version[0]
-            self.minor = parsed_version[1]
-            self.micro = parsed_version[2]
-        except Exception:
-            # Not of maj.min.mic format. Try the other format.
-            try:
-                parsed_version = self.major_minor(version_string)
-                self.major = parsed_version[0]
-                self.minor = parsed_version[1]
-            except Exception:
-                raise Exception(
-                    f"Version '{version_string};' is not of the 'X.Y' or 'X.Y.Z' format."
-                )
+# Sorts an 'X.Y' version just before the matching 'X.Y.0'.
+NO_MICRO = -1
+
+
+class Version(tuple):
+    """
+    Synopsis: An immutable 'X.Y' or 'X.Y.Z' version.
+    A Version is a (major, minor, micro) tuple, with micro NO_MICRO for 'X.Y' versions. So Versions are compact, hashable
+    and ordered natively, with an 'X.Y' version sorting just before 'X.Y.0' so both formats can be compared and sorted together.
+    Incrementing returns a new Version.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, version_string: str):
+        match = (
+            VERSION_PATTERN.fullmatch(version_string)
+            if type(version_string) == str
+            else None
+        )
+        if not match:
+            raise Exception(
+                f"Version '{version_string}' is not of the 'X.Y' or 'X.Y.Z' format."
+            )
+        major, minor, micro = match.groups()
+        return tuple.__new__(
+            cls, (int(major), int(minor), NO_MICRO if micro is None else int(micro))
+        )
+
+    @classmethod
+    def from_parts(cls, major: int, minor: int, micro: int = None):
+        return tuple.__new__(cls, (major, minor, NO_MICRO if micro is None else micro))
+
+    def __reduce__(self):
+        # Pickling (e.g for worker processes) and copying would otherwise pass the tuple, rather than a string, to __new__.
+        return (Version, (self.get_version_string(),))
+
+    @property
+    def major(self):
+        return self[0]
+
+    @property
+    def minor(self):
+        return self[1]
+
+    @property
+    def micro(self):
+        # Like an unset attribute, so hasattr(version, "micro") is False for 'X.Y' versions.
+        if self[2] == NO_MICRO:
+            raise AttributeError(f"Version '{self}' has no micro version.")
+        return self[2]
+
+    def has_micro(self):
+        return self[2] != NO_MICRO
+
+    def sort_key(self):
+        return tuple(self)
+
+    def __repr__(self):
+        return f"Version('{self.get_version_string()}')"
+
+    def __str__(self):
+        return self.get_version_string()
 
     def major_version_increment(self):
-        self.major += 1
-        self.minor = 0
-        if hasattr(self, "micro"):
-            self.micro = 0
+        return Version.from_parts(self.major + 1, 0, 0 if self.has_micro() else None)
 
     def minor_version_increment(self):
-        self.minor += 1
-        if hasattr(self, "micro"):
-            self.micro = 0
+        return Version.from_parts(
+            self.major, self.minor + 1, 0 if self.has_micro() else None
+        )
 
     def micro_version_increment(self):
-        self.micro += 1
+        if not self.has_micro():
+            raise Exception(
+                "Attempting to do a micro version increment for a version without a micro"
+            )
+        return Version.from_parts(self.major, self.minor, self.micro + 1)
 
     def auto_increment_version(
         self, major_increment: bool = False, micro_increment: bool = False
     ):
+        """
+        Synopsis: Returns the next version: the next minor version by default, otherwise the next major or micro version.
+        """
         if major_increment and micro_increment:
             raise Exception(
                 "Cannot specify a major AND micro version increment at the same time."
             )
-
-        if micro_increment and not hasattr(self, "micro"):
-            raise Exception(
-                "Attempting to do a micro version increment for a version without a micro"
-            )
         if major_increment:
-            self.major_version_increment()
+            return self.major_version_increment()
         elif micro_increment:
-            self.micro_version_increment()
-        else:
-            self.minor_version_increment()
+            return self.micro_version_increment()
+        return self.minor_version_increment()
 
     # TODO support other versioning syntax? E.g vX.Y?
     def get_version_string(self):
-        to_return = [str(self.major), str(self.minor)]
-        if hasattr(self, "micro"):
-            to_return.append(str(self.micro))
-        return ".".join(to_return)
+        major, minor, micro = self
+        if micro == NO_MICRO:
+            return f"{major}.{minor}"
+        return f"{major}.{minor}.{micro}"
 
     @staticmethod
     def major_minor_micro(version):
-        try:
-            major, minor, micro = re.search(r"^(\d+)\.(\d+)\.(\d+)$", version).groups()
-            return int(major), int(minor), int(micro)
-        except Exception:
+        match = (
+            MAJOR_MINOR_MICRO_PATTERN.fullmatch(version)
+            if type(version) == str
+            else None
+        )
+        if not match:
             raise Exception(f"{version} is not a recognizable version.")
+        major, minor, micro = match.groups()
+        return int(major), int(minor), int(micro)
 
     @staticmethod
     def major_minor(version):
-        try:
-            major, minor = re.search(r"^(\d+)\.(\d+)$", version).groups()
-            return int(major), int(minor)
-        except Exception:
+        match = MAJOR_MINOR_PATTERN.fullmatch(version) if type(version) == str else None
+        if not match:
             raise Exception(f"{version} is not a recognizable version.")
+        major, minor = match.groups()
+        return int(major), int(minor)
+
+
+def version_sort_key(version_string: str):
+    """
+    Synopsis: Sort key for version strings. A Version is its own sort key.
+    """
+    return Version(version_string)
+
+
+def get_latest_version(versions: list[str], prefix: str = ""):
+    """
+    Synopsis: Parses the versions and picks the latest in a single pass. 'X.Y' and 'X.Y.Z' versions can be mixed.
+
+    Parameters:
+    - versions : version strings, or S3 keys of template versions (e.g 'foo/0.1') when prefix is given.
+    - prefix : removed from the start of every version (e.g 'foo/'). Versions without it are an error.
+
+    Returns:
+    The latest version, as given (including any prefix).
+    """
+    fullmatch = VERSION_PATTERN.fullmatch
+    prefix_length = len(prefix)
+    latest = None
+    latest_key = None
+    for version in versions:
+        match = (
+            fullmatch(version, prefix_length)
+            if type(version) == str and version.startswith(prefix)
+            else None
+        )
+        if not match:
+            raise Exception(
+                f"Version '{version}' is not of the '{prefix}X.Y' or '{prefix}X.Y.Z' format."
+            )
+        major, minor, micro = match.groups()
+        key = (int(major), int(minor), NO_MICRO if micro is None else int(micro))
+        if latest_key is None or key > latest_key:
+            latest, latest_key = version, key
+    if latest is None:
+        raise Exception("No versions to choose the latest from.")
+    return latest
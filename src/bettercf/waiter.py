@@ -0,0 +1,269 @@
+import os
+import random
+import threading
+import time
+
+# Every status a stack can be in while an operation on it is still running.
+IN_PROGRESS_STACK_STATUSES = [
+    "CREATE_IN_PROGRESS",
+    "ROLLBACK_IN_PROGRESS",
+    "DELETE_IN_PROGRESS",
+    "UPDATE_IN_PROGRESS",
+    "UPDATE_COMPLETE_CLEANUP_IN_PROGRESS",
+    "UPDATE_ROLLBACK_IN_PROGRESS",
+    "UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS",
+    "REVIEW_IN_PROGRESS",
+    "IMPORT_IN_PROGRESS",
+    "IMPORT_ROLLBACK_IN_PROGRESS",
+]
+
+
+class Waiter:
+    """
+    Synopsis:
+        Polls until a result is terminal, backing off exponentially between polls.
+        The first poll happens straight away so operations that finish quickly return without sleeping.
+        After that, the delay starts at initial_delay, is multiplied by backoff after every poll up to max_delay,
+        and has up to +/- jitter (a fraction of the delay) applied so many waiters don't poll in lock step.
+
+    Parameters:
+    - initial_delay : in seconds. Defaults to BETTERCF_WAITER_INITIAL_DELAY, else 2.
+    - max_delay : in seconds. Defaults to BETTERCF_WAITER_MAX_DELAY, else 30.
+    - backoff : what the delay is multiplied by after each poll. Defaults to BETTERCF_WAITER_BACKOFF, else 1.5.
+    - jitter : a fraction of the delay. Defaults to BETTERCF_WAITER_JITTER, else 0.1.
+    - timeout : in seconds. Defaults to BETTERCF_WAITER_TIMEOUT, else no timeout.
+    - clock / sleep / random : injectable for testing. Default to time.monotonic, time.sleep and random.random.
+    """
+
+    def __init__(
+        self,
+        initial_delay: float = None,
+        max_delay: float = None,
+        backoff: float = None,
+        jitter: float = None,
+        timeout: float = None,
+        clock=time.monotonic,
+        sleep=time.sleep,
+        random=random.random,
+    ):
+        self.initial_delay = _from_env(
+            initial_delay, "BETTERCF_WAITER_INITIAL_DELAY", 2
+        )
+        self.max_delay = _from_env(max_delay, "BETTERCF_WAITER_MAX_DELAY", 30)
+        self.backoff = _from_env(backoff, "BETTERCF_WAITER_BACKOFF", 1.5)
+        self.jitter = _from_env(jitter, "BETTERCF_WAITER_JITTER", 0.1)
+        self.timeout = _from_env(timeout, "BETTERCF_WAITER_TIMEOUT", None)
+        self.clock = clock
+        self.sleep = sleep
+        self.random = random
+
+        if self.initial_delay < 0 or self.max_delay < self.initial_delay:
+            raise Exception(
+                f"Waiter delays must satisfy 0 <= initial_delay ({self.initial_delay}) <= max_delay ({self.max_delay})."
+            )
+        if self.backoff < 1:
+            raise Exception(f"Waiter backoff ({self.backoff}) must be at least 1.")
+        if not 0 <= self.jitter < 1:
+            raise Exception(f"Waiter jitter ({self.jitter}) must be in [0, 1).")
+
+    def delays(self):
+        """
+        Synopsis: Yields the (jittered) delay to sleep before each poll after the first.
+        """
+        delay = self.initial_delay
+        while True:
+            yield delay * (1 + self.jitter * (2 * self.random() - 1))
+            delay = min(delay * self.backoff, self.max_delay)
+
+    def wait(self, poll, is_terminal):
+        """
+        Synopsis: Calls poll() until is_terminal(result) is true, then returns that result.
+        Raises an exception if the timeout would be exceeded before the next poll.
+        """
+        start = self.clock()
+        delays = self.delays()
+        while True:
+            result = poll()
+            if is_terminal(result):
+                return result
+            delay = next(delays)
+            if self.timeout is not None and self.clock() - start + delay > self.timeout:
+                raise Exception(
+                    f"Timed out after {self.clock() - start:.0f}s waiting. Last result: {result}"
+                )
+            self.sleep(delay)
+
+
+class StackWatch:
+    """
+    Synopsis: A stack being waited on through a StackStatusPoller. done is set once status (or error) is known.
+    next_poll is when the stack is next due a refresh, on the schedule of its own delays.
+    """
+
+    def __init__(self, stack: str, delays, next_poll: float):
+        self.stack = stack
+        self.delays = delays
+        self.next_poll = next_poll
+        self.status = None
+        self.error = None
+        self.done = threading.Event()
+
+    def finish(self, status: str = None, error: Exception = None):
+        self.status = status
+        self.error = error
+        self.done.set()
+
+
+class StackStatusPoller:
+    """
+    Synopsis:
+        Tracks every stack waited on in the process and refreshes them all together, so the number of CloudFormation calls
+        per poll doesn't grow with the number of stacks deploying at once.
+        Each tick lists the in-progress stacks once per client (i.e per region) with a paginated ListStacks.
+        A watched stack that is no longer listed has finished, and is described once to read its final status.
+        Every stack keeps the backoff of a single Waiter: it is first due straight away, then after each of the waiter's delays.
+        A tick happens whenever any watched stack is due, and refreshes them all, so quick operations still finish
+        in seconds while long ones are polled less and less often.
+        Ticks run on a background thread while any stack is watched.
+
+    Parameters:
+    - waiter : the Waiter whose delays (and timeout) each stack is polled with. Defaults to Waiter(), i.e configured
+      by the BETTERCF_WAITER_* environment variables. Its clock is used to schedule ticks.
+    """
+
+    def __init__(self, waiter: Waiter = None):
+        self.waiter = waiter or Waiter()
+        self._condition = threading.Condition()
+        self._watches = {}
+        self._thread = None
+
+    def watch(self, client, stack: str):
+        """
+        Synopsis: Starts watching a stack (by name or id) through client, and returns its StackWatch.
+        """
+        stack_watch = StackWatch(stack, self.waiter.delays(), self.waiter.clock())
+        with self._condition:
+            self._watches.setdefault(client, []).append(stack_watch)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="bettercf-stack-poller", daemon=True
+                )
+                self._thread.start()
+            # The new stack is due straight away, so wake the thread if it is waiting for a later tick.
+            self._condition.notify()
+        return stack_watch
+
+    def wait(self, client, stack: str):
+        """
+        Synopsis: Blocks until a stack (by name or id) leaves every *_IN_PROGRESS state, then returns its status.
+        Raises an exception if the timeout is exceeded or the stack can't be polled.
+        """
+        stack_watch = self.watch(client, stack)
+        if not stack_watch.done.wait(self.waiter.timeout):
+            self._forget(client, [stack_watch])
+            raise Exception(
+                f"Timed out after {self.waiter.timeout:.0f}s waiting for stack '{stack}'."
+            )
+        if stack_watch.error is not None:
+            raise stack_watch.error
+        return stack_watch.status
+
+    def seconds_until_next_tick(self):
+        """
+        Returns:
+        The seconds until the first watched stack is due (0 if one already is), or None if no stack is watched.
+        """
+        with self._condition:
+            return self._seconds_until_next_tick()
+
+    def _seconds_until_next_tick(self):
+        next_polls = [
+            stack_watch.next_poll
+            for stack_watches in self._watches.values()
+            for stack_watch in stack_watches
+        ]
+        if not next_polls:
+            return None
+        return max(0.0, min(next_polls) - self.waiter.clock())
+
+    def tick(self):
+        """
+        Synopsis: Refreshes every watched stack, finishing the watches of those no longer in progress.
+        Each stack that was due is then scheduled after its next delay.
+        """
+        now = self.waiter.clock()
+        with self._condition:
+            watches = {
+                client: list(stack_watches)
+                for client, stack_watches in self._watches.items()
+            }
+        for client, stack_watches in watches.items():
+            try:
+                in_progress = {}
+                for page in client.get_paginator("list_stacks").paginate(
+                    StackStatusFilter=IN_PROGRESS_STACK_STATUSES
+                ):
+                    for summary in page["StackSummaries"]:
+                        # Watches may use either. Only one live stack can have a given name in a region.
+                        in_progress[summary["StackId"]] = summary["StackStatus"]
+                        in_progress[summary["StackName"]] = summary["StackStatus"]
+            except Exception as e:
+                finished = stack_watches
+                for stack_watch in stack_watches:
+                    stack_watch.finish(error=e)
+            else:
+                finished = []
+                for stack_watch in stack_watches:
+                    if stack_watch.stack not in in_progress:
+                        try:
+                            status = client.describe_stacks(
+                                StackName=stack_watch.stack
+                            )["Stacks"][0]["StackStatus"]
+                        except Exception as e:
+                            stack_watch.finish(error=e)
+                            finished.append(stack_watch)
+                            continue
+                        # Not listed yet (ListStacks is eventually consistent), so keep watching until it is.
+                        if "IN_PROGRESS" not in status:
+                            stack_watch.finish(status)
+                            finished.append(stack_watch)
+                            continue
+                    if stack_watch.next_poll <= now:
+                        stack_watch.next_poll = now + next(stack_watch.delays)
+            self._forget(client, finished)
+
+    def _forget(self, client, stack_watches: list):
+        with self._condition:
+            remaining = [
+                stack_watch
+                for stack_watch in self._watches.get(client, [])
+                if stack_watch not in stack_watches
+            ]
+            if remaining:
+                self._watches[client] = remaining
+            else:
+                self._watches.pop(client, None)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    delay = self._seconds_until_next_tick()
+                    if delay is None:
+                        self._thread = None
+                        return
+                    if delay <= 0:
+                        break
+                    self._condition.wait(delay)
+            self.tick()
+
+
+def _from_env(value, env_var: str, default):
+    if value is not None:
+        return value
+    if env_var in os.environ:
+        return float(os.environ[env_var])
+    return default
+
+
+stack_status_poller = StackStatusPoller()
@@ -77,4 +77,29 @@ def original_resource_dict_string_and_int():
         "Int" : 123,
         "None" : None
     }
-    yield original_resource_dict_string_and_int
\ No newline at end of file
+    yield original_resource_dict_string_and_int
+
+@pytest.fixture(autouse=True)
+def isolated_bettercf_cache(monkeypatch, tmp_path):
+    '''
+    Points BetterCF's local caches at a temporary directory and clears the process-wide caches so tests can't leak state into each other.
+    '''
+    from bettercf.cache import management_bucket_cache
+
+    monkeypatch.setenv("BETTERCF_CACHE_DIR", str(tmp_path.joinpath("bettercf-cache")))
+    monkeypatch.delenv("BETTERCF_BUCKET_CACHE_TTL", raising=False)
+    management_bucket_cache.invalidate()
+    yield
+    management_bucket_cache.invalidate()
+
+
+@pytest.fixture(autouse=True)
+def fresh_boto3_clients():
+    '''
+    Drops the shared boto3 clients between tests so each test resolves the credentials its moto mocks set up.
+    '''
+    from bettercf.clients import configure_clients
+
+    configure_clients()
+    yield
+    configure_clients()
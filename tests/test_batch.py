@@ -0,0 +1,477 @@
+import json
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import boto3
+import pytest
+from moto import mock_cloudformation, mock_s3
+
+from bettercf.batch import (
+    delete_stacks,
+    deploy_stacks,
+    load_push_manifest,
+    load_stack_graph,
+    push_templates,
+    summarise_push_results,
+    summarise_results,
+)
+from bettercf.paths import resolve_stack_config_paths
+from bettercf.stack import Stack
+from bettercf.template_index import TemplateIndex
+
+STACK_CONFIGS_PATH = Path(__file__).parent.joinpath("test_stack_configs")
+
+
+@pytest.fixture(autouse=True)
+def fail_on_dfm_config_load(monkeypatch):
+    # Deploying never builds, so it should never load the dfm config.
+    def unexpected_load(**kwargs):
+        raise Exception("The dfm config should not be loaded when deploying.")
+
+    monkeypatch.setattr(
+        "bettercf.template.BuildConfig.load_config_from_file", unexpected_load
+    )
+
+
+@pytest.fixture
+def stack_config_dir(tmp_path):
+    for identifier in ["one", "two", "three"]:
+        config = (STACK_CONFIGS_PATH / "config.json").read_text()
+        (tmp_path / f"config_{identifier}.json").write_text(
+            config.replace('"bar"', f'"{identifier}"')
+        )
+    yield tmp_path
+
+
+class TestBatch:
+    def test_resolve_stack_config_paths_single_file(self):
+        config_path = STACK_CONFIGS_PATH / "config.json"
+        assert resolve_stack_config_paths(str(config_path)) == [config_path]
+
+    def test_resolve_stack_config_paths_directory(self, stack_config_dir):
+        assert [
+            path.name for path in resolve_stack_config_paths(str(stack_config_dir))
+        ] == [
+            "config_one.json",
+            "config_three.json",
+            "config_two.json",
+        ]
+
+    def test_resolve_stack_config_paths_glob(self, stack_config_dir):
+        assert [
+            path.name
+            for path in resolve_stack_config_paths(str(stack_config_dir / "*_t*.json"))
+        ] == ["config_three.json", "config_two.json"]
+
+    def test_resolve_stack_config_paths_no_match(self, tmp_path):
+        with pytest.raises(Exception):
+            resolve_stack_config_paths(str(tmp_path / "*.json"))
+
+    def test_deploy_stacks_failure_does_not_stop_others(
+        self, monkeypatch, stack_config_dir
+    ):
+        def mock_deploy(self, force=False):
+            if self.identifier == "two":
+                raise Exception("boom")
+            return "created"
+
+        monkeypatch.setattr(Stack, "deploy", mock_deploy)
+
+        reported = []
+        results = deploy_stacks(
+            resolve_stack_config_paths(str(stack_config_dir)),
+            max_parallel=2,
+            on_result=lambda result, completed, total: reported.append(
+                (completed, total)
+            ),
+        )
+
+        statuses = {result.stack_name: result.status for result in results}
+        assert statuses == {
+            "foo-prod-euw2-one": "created",
+            "foo-prod-euw2-two": "failed",
+            "foo-prod-euw2-three": "created",
+        }
+        assert sorted(reported) == [(1, 3), (2, 3), (3, 3)]
+        assert summarise_results(results) == 1
+
+    def test_deploy_stacks_bad_config_is_reported(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(Stack, "deploy", lambda self, force=False: "created")
+        shutil.copy(STACK_CONFIGS_PATH / "config.json", tmp_path / "good.json")
+        shutil.copy(
+            STACK_CONFIGS_PATH / "config_incomplete.json", tmp_path / "bad.json"
+        )
+
+        results = deploy_stacks(
+            resolve_stack_config_paths(str(tmp_path)), on_result=lambda *args: None
+        )
+
+        failed = [result for result in results if not result.succeeded]
+        assert len(failed) == 1
+        assert failed[0].stack_name == str(tmp_path / "bad.json")
+        assert failed[0].error
+
+    def test_deploy_stacks_respects_max_parallel(self, monkeypatch, stack_config_dir):
+        in_flight = 0
+        max_in_flight = 0
+        lock = threading.Lock()
+
+        def mock_deploy(self, force=False):
+            nonlocal in_flight, max_in_flight
+            with lock:
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+            time.sleep(0.05)
+            with lock:
+                in_flight -= 1
+            return "updated"
+
+        monkeypatch.setattr(Stack, "deploy", mock_deploy)
+
+        results = deploy_stacks(
+            resolve_stack_config_paths(str(stack_config_dir)),
+            max_parallel=2,
+            on_result=lambda *args: None,
+        )
+
+        assert max_in_flight == 2
+        assert summarise_results(results) == 0
+
+    def test_deploy_stacks_invalid_max_parallel(self):
+        with pytest.raises(Exception):
+            deploy_stacks([], max_parallel=0)
+
+    def test_deploy_stacks_to_regions(self, monkeypatch, capsys):
+        def mock_deploy(self, force=False):
+            if self.region.name == "us-east-1":
+                raise Exception("boom")
+            return "created"
+
+        monkeypatch.setattr(Stack, "deploy", mock_deploy)
+
+        results = deploy_stacks(
+            [STACK_CONFIGS_PATH / "config.json"],
+            max_parallel=3,
+            regions=["eu-west-1", "eu-west-2", "us-east-1"],
+            on_result=lambda *args: None,
+        )
+
+        assert {
+            result.stack_name: (result.region, result.status) for result in results
+        } == {
+            "foo-prod-euw1-bar": ("eu-west-1", "created"),
+            "foo-prod-euw2-bar": ("eu-west-2", "created"),
+            "foo-prod-use1-bar": ("us-east-1", "failed"),
+        }
+        assert summarise_results(results) == 1
+        output = capsys.readouterr().out
+        assert "eu-west-1: 1 succeeded, 0 failed." in output
+        assert "us-east-1: 0 succeeded, 1 failed." in output
+
+
+def write_stack_config(directory: Path, identifier: str, depends_on=None, **overrides):
+    config = json.loads((STACK_CONFIGS_PATH / "config.json").read_text())
+    config.update(Identifier=identifier, **overrides)
+    if depends_on is not None:
+        config["DependsOn"] = depends_on
+    path = directory / f"{identifier}.json"
+    path.write_text(json.dumps(config))
+    return path
+
+
+class TestDeployStacksInDependencyOrder:
+    @pytest.fixture
+    def failing(self):
+        return set()
+
+    @pytest.fixture
+    def deployed(self, monkeypatch, failing):
+        deployed = []
+        lock = threading.Lock()
+
+        def mock_deploy(self, force=False):
+            time.sleep(0.01)
+            if self.identifier in failing:
+                raise Exception("boom")
+            with lock:
+                deployed.append((self.identifier, self.region.name))
+            return "created"
+
+        monkeypatch.setattr(Stack, "deploy", mock_deploy)
+        return deployed
+
+    def test_dependencies_deploy_first(self, deployed, tmp_path):
+        write_stack_config(tmp_path, "vpc")
+        write_stack_config(tmp_path, "db", ["vpc.json"])
+        (tmp_path / "apps").mkdir()
+        write_stack_config(tmp_path / "apps", "app", ["../db.json", "../vpc.json"])
+
+        results = deploy_stacks(
+            resolve_stack_config_paths(str(tmp_path)),
+            max_parallel=3,
+            on_result=lambda *args: None,
+        )
+
+        assert [identifier for identifier, _ in deployed] == ["vpc", "db", "app"]
+        assert summarise_results(results) == 0
+
+    def test_failure_skips_dependents(self, deployed, failing, tmp_path, capsys):
+        failing.add("db")
+        write_stack_config(tmp_path, "vpc")
+        write_stack_config(tmp_path, "db", ["vpc.json"])
+        write_stack_config(tmp_path, "app", ["db.json"])
+        write_stack_config(tmp_path, "logs")
+
+        results = deploy_stacks(
+            resolve_stack_config_paths(str(tmp_path)),
+            max_parallel=2,
+            on_result=lambda *args: None,
+        )
+
+        assert {result.stack_name: result.status for result in results} == {
+            "foo-prod-euw2-vpc": "created",
+            "foo-prod-euw2-db": "failed",
+            "foo-prod-euw2-app": "skipped",
+            "foo-prod-euw2-logs": "created",
+        }
+        assert summarise_results(results) == 1
+        output = capsys.readouterr().out
+        assert "2 of 4 stack(s) succeeded, 1 failed, 1 skipped." in output
+        assert (
+            "SKIPPED foo-prod-euw2-app: Skipped as 'foo-prod-euw2-db' failed." in output
+        )
+
+    def test_dependencies_are_per_region(self, deployed, tmp_path):
+        write_stack_config(tmp_path, "vpc", Region=["eu-west-1", "eu-west-2"])
+        write_stack_config(
+            tmp_path, "app", ["vpc.json"], Region=["eu-west-1", "eu-west-2"]
+        )
+        # Only deployed to one region, so every region's app waits for it.
+        write_stack_config(tmp_path, "dns", Region="us-east-1")
+        write_stack_config(tmp_path, "cdn", ["dns.json"], Region="eu-west-2")
+
+        graph, _ = load_stack_graph(resolve_stack_config_paths(str(tmp_path)))
+        dependencies = {
+            (node[0].stem, node[1]): [
+                (dependency[0].stem, dependency[1]) for dependency in node_dependencies
+            ]
+            for node, node_dependencies in graph.dependencies.items()
+        }
+        assert dependencies == {
+            ("app", "eu-west-1"): [("vpc", "eu-west-1")],
+            ("app", "eu-west-2"): [("vpc", "eu-west-2")],
+            ("cdn", "eu-west-2"): [("dns", "us-east-1")],
+            ("dns", "us-east-1"): [],
+            ("vpc", "eu-west-1"): [],
+            ("vpc", "eu-west-2"): [],
+        }
+
+    def test_cycle_deploys_nothing(self, deployed, tmp_path):
+        write_stack_config(tmp_path, "db", ["app.json"])
+        write_stack_config(tmp_path, "app", ["db.json"])
+
+        with pytest.raises(Exception, match="cycle"):
+            deploy_stacks(resolve_stack_config_paths(str(tmp_path)))
+        assert deployed == []
+
+    def test_missing_dependency_fails_config(self, deployed, tmp_path):
+        write_stack_config(tmp_path, "app", ["vpc.json"])
+
+        results = deploy_stacks([tmp_path / "app.json"], on_result=lambda *args: None)
+
+        assert [result.status for result in results] == ["failed"]
+        assert "'vpc.json', which isn't a stack config file" in results[0].error
+        assert deployed == []
+
+    def test_dependency_outside_batch_is_not_waited_for(self, deployed, tmp_path):
+        write_stack_config(tmp_path, "vpc")
+        write_stack_config(tmp_path, "app", ["vpc.json"])
+
+        deploy_stacks([tmp_path / "app.json"], on_result=lambda *args: None)
+
+        assert deployed == [("app", "eu-west-2")]
+
+
+class TestDeleteStacks:
+    @pytest.fixture
+    def failing(self):
+        return set()
+
+    @pytest.fixture
+    def deleted(self, monkeypatch, failing):
+        deleted = []
+        lock = threading.Lock()
+
+        def mock_delete(self):
+            time.sleep(0.01)
+            if self.identifier in failing:
+                raise Exception("boom")
+            with lock:
+                deleted.append(self.identifier)
+            return "deleted"
+
+        monkeypatch.setattr(Stack, "delete", mock_delete)
+        return deleted
+
+    def test_dependents_are_deleted_first(self, deleted, tmp_path):
+        write_stack_config(tmp_path, "vpc")
+        write_stack_config(tmp_path, "db", ["vpc.json"])
+        write_stack_config(tmp_path, "app", ["db.json", "vpc.json"])
+
+        results = delete_stacks(
+            resolve_stack_config_paths(str(tmp_path)),
+            max_parallel=3,
+            on_result=lambda *args: None,
+        )
+
+        assert deleted == ["app", "db", "vpc"]
+        assert summarise_results(results) == 0
+
+    def test_failure_keeps_what_it_depends_on(self, deleted, failing, tmp_path):
+        failing.add("app")
+        write_stack_config(tmp_path, "vpc")
+        write_stack_config(tmp_path, "db", ["vpc.json"])
+        write_stack_config(tmp_path, "app", ["db.json"])
+        write_stack_config(tmp_path, "logs")
+
+        results = delete_stacks(
+            resolve_stack_config_paths(str(tmp_path)),
+            max_parallel=2,
+            on_result=lambda *args: None,
+        )
+
+        assert {result.stack_name: result.status for result in results} == {
+            "foo-prod-euw2-app": "failed",
+            "foo-prod-euw2-db": "skipped",
+            "foo-prod-euw2-vpc": "skipped",
+            "foo-prod-euw2-logs": "deleted",
+        }
+        assert summarise_results(results) == 1
+
+    def test_failed_load_behind_failed_delete(self, deleted, failing, tmp_path):
+        failing.add("c")
+        write_stack_config(tmp_path, "a")
+        shutil.copy(STACK_CONFIGS_PATH / "config_incomplete.json", tmp_path / "b.json")
+        write_stack_config(tmp_path, "c", ["b.json"])
+
+        results = delete_stacks(
+            resolve_stack_config_paths(str(tmp_path)),
+            max_parallel=2,
+            on_result=lambda *args: None,
+        )
+
+        assert {result.stack_name: result.status for result in results} == {
+            "foo-prod-euw2-a": "deleted",
+            str(tmp_path / "b.json"): "failed",
+            "foo-prod-euw2-c": "failed",
+        }
+        assert deleted == ["a"]
+        assert summarise_results(results) == 1
+
+    def test_delete_stacks_from_cloudformation(self, tmp_path):
+        write_stack_config(tmp_path, "db")
+        write_stack_config(tmp_path, "app", ["db.json"])
+        with mock_cloudformation():
+            client = boto3.client("cloudformation", region_name="eu-west-2")
+            client.create_stack(
+                StackName="foo-prod-euw2-db",
+                TemplateBody='{"AWSTemplateFormatVersion":"2010-09-09","Resources":{}}',
+            )
+
+            results = delete_stacks(
+                resolve_stack_config_paths(str(tmp_path)),
+                max_parallel=2,
+                on_result=lambda *args: None,
+            )
+
+            assert [(result.stack_name, result.status) for result in results] == [
+                ("foo-prod-euw2-app", "absent"),
+                ("foo-prod-euw2-db", "deleted"),
+            ]
+            assert [
+                summary["StackStatus"]
+                for summary in client.list_stacks()["StackSummaries"]
+            ] == ["DELETE_COMPLETE"]
+
+
+BUCKET_NAME = "cf-management-bucket-123456789"
+
+
+class TestPushTemplates:
+    @pytest.fixture
+    def s3_client(self, monkeypatch):
+        for module in ["bettercf.template", "bettercf.batch"]:
+            monkeypatch.setattr(
+                f"{module}.get_management_bucket_name", lambda: BUCKET_NAME
+            )
+        with mock_s3():
+            conn = boto3.client("s3", region_name="us-east-1")
+            conn.create_bucket(Bucket=BUCKET_NAME)
+            yield conn
+
+    @pytest.fixture
+    def manifest_path(self, tmp_path):
+        for name in ["one", "two", "three"]:
+            tmp_path.joinpath(f"{name}.json").write_text(json.dumps({"Name": name}))
+        manifest_path = tmp_path.joinpath("manifest.json")
+        manifest_path.write_text(
+            json.dumps(
+                [
+                    {"Name": "one", "TemplatePath": "one.json", "Version": "1.0"},
+                    {"Name": "two", "TemplatePath": "two.json", "Version": "1.0"},
+                    {"Name": "two", "TemplatePath": "three.json", "Version": "1.1"},
+                    {"Name": "missing", "TemplatePath": "missing.json"},
+                ]
+            )
+        )
+        return manifest_path
+
+    def test_load_push_manifest(self, manifest_path):
+        templates = load_push_manifest(manifest_path)
+        assert [entry["Name"] for entry in templates] == [
+            "one",
+            "two",
+            "two",
+            "missing",
+        ]
+        assert templates[0]["TemplatePath"] == manifest_path.parent / "one.json"
+
+    def test_load_push_manifest_bad_entry(self, tmp_path):
+        manifest_path = tmp_path.joinpath("manifest.json")
+        manifest_path.write_text(json.dumps([{"Name": "one", "Path": "one.json"}]))
+        with pytest.raises(Exception):
+            load_push_manifest(manifest_path)
+
+    def test_push_templates(self, s3_client, manifest_path, capsys):
+        results = push_templates(
+            load_push_manifest(manifest_path),
+            max_parallel=4,
+            on_result=lambda *args: None,
+        )
+
+        assert sorted(
+            (result.template_name, result.version, result.status) for result in results
+        ) == [
+            ("missing", None, "failed"),
+            ("one", "1.0", "uploaded"),
+            ("two", "1.0", "uploaded"),
+            ("two", "1.1", "uploaded"),
+        ]
+        # Both versions of "two" were recorded, so they didn't race to update its index.
+        assert TemplateIndex.load(
+            s3_client, BUCKET_NAME, "two"
+        ).get_version_strings() == ["1.0", "1.1"]
+
+        assert summarise_push_results(results, 0.5) == 1
+        output = capsys.readouterr().out
+        assert "3 of 4 template(s) pushed, 1 failed." in output
+        assert "6.0 templates/s" in output
+
+    def test_push_templates_auto_increments_version(self, s3_client, tmp_path):
+        tmp_path.joinpath("one.json").write_text("{}")
+        template = {"Name": "one", "TemplatePath": tmp_path / "one.json"}
+        push_templates([{**template, "Version": "1.4"}], on_result=lambda *args: None)
+        results = push_templates([template], on_result=lambda *args: None)
+        assert results[0].version == "1.5"
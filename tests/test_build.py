@@ -0,0 +1,219 @@
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+from dfm.config import BuildConfig
+
+from bettercf.build import (
+    BuildWatcher,
+    IncrementalBuilder,
+    build_templates,
+    discover_template_names,
+    summarise_build_results,
+)
+
+DFM_CONFIG_PATH = Path(__file__).parent.parent.joinpath(".dfm/template_builder.json")
+
+
+def load_dfm_config(root_path: Path, template_name: str = "foo"):
+    return BuildConfig.load_config_from_file(
+        file_path=DFM_CONFIG_PATH,
+        root_path=root_path,
+        parameters={"TemplateName": template_name},
+    )
+
+
+@pytest.fixture
+def template_root(tmp_path):
+    root_path = tmp_path.joinpath("root")
+    shutil.copytree(Path(__file__).parent.joinpath("test_templates"), root_path)
+    return root_path
+
+
+def write_fragment(root_path: Path, name: str, content: dict):
+    fragment_path = root_path.joinpath(f"templates/foo/resources/{name}.json")
+    fragment_path.parent.mkdir(parents=True, exist_ok=True)
+    fragment_path.write_text(json.dumps(content))
+
+
+class TestIncrementalBuilder:
+    def test_first_build_matches_dfm_build(self, template_root, tmp_path):
+        built = IncrementalBuilder(load_dfm_config(template_root)).build()
+
+        shutil.copytree(
+            Path(__file__).parent.joinpath("test_templates"), tmp_path.joinpath("dfm")
+        )
+        assert built == load_dfm_config(tmp_path.joinpath("dfm")).build()
+        assert json.loads(template_root.joinpath("foo.json").read_text()) == built
+
+    def test_unchanged_build_is_skipped(self, template_root):
+        first = IncrementalBuilder(load_dfm_config(template_root))
+        built = first.build()
+        assert first.changed_fragments == 2
+
+        # A new builder stands in for a later CLI invocation.
+        second = IncrementalBuilder(load_dfm_config(template_root))
+        assert second.build() == built
+        assert second.changed_fragments is None
+
+    def test_changed_fragment_is_rebuilt_without_duplicating_values(
+        self, template_root
+    ):
+        IncrementalBuilder(load_dfm_config(template_root)).build()
+        write_fragment(
+            template_root, "sns/topic", {"Topic": {"Type": "AWS::SNS::Topic"}}
+        )
+
+        builder = IncrementalBuilder(load_dfm_config(template_root))
+        built = builder.build()
+        assert builder.changed_fragments == 1
+        assert set(built["Resources"]) == {"FooBucket", "Topic"}
+        # Merging into the previous output would have turned this into a list.
+        assert built["Description"] == "A test template"
+
+    def test_edited_destination_is_rebuilt(self, template_root):
+        builder = IncrementalBuilder(load_dfm_config(template_root))
+        builder.build()
+        template_root.joinpath("foo.json").unlink()
+
+        built = builder.build()
+        assert builder.changed_fragments == 2
+        assert "FooBucket" in built["Resources"]
+        assert template_root.joinpath("foo.json").exists()
+
+
+class TestBuildTemplates:
+    @pytest.fixture
+    def template_root(self, template_root):
+        shutil.copytree(
+            template_root.joinpath("templates/foo"),
+            template_root.joinpath("templates/bar"),
+        )
+        # A malformed fragment, so the build fails.
+        template_root.joinpath("templates/broken/resources").mkdir(parents=True)
+        template_root.joinpath("templates/broken/resources/bad.json").write_text("{")
+        return template_root
+
+    def test_discover_template_names(self, template_root):
+        assert discover_template_names(DFM_CONFIG_PATH, template_root) == [
+            "bar",
+            "broken",
+            "foo",
+        ]
+
+    def test_build_templates(self, template_root, capsys):
+        results = build_templates(
+            ["bar", "broken", "foo"], DFM_CONFIG_PATH, template_root, max_parallel=2
+        )
+        assert {result.template_name: result.status for result in results} == {
+            "bar": "built",
+            "broken": "failed",
+            "foo": "built",
+        }
+        assert (
+            "FooBucket"
+            in json.loads(template_root.joinpath("bar.json").read_text())["Resources"]
+        )
+        assert summarise_build_results(results) == 1
+        assert "2 of 3 template(s) built" in capsys.readouterr().out
+
+    def test_build_templates_incrementally(self, template_root):
+        build_templates(["foo"], DFM_CONFIG_PATH, template_root, incremental=True)
+        results = build_templates(
+            ["foo"], DFM_CONFIG_PATH, template_root, incremental=True
+        )
+        assert results[0].status == "unchanged"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestBuildWatcher:
+    def test_rebuilds_once_edits_settle(self, template_root):
+        fake_clock = FakeClock()
+        builder = IncrementalBuilder(load_dfm_config(template_root))
+        watcher = BuildWatcher(
+            builder,
+            "foo",
+            interval=0.1,
+            debounce=0.3,
+            clock=fake_clock.clock,
+            sleep=fake_clock.sleep,
+        )
+        builder.build()
+        assert watcher.check() is False
+
+        write_fragment(
+            template_root, "sns/topic", {"Topic": {"Type": "AWS::SNS::Topic"}}
+        )
+        assert watcher.check() is False
+        fake_clock.sleep(0.1)
+        write_fragment(
+            template_root, "sns/queue", {"Queue": {"Type": "AWS::SQS::Queue"}}
+        )
+        assert watcher.check() is False
+        fake_clock.sleep(0.2)
+        assert watcher.check() is False
+        fake_clock.sleep(0.1)
+        assert watcher.check() is True
+        assert watcher.check() is False
+
+        assert watcher.rebuild() is True
+        assert builder.changed_fragments == 2
+        assert set(
+            json.loads(template_root.joinpath("foo.json").read_text())["Resources"]
+        ) == {"FooBucket", "Topic", "Queue"}
+
+    def test_run_survives_failed_builds(self, template_root, capsys):
+        fake_clock = FakeClock()
+        edits = iter(
+            [
+                lambda: template_root.joinpath(
+                    "templates/foo/resources/s3/broken.json"
+                ).write_text("{"),
+                lambda: template_root.joinpath(
+                    "templates/foo/resources/s3/broken.json"
+                ).unlink(),
+                lambda: write_fragment(
+                    template_root, "sns/topic", {"Topic": {"Type": "AWS::SNS::Topic"}}
+                ),
+            ]
+        )
+        polls = 0
+
+        def should_stop():
+            # Make an edit, then give it time to settle, before the next one.
+            nonlocal polls
+            polls += 1
+            if polls % 5 == 1:
+                edit = next(edits, None)
+                if edit is None:
+                    return True
+                edit()
+            return False
+
+        BuildWatcher(
+            IncrementalBuilder(load_dfm_config(template_root)),
+            "foo",
+            interval=0.1,
+            debounce=0.2,
+            clock=fake_clock.clock,
+            sleep=fake_clock.sleep,
+        ).run(should_stop)
+
+        output = capsys.readouterr().out
+        assert "Template 'foo' built (2 changed fragment(s))" in output
+        assert "Template 'foo' failed to build" in output
+        assert "Template 'foo' built (1 changed fragment(s))" in output
+        assert set(
+            json.loads(template_root.joinpath("foo.json").read_text())["Resources"]
+        ) == {"FooBucket", "Topic"}
@@ -0,0 +1,284 @@
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_s3, mock_ssm, mock_sts
+
+from bettercf.cache import ManagementBucketCache, TemplateCache, get_cache_dir
+from bettercf.utils import (
+    get_management_bucket_location,
+    get_management_bucket_mode,
+    get_management_bucket_name,
+    get_management_bucket_url,
+    invalidate_management_bucket_cache,
+    is_management_bucket_immutable,
+)
+
+
+class TestCache:
+    def test_get_cache_dir_env_override(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("BETTERCF_CACHE_DIR", str(tmp_path))
+        assert get_cache_dir() == tmp_path
+
+    def test_get_memoizes_value(self):
+        calls = 0
+
+        def resolver():
+            nonlocal calls
+            calls += 1
+            return "foo"
+
+        cache = ManagementBucketCache()
+        assert cache.get("BucketName", resolver) == "foo"
+        assert cache.get("BucketName", resolver) == "foo"
+        assert calls == 1
+
+    def test_get_does_not_cache_failures(self):
+        def failing_resolver():
+            raise Exception("not initialised")
+
+        cache = ManagementBucketCache()
+        with pytest.raises(Exception):
+            cache.get("BucketName", failing_resolver)
+        assert cache.get("BucketName", lambda: "foo") == "foo"
+
+    @mock_sts
+    def test_disk_cache_is_shared_between_processes(self, monkeypatch):
+        monkeypatch.setenv("BETTERCF_BUCKET_CACHE_TTL", "60")
+        ManagementBucketCache().get("BucketName", lambda: "foo")
+
+        def unexpected_resolver():
+            raise Exception("Should have been read from disk.")
+
+        # A new instance stands in for a later CLI invocation.
+        assert ManagementBucketCache().get("BucketName", unexpected_resolver) == "foo"
+        assert (
+            ManagementBucketCache.get_disk_cache_dir()
+            .joinpath("123456789012-us-east-1.json")
+            .exists()
+        )
+
+    @mock_sts
+    def test_disk_cache_expires_after_ttl(self, monkeypatch):
+        monkeypatch.setenv("BETTERCF_BUCKET_CACHE_TTL", "60")
+        ManagementBucketCache().get("BucketName", lambda: "foo")
+
+        monkeypatch.setattr("bettercf.cache.time.time", lambda: 10**12)
+        assert ManagementBucketCache().get("BucketName", lambda: "bar") == "bar"
+
+    @mock_sts
+    def test_invalidate_clears_memory_and_disk(self, monkeypatch):
+        monkeypatch.setenv("BETTERCF_BUCKET_CACHE_TTL", "60")
+        cache = ManagementBucketCache()
+        cache.get("BucketName", lambda: "foo")
+
+        cache.invalidate()
+
+        assert cache.get("BucketName", lambda: "bar") == "bar"
+        assert ManagementBucketCache().get("BucketName", lambda: "baz") == "bar"
+        cache.invalidate()
+        assert ManagementBucketCache().get("BucketName", lambda: "baz") == "baz"
+
+    @mock_ssm
+    @mock_s3
+    def test_management_bucket_lookups_are_made_once(self, monkeypatch):
+        ssm_conn = boto3.client("ssm")
+        ssm_conn.put_parameter(
+            Name="/BetterCF/.management/BetterCF-management-bucket-name",
+            Type="String",
+            Value="foo",
+        )
+        s3_conn = boto3.client("s3", region_name="us-east-1")
+        s3_conn.create_bucket(
+            Bucket="foo",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        assert get_management_bucket_url() == "https://foo.s3.eu-west-2.amazonaws.com"
+
+        # The values are now served from the cache, even though the parameter is gone.
+        ssm_conn.delete_parameter(
+            Name="/BetterCF/.management/BetterCF-management-bucket-name"
+        )
+        assert get_management_bucket_name() == "foo"
+        assert get_management_bucket_location() == "eu-west-2"
+        assert get_management_bucket_url() == "https://foo.s3.eu-west-2.amazonaws.com"
+
+        invalidate_management_bucket_cache()
+        with pytest.raises(Exception):
+            get_management_bucket_name()
+
+
+class CountingS3Client:
+    """
+    Wraps an S3 client to record the GetObject calls made through it.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.get_object_calls = []
+
+    def get_object(self, **kwargs):
+        self.get_object_calls.append(kwargs)
+        return self.client.get_object(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+@pytest.fixture
+def template_bucket():
+    with mock_s3():
+        conn = boto3.client("s3", region_name="us-east-1")
+        conn.create_bucket(Bucket="cf-management-bucket-123456789")
+        conn.put_object(
+            Body=b'{"foo": "bar"}',
+            Bucket="cf-management-bucket-123456789",
+            Key="foo/0.1",
+        )
+        yield CountingS3Client(conn)
+
+
+class TestTemplateCache:
+    def test_get_downloads_then_revalidates(self, template_bucket):
+        cache = TemplateCache()
+        for _ in range(2):
+            assert (
+                cache.get(template_bucket, "cf-management-bucket-123456789", "foo/0.1")
+                == b'{"foo": "bar"}'
+            )
+
+        assert len(template_bucket.get_object_calls) == 2
+        assert "IfNoneMatch" not in template_bucket.get_object_calls[0]
+        assert "IfNoneMatch" in template_bucket.get_object_calls[1]
+
+    def test_get_refreshes_changed_template(self, template_bucket):
+        cache = TemplateCache()
+        cache.get(template_bucket, "cf-management-bucket-123456789", "foo/0.1")
+        template_bucket.put_object(
+            Body=b'{"foo": "baz"}',
+            Bucket="cf-management-bucket-123456789",
+            Key="foo/0.1",
+        )
+        assert (
+            cache.get(template_bucket, "cf-management-bucket-123456789", "foo/0.1")
+            == b'{"foo": "baz"}'
+        )
+
+    def test_get_parsed_shares_parsed_template(self, template_bucket):
+        cache = TemplateCache()
+        parsed = cache.get_parsed(
+            template_bucket, "cf-management-bucket-123456789", "foo/0.1"
+        )
+        assert parsed == {"foo": "bar"}
+        assert (
+            cache.get_parsed(
+                template_bucket, "cf-management-bucket-123456789", "foo/0.1"
+            )
+            is parsed
+        )
+
+        template_bucket.put_object(
+            Body=b'{"foo": "baz"}',
+            Bucket="cf-management-bucket-123456789",
+            Key="foo/0.1",
+        )
+        assert cache.get_parsed(
+            template_bucket, "cf-management-bucket-123456789", "foo/0.1"
+        ) == {"foo": "baz"}
+
+    def test_get_immutable_hit_skips_network(self, template_bucket):
+        cache = TemplateCache()
+        cache.get(template_bucket, "cf-management-bucket-123456789", "foo/0.1")
+
+        # A later process sharing the same cache directory.
+        assert (
+            TemplateCache().get(
+                template_bucket,
+                "cf-management-bucket-123456789",
+                "foo/0.1",
+                immutable=True,
+            )
+            == b'{"foo": "bar"}'
+        )
+        assert len(template_bucket.get_object_calls) == 1
+
+    def test_get_missing_template_errors(self, template_bucket):
+        with pytest.raises(Exception):
+            TemplateCache().get(
+                template_bucket, "cf-management-bucket-123456789", "foo/9.9"
+            )
+
+    def test_identical_bodies_are_stored_once(self, template_bucket):
+        template_bucket.put_object(
+            Body=b'{"foo": "bar"}',
+            Bucket="cf-management-bucket-123456789",
+            Key="foo/0.2",
+        )
+        cache = TemplateCache()
+        cache.get(template_bucket, "cf-management-bucket-123456789", "foo/0.1")
+        cache.get(template_bucket, "cf-management-bucket-123456789", "foo/0.2")
+        assert len(list(cache.cache_dir.glob("objects/*"))) == 1
+
+    def test_least_recently_used_templates_are_evicted(self, template_bucket):
+        for version in ["0.2", "0.3"]:
+            template_bucket.put_object(
+                Body=f'{{"foo": "{version}"}}'.encode("utf-8"),
+                Bucket="cf-management-bucket-123456789",
+                Key=f"foo/{version}",
+            )
+        cache = TemplateCache(max_size=35)
+        for version in ["0.1", "0.2", "0.1", "0.3"]:
+            cache.get(
+                template_bucket, "cf-management-bucket-123456789", f"foo/{version}"
+            )
+
+        assert sorted(cache._load_index()) == [
+            "cf-management-bucket-123456789/foo/0.1",
+            "cf-management-bucket-123456789/foo/0.3",
+        ]
+        assert len(list(cache.cache_dir.glob("objects/*"))) == 2
+
+    def test_clear(self, template_bucket):
+        cache = TemplateCache()
+        cache.get(template_bucket, "cf-management-bucket-123456789", "foo/0.1")
+        cache.clear()
+        cache.get(
+            template_bucket, "cf-management-bucket-123456789", "foo/0.1", immutable=True
+        )
+        assert len(template_bucket.get_object_calls) == 2
+
+    def test_get_management_bucket_mode(self, monkeypatch, template_bucket):
+        monkeypatch.setattr(
+            "bettercf.utils.get_management_bucket_name",
+            lambda: "cf-management-bucket-123456789",
+        )
+        assert get_management_bucket_mode() == "STANDARD"
+
+        invalidate_management_bucket_cache()
+        template_bucket.create_bucket(
+            Bucket="cf-management-bucket-locked", ObjectLockEnabledForBucket=True
+        )
+        template_bucket.put_object_lock_configuration(
+            Bucket="cf-management-bucket-locked",
+            ObjectLockConfiguration={
+                "ObjectLockEnabled": "Enabled",
+                "Rule": {"DefaultRetention": {"Mode": "COMPLIANCE", "Years": 1}},
+            },
+        )
+        monkeypatch.setattr(
+            "bettercf.utils.get_management_bucket_name",
+            lambda: "cf-management-bucket-locked",
+        )
+        assert get_management_bucket_mode() == "COMPLIANCE"
+
+    def test_unreadable_management_bucket_mode_is_mutable(self, monkeypatch, capsys):
+        def access_denied():
+            raise ClientError(
+                {"Error": {"Code": "AccessDenied", "Message": "Access Denied"}},
+                "GetObjectLockConfiguration",
+            )
+
+        monkeypatch.setattr(
+            "bettercf.utils._get_management_bucket_mode_from_s3", access_denied
+        )
+        assert is_management_bucket_immutable() is False
+        assert "AccessDenied" in capsys.readouterr().out
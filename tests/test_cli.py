@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from bettercf.cli_version import __version__
+
+SRC_PATH = str(Path(__file__).parent.parent.joinpath("src"))
+
+# How much "bettercf --help" may add to the interpreter's own startup time.
+HELP_BUDGET_SECONDS = 0.1
+
+
+def run_python(*args: str):
+    return subprocess.run(
+        [sys.executable, *args],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": SRC_PATH},
+    )
+
+
+def best_run_time(*args: str, repeat: int = 5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_python(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def test_import_does_not_load_heavy_dependencies():
+    loaded = run_python(
+        "-c",
+        "import sys, bettercf.cli; print(' '.join(sys.modules))",
+    ).stdout.split()
+    for module in ["boto3", "botocore", "dfm", "jsonpath_ng", "bettercf.stack"]:
+        assert module not in loaded
+
+
+def test_stack_validate_does_not_load_heavy_dependencies():
+    config_path = Path(__file__).parent.joinpath("test_stack_configs", "config.json")
+    loaded = run_python(
+        "-c",
+        "import runpy, sys\n"
+        f"sys.argv = ['bettercf', 'stack', 'validate', '-c', {str(config_path)!r}, '-p', '1']\n"
+        "try:\n"
+        "    runpy.run_module('bettercf.cli', run_name='__main__')\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(' '.join(sys.modules), file=sys.stderr)",
+    ).stderr.split()
+    assert "bettercf.validation" in loaded
+    for module in ["boto3", "dfm", "jsonpath_ng", "bettercf.stack", "bettercf.batch"]:
+        assert module not in loaded
+
+
+def test_version():
+    assert (
+        run_python("-m", "bettercf.cli", "--version").stdout.strip()
+        == f"cli.py {__version__}"
+    )
+
+
+@pytest.mark.skipif(
+    os.environ.get("BETTERCF_SKIP_TIMING_TESTS") == "1",
+    reason="timing tests disabled",
+)
+def test_help_startup_budget():
+    interpreter = best_run_time("-c", "pass")
+    help_ = best_run_time("-m", "bettercf.cli", "--help")
+    assert help_ - interpreter < HELP_BUDGET_SECONDS
@@ -0,0 +1,82 @@
+import threading
+
+import boto3
+from moto import mock_s3
+
+from bettercf.clients import ClientRegistry, configure_clients, get_client
+
+
+class TestClients:
+    def test_get_client_is_shared(self):
+        registry = ClientRegistry()
+        assert registry.get_client("s3") is registry.get_client("s3")
+
+    def test_get_client_keyed_by_region_and_service(self):
+        registry = ClientRegistry()
+        assert registry.get_client("s3", "eu-west-2") is not registry.get_client(
+            "s3", "us-east-1"
+        )
+        assert registry.get_client("s3") is not registry.get_client("ssm")
+        assert registry.get_client("s3", "eu-west-2").meta.region_name == "eu-west-2"
+
+    def test_get_client_keyed_by_credentials(self, monkeypatch):
+        # Full credentials from the environment, so the test doesn't depend on any configured elsewhere.
+        monkeypatch.delenv("AWS_SESSION_TOKEN", raising=False)
+        monkeypatch.setenv("AWS_ACCESS_KEY_ID", "a-key")
+        monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "a-secret")
+        registry = ClientRegistry()
+        first_client = registry.get_client("s3")
+
+        # A new session (e.g after a role switch) with different credentials must not reuse the old client.
+        registry.reset()
+        monkeypatch.setenv("AWS_ACCESS_KEY_ID", "another-key")
+        monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "another-secret")
+        assert registry.get_client("s3") is not first_client
+
+    def test_get_client_config(self):
+        registry = ClientRegistry(
+            max_pool_connections=7,
+            retry_mode="adaptive",
+            max_attempts=3,
+            connect_timeout=2,
+            read_timeout=4,
+        )
+        config = registry.get_client("s3").meta.config
+        assert config.max_pool_connections == 7
+        assert config.retries["mode"] == "adaptive"
+        assert registry.config.retries["max_attempts"] == 3
+        assert (config.connect_timeout, config.read_timeout) == (2, 4)
+
+    def test_config_from_environment(self, monkeypatch):
+        monkeypatch.setenv("BETTERCF_MAX_POOL_CONNECTIONS", "25")
+        monkeypatch.setenv("BETTERCF_RETRY_MODE", "legacy")
+        registry = ClientRegistry()
+        assert registry.max_pool_connections == 25
+        assert registry.retry_mode == "legacy"
+
+    def test_get_client_thread_safe(self):
+        registry = ClientRegistry()
+        clients = []
+
+        def create_client():
+            clients.append(registry.get_client("cloudformation"))
+
+        threads = [threading.Thread(target=create_client) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(clients) == 16
+        assert all(client is clients[0] for client in clients)
+
+    @mock_s3
+    def test_configure_clients_replaces_registry(self):
+        configure_clients(max_pool_connections=3)
+        client = get_client("s3")
+        assert client.meta.config.max_pool_connections == 3
+
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="foo")
+        assert [bucket["Name"] for bucket in client.list_buckets()["Buckets"]] == [
+            "foo"
+        ]
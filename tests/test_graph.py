@@ -0,0 +1,141 @@
+import threading
+import time
+from dataclasses import dataclass
+
+import pytest
+
+from bettercf.graph import DependencyGraph, run_in_dependency_order
+
+
+@dataclass
+class Result:
+    node: str
+    status: str
+
+    @property
+    def succeeded(self):
+        return self.status == "ok"
+
+
+def make_graph(dependencies: dict):
+    graph = DependencyGraph()
+    for node, node_dependencies in dependencies.items():
+        graph.add(node, node_dependencies)
+    return graph
+
+
+class TestDependencyGraph:
+    def test_find_cycle(self):
+        graph = make_graph({"a": ["b"], "b": ["c"], "c": ["a"], "d": []})
+        assert graph.find_cycle() == ["a", "b", "c", "a"]
+        with pytest.raises(Exception, match="a -> b -> c -> a"):
+            graph.check_acyclic()
+
+    def test_self_dependency_is_a_cycle(self):
+        assert make_graph({"a": ["a"]}).find_cycle() == ["a", "a"]
+
+    def test_acyclic_graph(self):
+        graph = make_graph({"vpc": [], "db": ["vpc"], "app": ["db", "vpc"]})
+        assert graph.find_cycle() is None
+        assert graph.dependents() == {"vpc": ["db", "app"], "db": ["app"], "app": []}
+        assert graph.reversed().dependencies == {
+            "vpc": ["db", "app"],
+            "db": ["app"],
+            "app": [],
+        }
+
+    def test_deep_graph_does_not_recurse(self):
+        graph = make_graph({i: [i - 1] if i else [] for i in range(5000)})
+        assert graph.find_cycle() is None
+
+    def test_unknown_dependency(self):
+        with pytest.raises(Exception, match="isn't in the graph"):
+            make_graph({"a": ["b"]}).find_cycle()
+
+
+class TestRunInDependencyOrder:
+    def test_runs_each_node_after_its_dependencies(self):
+        graph = make_graph(
+            {"vpc": [], "db": ["vpc"], "cache": ["vpc"], "app": ["db", "cache"]}
+        )
+        finished = []
+        lock = threading.Lock()
+
+        def run(node):
+            for dependency in graph.dependencies[node]:
+                assert dependency in finished
+            time.sleep(0.01)
+            with lock:
+                finished.append(node)
+            return Result(node, "ok")
+
+        results = list(run_in_dependency_order(graph, run, None, max_parallel=4))
+        assert sorted(result.node for result in results) == sorted(finished)
+        assert finished[0] == "vpc" and finished[-1] == "app"
+
+    def test_independent_nodes_run_concurrently(self):
+        # Two independent chains, so one node of each can run at a time.
+        graph = make_graph(
+            {"a1": [], "a2": ["a1"], "a3": ["a2"], "b1": [], "b2": ["b1"], "b3": ["b2"]}
+        )
+        in_flight = 0
+        max_in_flight = 0
+        lock = threading.Lock()
+
+        def run(node):
+            nonlocal in_flight, max_in_flight
+            with lock:
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+            time.sleep(0.05)
+            with lock:
+                in_flight -= 1
+            return Result(node, "ok")
+
+        results = list(run_in_dependency_order(graph, run, None, max_parallel=4))
+        assert len(results) == 6
+        assert max_in_flight == 2
+
+    def test_failure_skips_everything_downstream(self):
+        graph = make_graph(
+            {
+                "vpc": [],
+                "db": ["vpc"],
+                "app": ["db"],
+                "dashboard": ["app"],
+                "logs": [],
+            }
+        )
+        ran = []
+
+        def run(node):
+            ran.append(node)
+            return Result(node, "failed" if node == "db" else "ok")
+
+        results = list(
+            run_in_dependency_order(
+                graph,
+                run,
+                lambda node, failed_node: Result(f"{node}<{failed_node}", "skipped"),
+                max_parallel=1,
+            )
+        )
+
+        assert sorted(ran) == ["db", "logs", "vpc"]
+        assert sorted(result.node for result in results) == [
+            "app<db",
+            "dashboard<db",
+            "db",
+            "logs",
+            "vpc",
+        ]
+
+    def test_cycle_runs_nothing(self):
+        ran = []
+        with pytest.raises(Exception, match="cycle"):
+            list(
+                run_in_dependency_order(
+                    make_graph({"a": ["b"], "b": ["a"]}), ran.append, None
+                )
+            )
+        assert ran == []
@@ -1,166 +1,263 @@
-from bettercf.override import *
 import pytest
 
+from bettercf.override import (
+    INSERT,
+    OverrideOperation,
+    compile_overrides,
+    override_resources,
+)
+
+
 class TestCommon:
     def test_override_resource_new_dict_key(self, original_resource_dict):
-        '''
+        """
         Tests that inserting a new key (NewKey) results in that new key existing.
-        '''
+        """
         print("in test" + str(original_resource_dict))
-        override_dict = {
-            "ParentKey" : {
-                ">>NewKey" :{
-                    "NewNestedKey" : "NewNestedValue"
-                }
-            }
-        }
+        override_dict = {"ParentKey": {">>NewKey": {"NewNestedKey": "NewNestedValue"}}}
         expected_overwritten_dict = {
-            "ParentKey" : {
-                "OldKey" :{
-                    "OldNestedKey" : "OldNestedValue"
-                },
-                "NewKey" :{
-                    "NewNestedKey" : "NewNestedValue"
-                }
+            "ParentKey": {
+                "OldKey": {"OldNestedKey": "OldNestedValue"},
+                "NewKey": {"NewNestedKey": "NewNestedValue"},
             }
         }
 
-        assert override_resources(original_resource_dict, override_dict) == expected_overwritten_dict
+        assert (
+            override_resources(original_resource_dict, override_dict)
+            == expected_overwritten_dict
+        )
 
     def test_override_resource_merge_dicts(self, original_resource_dict):
-        '''
+        """
         Tests that merging a ParentKey results in ParentKey having the old key (OldKey) and the new key (NewKey)
-        '''
-        override_dict = {
-            "^^ParentKey" : {
-                "NewKey" : {
-                    "NewNestedKey" : "NewNestedValue"
-                }
-            }
-        }
+        """
+        override_dict = {"^^ParentKey": {"NewKey": {"NewNestedKey": "NewNestedValue"}}}
         expected_overwritten_dict = {
-            "ParentKey" : {
-                "OldKey" : {
-                    "OldNestedKey" : "OldNestedValue"
-                },
-                "NewKey" : {
-                    "NewNestedKey" : "NewNestedValue"
-                }
+            "ParentKey": {
+                "OldKey": {"OldNestedKey": "OldNestedValue"},
+                "NewKey": {"NewNestedKey": "NewNestedValue"},
             }
         }
 
-        assert override_resources(original_resource_dict, override_dict) == expected_overwritten_dict
+        assert (
+            override_resources(original_resource_dict, override_dict)
+            == expected_overwritten_dict
+        )
 
     def test_override_resource_delete_dict(self, original_resource_dict_four_keys):
-        '''
+        """
         Tests that removing keys (OldKey1, OldKey2, OldKey3, OldKey4) do infact remove the keys from the resource dictionary.
-        '''
+        """
 
         override_dict = {
-            "ParentKey" : {
-                "<<OldKey1" : {},
-                "<<OldKey2" : [],
-                 "<<OldKey3" : "this shouldnt matter",
-                 "<<OldKey4" : None
+            "ParentKey": {
+                "<<OldKey1": {},
+                "<<OldKey2": [],
+                "<<OldKey3": "this shouldnt matter",
+                "<<OldKey4": None,
             }
         }
 
-        expected_overwritten_dict = {
-            "ParentKey" : {}
-        }
+        expected_overwritten_dict = {"ParentKey": {}}
 
-        assert override_resources(original_resource_dict_four_keys, override_dict) == expected_overwritten_dict
+        assert (
+            override_resources(original_resource_dict_four_keys, override_dict)
+            == expected_overwritten_dict
+        )
 
-    def test_override_resource_new_list_element(self, original_resource_dict_four_elements):
-        '''
+    def test_override_resource_new_list_element(
+        self, original_resource_dict_four_elements
+    ):
+        """
         Tests that overriding a key (ParentKey) will infact replace it and not merge the old and new values etc
-        '''
+        """
         override_dict = {
-            ">>ParentKey" : [
-                {
-                "NewKey" :{
-                    "NewNestedKey" : "NewNestedValue"
-                }
-            }
-            ]
+            ">>ParentKey": [{"NewKey": {"NewNestedKey": "NewNestedValue"}}]
         }
 
         expected_overwritten_dict = {
-            "ParentKey" : [
-                {
-                    "NewKey" :{
-                        "NewNestedKey" : "NewNestedValue"
-                    }
-                }
-            ]
+            "ParentKey": [{"NewKey": {"NewNestedKey": "NewNestedValue"}}]
         }
 
-        assert override_resources(original_resource_dict_four_elements, override_dict) == expected_overwritten_dict
-
+        assert (
+            override_resources(original_resource_dict_four_elements, override_dict)
+            == expected_overwritten_dict
+        )
 
-    def test_override_resource_merge_list_element(self, original_resource_dict_four_elements):
-        '''
+    def test_override_resource_merge_list_element(
+        self, original_resource_dict_four_elements
+    ):
+        """
         Tests that merging a key (ParentKey) results in the original child keys (OldKey1, OldKey2, OldKey3, OldKey4)
         and the new key (OldKey5) being in the resource dict.
-        '''
+        """
         override_dict = {
-            "^^ParentKey" : [
-                {
-                    "OldKey5" :{
-                        "OldNestedKey" : "OldNestedValue"
-                    }
-                }
-            ]
+            "^^ParentKey": [{"OldKey5": {"OldNestedKey": "OldNestedValue"}}]
         }
 
         expected_overwritten_dict = {
-            "ParentKey" : [
-                {
-                    "OldKey1" :{
-                        "OldNestedKey" : "OldNestedValue"
-                    }
-                },
-                {
-                    "OldKey2" :{
-                        "OldNestedKey" : "OldNestedValue"
-                    }
-                },
-                {
-                    "OldKey3" :{
-                        "OldNestedKey" : "OldNestedValue"
-                    }
-                },
-                {
-                    "OldKey4" :{
-                        "OldNestedKey" : "OldNestedValue"
-                    }
-                },
-                {
-                    "OldKey5" :{
-                        "OldNestedKey" : "OldNestedValue"
-                    }
-                }
+            "ParentKey": [
+                {"OldKey1": {"OldNestedKey": "OldNestedValue"}},
+                {"OldKey2": {"OldNestedKey": "OldNestedValue"}},
+                {"OldKey3": {"OldNestedKey": "OldNestedValue"}},
+                {"OldKey4": {"OldNestedKey": "OldNestedValue"}},
+                {"OldKey5": {"OldNestedKey": "OldNestedValue"}},
             ]
         }
-        assert override_resources(original_resource_dict_four_elements, override_dict) == expected_overwritten_dict
+        assert (
+            override_resources(original_resource_dict_four_elements, override_dict)
+            == expected_overwritten_dict
+        )
 
-    def test_override_resource_errors_when_merging_string_or_int(self, original_resource_dict_string_and_int):
-        '''
+    def test_override_resource_errors_when_merging_string_or_int(
+        self, original_resource_dict_string_and_int
+    ):
+        """
         It is only possible to merge keys if the values are dicts or lists.
         This tests that an exception is raised when trying to merge keys where their value is a string (String),
         and int (Int) or null (None)
-        '''
-        override_list = [
-            {
-                "^^String" : "new string"
-            },
-            {
-                "^^Int" : 456
-            },
-            {
-                "^^None" : None
-            }
-        ]
+        """
+        override_list = [{"^^String": "new string"}, {"^^Int": 456}, {"^^None": None}]
         for override_dict in override_list:
             with pytest.raises(Exception):
-                override_resources(original_resource_string_and_int, override_dict)
\ No newline at end of file
+                override_resources(original_resource_dict_string_and_int, override_dict)
+
+
+def legacy_override_resources(resources, overrides):
+    """
+    The recursive walk override_resources used before overrides were compiled, kept to check the plan applier gives identical results.
+    """
+    if type(overrides) is dict:
+        for resource_key, resource_obj in overrides.items():
+            if resource_key.startswith(">>"):
+                resources[resource_key.replace(">>", "")] = resource_obj
+            elif resource_key.startswith("<<"):
+                if resource_key.replace("<<", "") in resources:
+                    del resources[resource_key.replace("<<", "")]
+                else:
+                    raise Exception(
+                        f"Trying to delete key: {resource_key.replace('<<', '')} but it is not found in resources."
+                    )
+            elif resource_key.startswith("^^"):
+                if type(resource_obj) is dict:
+                    resources[resource_key.replace("^^", "")] = {
+                        **resources[resource_key.replace("^^", "")],
+                        **resource_obj,
+                    }
+                elif type(resource_obj) is list:
+                    resources[resource_key.replace("^^", "")] = (
+                        resources[resource_key.replace("^^", "")] + resource_obj
+                    )
+                else:
+                    raise Exception(
+                        f"Trying to merge a non list/dict ({type(resource_obj)}"
+                    )
+            elif resource_key in resources:
+                legacy_override_resources(resources[resource_key], resource_obj)
+    elif type(overrides) is list:
+        for override in overrides:
+            legacy_override_resources(resources, override)
+    return resources
+
+
+def sample_resources():
+    return {
+        "Bucket": {
+            "Type": "AWS::S3::Bucket",
+            "Properties": {"BucketName": "foo", "Tags": [{"Key": "a", "Value": "1"}]},
+        },
+        "Function": {
+            "Type": "AWS::Lambda::Function",
+            "Properties": {
+                "Environment": {
+                    "Variables": {
+                        "HOST": {"Fn::GetAtt": ["Db", "Endpoint.Address"]},
+                        "OLD": "x",
+                    }
+                }
+            },
+        },
+    }
+
+
+def sample_overrides():
+    return [
+        {
+            "Bucket": {
+                "Properties": {
+                    ">>VersioningConfiguration": {"Status": "Enabled"},
+                    "^^Tags": [{"Key": "b", "Value": "2"}],
+                    "<<BucketName": None,
+                }
+            },
+            "Function": {
+                "Properties": {
+                    "Environment": {
+                        "Variables": {
+                            ">>NEW": {"Ref": "New"},
+                            "HOST": {"^^Fn::GetAtt": ["something_new"]},
+                            "<<OLD": None,
+                        }
+                    }
+                }
+            },
+            "MissingResource": {"Properties": {"<<DoesNotExist": None}},
+            ">>NewResource": {"Type": "AWS::SNS::Topic", "Properties": {}},
+        },
+        {"NewResource": {"Properties": {">>TopicName": "bar"}}},
+    ]
+
+
+class TestOverridePlan:
+    def test_plan_matches_recursive_walk(self):
+        assert compile_overrides(sample_overrides()).apply(
+            sample_resources()
+        ) == legacy_override_resources(sample_resources(), sample_overrides())
+
+    def test_plan_is_flat(self):
+        plan = compile_overrides(sample_overrides())
+        assert len(plan) == 9
+        assert plan.operations[0] == OverrideOperation(
+            ("Bucket", "Properties"),
+            INSERT,
+            "VersioningConfiguration",
+            {"Status": "Enabled"},
+        )
+
+    def test_plan_is_reusable(self):
+        plan = compile_overrides(sample_overrides())
+        first = plan.apply(sample_resources())
+        # NewResource is modified by a later operation of the plan, which must not change the plan itself.
+        assert plan.operations[-2].value == {
+            "Type": "AWS::SNS::Topic",
+            "Properties": {},
+        }
+        assert plan.apply(sample_resources()) == first
+
+    def test_invalid_merge_fails_at_compile_time(self):
+        with pytest.raises(Exception):
+            compile_overrides({"MissingResource": {"^^String": "new string"}})
+
+    def test_render_matches_apply(self):
+        plan = compile_overrides(sample_overrides())
+        assert plan.render(sample_resources()) == plan.apply(sample_resources())
+
+    def test_render_leaves_template_untouched(self):
+        plan = compile_overrides(sample_overrides())
+        template = sample_resources()
+        plan.render(template)
+        plan.render(template)
+        assert template == sample_resources()
+
+    def test_render_shares_untouched_subtrees(self):
+        template = sample_resources()
+        rendered = compile_overrides(
+            {"Bucket": {"Properties": {">>BucketName": "bar"}}}
+        ).render(template)
+        assert rendered["Function"] is template["Function"]
+        assert (
+            rendered["Bucket"]["Properties"]["Tags"]
+            is template["Bucket"]["Properties"]["Tags"]
+        )
+        assert rendered["Bucket"] is not template["Bucket"]
+        assert template["Bucket"]["Properties"]["BucketName"] == "foo"
@@ -0,0 +1,233 @@
+import io
+import json
+import os
+import zipfile
+
+import boto3
+import pytest
+from moto import mock_s3
+
+from bettercf.package import TemplatePackager, package_template, zip_path
+
+BUCKET_NAME = "cf-management-bucket-123456789"
+BUCKET_URL = f"https://{BUCKET_NAME}.s3.us-east-1.amazonaws.com"
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    monkeypatch.setattr(
+        "bettercf.package.get_management_bucket_name", lambda: BUCKET_NAME
+    )
+    monkeypatch.setattr(
+        "bettercf.package.get_management_bucket_url", lambda: BUCKET_URL
+    )
+    with mock_s3():
+        conn = boto3.client("s3", region_name="us-east-1")
+        conn.create_bucket(Bucket=BUCKET_NAME)
+        yield conn
+
+
+@pytest.fixture
+def project(tmp_path):
+    """
+    A template with a Lambda function (code directory), a SAM function (single file) and a nested stack whose
+    template refers to the same code directory.
+    """
+    tmp_path.joinpath("src/lib").mkdir(parents=True)
+    tmp_path.joinpath("src/handler.py").write_text(
+        "def handler(event, context):\n    pass\n"
+    )
+    tmp_path.joinpath("src/lib/util.py").write_text("X = 1\n")
+    tmp_path.joinpath("worker.py").write_text("print('work')\n")
+    tmp_path.joinpath("nested").mkdir()
+    tmp_path.joinpath("nested/child.json").write_text(
+        json.dumps(
+            {
+                "Resources": {
+                    "ChildFunction": {
+                        "Type": "AWS::Lambda::Function",
+                        "Properties": {"Code": "../src"},
+                    }
+                }
+            }
+        )
+    )
+    return tmp_path
+
+
+def parent_template():
+    return {
+        "Resources": {
+            "Function": {
+                "Type": "AWS::Lambda::Function",
+                "Properties": {"Code": "src", "Handler": "handler.handler"},
+            },
+            "Worker": {
+                "Type": "AWS::Serverless::Function",
+                "Properties": {"CodeUri": "worker.py"},
+            },
+            "Child": {
+                "Type": "AWS::CloudFormation::Stack",
+                "Properties": {"TemplateURL": "nested/child.json"},
+            },
+            "Remote": {
+                "Type": "AWS::Lambda::Function",
+                "Properties": {"Code": {"S3Bucket": "elsewhere", "S3Key": "code.zip"}},
+            },
+        }
+    }
+
+
+class TestZipPath:
+    def test_zip_is_deterministic(self, project):
+        first = io.BytesIO()
+        zip_path(project / "src", first)
+        os.utime(project / "src/handler.py", (0, 0))
+        second = io.BytesIO()
+        zip_path(project / "src", second)
+        assert first.getvalue() == second.getvalue()
+
+        with zipfile.ZipFile(first) as zip_file:
+            assert zip_file.namelist() == ["handler.py", "lib/util.py"]
+
+    def test_zip_single_file(self, project):
+        destination = io.BytesIO()
+        zip_path(project / "worker.py", destination)
+        with zipfile.ZipFile(destination) as zip_file:
+            assert zip_file.namelist() == ["worker.py"]
+
+
+def packager_keys(packaged: dict):
+    return [
+        resource["Properties"]["Code"]["S3Key"]
+        for resource in packaged["Resources"].values()
+    ]
+
+
+class TestTemplatePackager:
+    def test_package_template(self, s3_client, project):
+        template = parent_template()
+        packaged = package_template(template, project)
+
+        resources = packaged["Resources"]
+        code_key = resources["Function"]["Properties"]["Code"]["S3Key"]
+        assert code_key.startswith(".artifacts/") and code_key.endswith(".zip")
+        assert resources["Function"]["Properties"]["Code"]["S3Bucket"] == BUCKET_NAME
+        assert resources["Worker"]["Properties"]["CodeUri"].startswith(
+            f"s3://{BUCKET_NAME}/.artifacts/"
+        )
+        assert resources["Remote"] == parent_template()["Resources"]["Remote"]
+        # The input template is left as it was.
+        assert template == parent_template()
+
+        child_url = resources["Child"]["Properties"]["TemplateURL"]
+        assert child_url.startswith(f"{BUCKET_URL}/.artifacts/") and child_url.endswith(
+            ".json"
+        )
+        child = json.loads(
+            s3_client.get_object(
+                Bucket=BUCKET_NAME, Key=child_url[len(BUCKET_URL) + 1 :]
+            )["Body"].read()
+        )
+        # The nested template's code is the same directory, so the same artifact.
+        assert (
+            child["Resources"]["ChildFunction"]["Properties"]["Code"]["S3Key"]
+            == code_key
+        )
+
+        keys = [
+            obj["Key"]
+            for obj in s3_client.list_objects_v2(Bucket=BUCKET_NAME)["Contents"]
+        ]
+        assert len(keys) == 3
+
+    def test_unchanged_artifacts_are_not_uploaded_again(self, s3_client, project):
+        first = TemplatePackager(s3_client, BUCKET_NAME, BUCKET_URL)
+        first.package(parent_template(), project)
+        assert set(first.upload().values()) == {"uploaded"}
+
+        second = TemplatePackager(s3_client, BUCKET_NAME, BUCKET_URL)
+        second.package(parent_template(), project)
+        assert set(second.upload().values()) == {"exists"}
+
+    def test_prebuilt_archive_is_uploaded_as_is(self, s3_client, project):
+        with zipfile.ZipFile(project / "prebuilt.zip", "w") as zip_file:
+            zip_file.writestr("handler.py", "def handler(event, context):\n    pass\n")
+        project.joinpath("glue.JAR").write_bytes(b"PK jar")
+        packager = TemplatePackager(s3_client, BUCKET_NAME, BUCKET_URL)
+        packaged = packager.package(
+            {
+                "Resources": {
+                    "Function": {
+                        "Type": "AWS::Lambda::Function",
+                        "Properties": {"Code": "prebuilt.zip"},
+                    },
+                    "Layer": {
+                        "Type": "AWS::Lambda::LayerVersion",
+                        "Properties": {"Content": "glue.JAR"},
+                    },
+                }
+            },
+            project,
+        )
+        packager.upload()
+
+        function_key = packaged["Resources"]["Function"]["Properties"]["Code"]["S3Key"]
+        assert function_key.endswith(".zip")
+        assert (
+            s3_client.get_object(Bucket=BUCKET_NAME, Key=function_key)["Body"].read()
+            == project.joinpath("prebuilt.zip").read_bytes()
+        )
+        layer_key = packaged["Resources"]["Layer"]["Properties"]["Content"]["S3Key"]
+        assert layer_key.endswith(".jar")
+        assert (
+            s3_client.get_object(Bucket=BUCKET_NAME, Key=layer_key)["Body"].read()
+            == b"PK jar"
+        )
+
+    def test_large_artifact_uploads_in_parts(self, s3_client, tmp_path):
+        tmp_path.joinpath("code").mkdir()
+        tmp_path.joinpath("code/blob.bin").write_bytes(os.urandom(11 * 1024 * 1024))
+        packager = TemplatePackager(
+            s3_client,
+            BUCKET_NAME,
+            BUCKET_URL,
+            multipart_threshold=5 * 1024 * 1024,
+            multipart_chunksize=5 * 1024 * 1024,
+        )
+        packaged = packager.package(
+            {
+                "Resources": {
+                    "Function": {
+                        "Type": "AWS::Lambda::Function",
+                        "Properties": {"Code": "code"},
+                    }
+                }
+            },
+            tmp_path,
+        )
+        assert packager.upload() == {key: "uploaded" for key in packager_keys(packaged)}
+
+        key = packaged["Resources"]["Function"]["Properties"]["Code"]["S3Key"]
+        head = s3_client.head_object(Bucket=BUCKET_NAME, Key=key)
+        # Multipart uploads have an ETag of the form <hash>-<number of parts>.
+        assert head["ETag"].strip('"').endswith("-3")
+
+    def test_missing_local_path(self, s3_client, tmp_path):
+        with pytest.raises(Exception):
+            TemplatePackager(s3_client, BUCKET_NAME, BUCKET_URL).package(
+                parent_template(), tmp_path
+            )
+
+    def test_nested_template_cycle(self, s3_client, tmp_path):
+        nested_stack = {
+            "Type": "AWS::CloudFormation::Stack",
+            "Properties": {"TemplateURL": "a.json"},
+        }
+        tmp_path.joinpath("a.json").write_text(
+            json.dumps({"Resources": {"Self": nested_stack}})
+        )
+        with pytest.raises(Exception, match="cycle"):
+            TemplatePackager(s3_client, BUCKET_NAME, BUCKET_URL).package(
+                {"Resources": {"A": nested_stack}}, tmp_path
+            )
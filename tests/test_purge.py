@@ -0,0 +1,152 @@
+import boto3
+import pytest
+from moto import mock_cloudformation, mock_s3
+
+from bettercf.initialisation import BetterCfInstance
+from bettercf.purge import BucketPurger, purge_bucket, summarise_purge_result
+
+BUCKET_NAME = "cf-management-bucket-123456789"
+
+
+@pytest.fixture
+def s3_client():
+    with mock_s3():
+        s3_client = boto3.client("s3", region_name="us-east-1")
+        s3_client.create_bucket(Bucket=BUCKET_NAME)
+        s3_client.put_bucket_versioning(
+            Bucket=BUCKET_NAME, VersioningConfiguration={"Status": "Enabled"}
+        )
+        for i in range(20):
+            # Two versions of each template, then a delete marker on every other one.
+            for body in [b"one", b"two"]:
+                s3_client.put_object(Bucket=BUCKET_NAME, Key=f"foo/0.{i}", Body=body)
+            if i % 2:
+                s3_client.delete_object(Bucket=BUCKET_NAME, Key=f"foo/0.{i}")
+        s3_client.put_object(Bucket=BUCKET_NAME, Key=".index/foo.json", Body=b"{}")
+        s3_client.put_object(Bucket=BUCKET_NAME, Key=".artifacts/abc.zip", Body=b"zip")
+        yield s3_client
+
+
+def count_versions(s3_client):
+    response = s3_client.list_object_versions(Bucket=BUCKET_NAME)
+    return len(response.get("Versions", [])) + len(response.get("DeleteMarkers", []))
+
+
+class TestBucketPurger:
+    def test_dry_run_only_counts(self, s3_client, capsys):
+        result = BucketPurger(s3_client, BUCKET_NAME, batch_size=7).purge(dry_run=True)
+
+        assert (result.versions, result.delete_markers, result.deleted) == (42, 10, 0)
+        assert result.size == 40 * 3 + 2 + 3
+        assert result.prefixes == {"foo": 50, ".index": 1, ".artifacts": 1}
+        assert count_versions(s3_client) == 52
+
+        assert summarise_purge_result(result) == 0
+        output = capsys.readouterr().out
+        assert "Dry run: would delete 42 object version(s)" in output
+        assert "  .artifacts: 1" in output
+
+    def test_purge_deletes_every_version_in_batches(self, s3_client):
+        progress = []
+        result = BucketPurger(
+            s3_client,
+            BUCKET_NAME,
+            max_parallel=2,
+            batch_size=7,
+            on_progress=lambda result: progress.append(result.deleted),
+        ).purge()
+
+        assert (result.deleted, result.batches, result.succeeded) == (52, 8, True)
+        assert sorted(progress) == progress and progress[-1] == 52
+        assert count_versions(s3_client) == 0
+
+    def test_purge_reports_per_key_errors(self, s3_client, monkeypatch):
+        delete_objects = s3_client.delete_objects
+
+        def failing_delete_objects(Bucket, Delete):
+            objects = Delete["Objects"]
+            if objects[0]["Key"].startswith("."):
+                raise Exception("Throttled")
+            return delete_objects(Bucket=Bucket, Delete=Delete)
+
+        monkeypatch.setattr(s3_client, "delete_objects", failing_delete_objects)
+        result = BucketPurger(
+            s3_client, BUCKET_NAME, batch_size=1, on_progress=lambda result: None
+        ).purge()
+
+        assert result.deleted == 50
+        assert sorted(error["Key"] for error in result.errors) == [
+            ".artifacts/abc.zip",
+            ".index/foo.json",
+        ]
+        assert result.errors[0]["Message"] == "Throttled"
+        assert summarise_purge_result(result) == 1
+
+    def test_invalid_batch_size(self, s3_client):
+        with pytest.raises(Exception):
+            BucketPurger(s3_client, BUCKET_NAME, batch_size=1001)
+
+
+class TestTeardown:
+    @pytest.fixture(autouse=True)
+    def management_bucket_name(self, monkeypatch):
+        monkeypatch.setattr(
+            "bettercf.initialisation.get_management_bucket_name", lambda: BUCKET_NAME
+        )
+
+    @pytest.fixture
+    def cf_client(self):
+        with mock_cloudformation():
+            cf_client = boto3.client("cloudformation")
+            cf_client.create_stack(
+                StackName="BetterCF-management",
+                TemplateBody='{"AWSTemplateFormatVersion":"2010-09-09","Resources":{}}',
+            )
+            yield cf_client
+
+    def test_teardown_dry_run_deletes_nothing(self, s3_client, cf_client):
+        BetterCfInstance().teardown(empty_bucket_first=True, dry_run=True)
+
+        assert count_versions(s3_client) == 52
+        assert (
+            cf_client.describe_stacks(StackName="BetterCF-management")["Stacks"][0][
+                "StackStatus"
+            ]
+            == "CREATE_COMPLETE"
+        )
+
+    def test_teardown_purges_then_deletes_stack(self, s3_client, cf_client):
+        BetterCfInstance().teardown(empty_bucket_first=True)
+
+        assert count_versions(s3_client) == 0
+        assert cf_client.list_stacks()["StackSummaries"][0]["StackStatus"] == (
+            "DELETE_COMPLETE"
+        )
+
+    def test_teardown_keeps_stack_if_purge_fails(
+        self, s3_client, cf_client, monkeypatch
+    ):
+        def failing_delete_objects(Bucket, Delete):
+            return {
+                "Errors": [
+                    {**version, "Code": "AccessDenied", "Message": "Object locked"}
+                    for version in Delete["Objects"]
+                ]
+            }
+
+        monkeypatch.setattr(s3_client, "delete_objects", failing_delete_objects)
+        monkeypatch.setattr("bettercf.purge.get_client", lambda service: s3_client)
+
+        with pytest.raises(Exception, match="52 object version"):
+            BetterCfInstance().teardown(empty_bucket_first=True)
+        assert (
+            cf_client.describe_stacks(StackName="BetterCF-management")["Stacks"][0][
+                "StackStatus"
+            ]
+            == "CREATE_COMPLETE"
+        )
+
+
+def test_purge_bucket(s3_client, capsys):
+    assert purge_bucket(BUCKET_NAME, max_parallel=4).deleted == 52
+    assert "Deleted 52 of 52 listed" in capsys.readouterr().out
@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+
+from bettercf.results import BatchResult, count_unsuccessful, print_result, summarise
+
+
+@dataclass
+class Result(BatchResult):
+    name: str
+    status: str
+    duration: float = 1.0
+    error: str = None
+
+
+def test_print_result(capsys):
+    print_result(Result("foo", "created", 1.25), 1, 3)
+    print_result(Result("bar", "failed", 2, "Boom"), 2, 3)
+    assert capsys.readouterr().out.splitlines() == [
+        "[1/3] CREATED foo (1.2s)",
+        "[2/3] FAILED bar (2.0s): Boom",
+    ]
+
+
+def test_count_unsuccessful():
+    assert count_unsuccessful([Result("foo", "created")]) == "0 failed"
+    assert (
+        count_unsuccessful(
+            [Result("foo", "skipped"), Result("bar", "failed"), Result("baz", "ok")]
+        )
+        == "1 failed, 1 skipped"
+    )
+
+
+def test_summarise(capsys):
+    results = [Result("foo", "built"), Result("bar", "failed", error="Boom")]
+    assert summarise(results, "template(s)", "built", details="2.00s.") == 1
+    assert capsys.readouterr().out.splitlines() == [
+        "1 of 2 template(s) built, 1 failed. 2.00s.",
+        "  FAILED bar: Boom",
+    ]
+    assert summarise(results[:1], "template(s)", "built") == 0
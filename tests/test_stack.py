@@ -1,7 +1,11 @@
+import json
 from pathlib import Path
 
+import boto3
 import pytest
+from moto import mock_cloudformation, mock_s3, mock_ssm
 
+from bettercf.cache import template_cache
 from src.bettercf.region import Region
 from src.bettercf.stack import Stack
 from src.bettercf.template import Template
@@ -27,6 +31,26 @@ class TestStack:
             == Version("0.1").get_version_string()
         )
 
+    def test_load_stack_config_does_not_load_dfm_config(self, monkeypatch):
+        loads = []
+
+        def counting_load(**kwargs):
+            loads.append(kwargs)
+            return kwargs
+
+        monkeypatch.setattr(
+            "bettercf.template.BuildConfig.load_config_from_file", counting_load
+        )
+        cfg = Stack.load_stack_config_from_file(
+            Path(__file__).parent.joinpath("test_stack_configs/config.json")
+        )
+        assert loads == []
+
+        # Still loaded on demand (once), e.g for building.
+        assert cfg.template.dfm_config["parameters"] == {"TemplateName": "foo"}
+        assert cfg.template.dfm_config is cfg.template.dfm_config
+        assert len(loads) == 1
+
     def test_load_stack_config_from_file_missing_some_attributes_errors(self):
         with pytest.raises(Exception):
             Stack.load_stack_config_from_file(
@@ -174,7 +198,7 @@ class TestStack:
             {"ParameterKey": "foo", "ParameterValue": "bar", "UsePreviousValue": False}
         ]
 
-    # def test_deploy_with_overrides(self, monkeypatch):
+        # def test_deploy_with_overrides(self, monkeypatch):
         def get_mocked_management_bucket_url():
             return "https://cf-management-bucket-123456789.s3.us-east-1.amazonaws.com"
 
@@ -197,4 +221,139 @@ class TestStack:
         cfg.resource_overrides = {"foo": "bar"}
         cfg.deploy()
 
-        assert mock_cfn_create_or_update_args[1]["TemplateBody"] == {}
\ No newline at end of file
+        assert mock_cfn_create_or_update_args[1]["TemplateBody"] == {}
+
+
+TEMPLATE_BODY = b'{"AWSTemplateFormatVersion":"2010-09-09","Description":"A test template","Resources":{},"Outputs":{}}'
+
+
+@pytest.fixture
+def management_bucket():
+    with mock_ssm(), mock_s3(), mock_cloudformation():
+        boto3.client("ssm").put_parameter(
+            Name="/BetterCF/.management/BetterCF-management-bucket-name",
+            Type="String",
+            Value="cf-management-bucket-123456789",
+        )
+        s3_conn = boto3.client("s3", region_name="us-east-1")
+        s3_conn.create_bucket(Bucket="cf-management-bucket-123456789")
+        s3_conn.put_object(
+            Body=TEMPLATE_BODY, Bucket="cf-management-bucket-123456789", Key="foo/0.1"
+        )
+        yield s3_conn
+
+
+class TestStackFingerprint:
+    def load_stack(self):
+        return Stack.load_stack_config_from_file(
+            Path(__file__).parent.joinpath("test_stack_configs/config.json")
+        )
+
+    def test_deploy_skips_unchanged_stack(self, management_bucket):
+        assert self.load_stack().deploy() == "created"
+        assert self.load_stack().deploy() == "unchanged"
+        assert self.load_stack().deploy(force=True) == "updated"
+
+    def test_deploy_updates_when_role_arn_changes(self, management_bucket):
+        assert self.load_stack().deploy() == "created"
+        stack = self.load_stack()
+        stack.role_arn = "arn:aws:iam::123456789012:role/foo"
+        assert stack.deploy() == "updated"
+
+    def test_deploy_updates_when_template_is_repushed(self, management_bucket):
+        assert self.load_stack().deploy() == "created"
+        management_bucket.put_object(
+            Body=TEMPLATE_BODY.replace(b"A test template", b"A new description"),
+            Bucket="cf-management-bucket-123456789",
+            Key="foo/0.1",
+        )
+        assert self.load_stack().deploy() == "updated"
+
+    def test_deploy_with_overrides_uses_template_cache(self, management_bucket):
+        stack = self.load_stack()
+        stack.resource_overrides = {">>Description": "An overridden template"}
+        assert stack.deploy() == "created"
+
+        # Stacks deploy to the region in their config rather than the default region.
+        conn = boto3.client("cloudformation", region_name="eu-west-2")
+        assert (
+            conn.describe_stacks(StackName="foo-prod-euw2-bar")["Stacks"][0][
+                "Description"
+            ]
+            == "An overridden template"
+        )
+        assert template_cache._load_index()["cf-management-bucket-123456789/foo/0.1"][
+            "Size"
+        ] == len(TEMPLATE_BODY)
+
+    def test_deploy_overrides_local_template_without_modifying_it(
+        self, management_bucket
+    ):
+        stack = self.load_stack()
+        stack.resource_overrides = {">>Description": "An overridden template"}
+        local_template = json.loads(TEMPLATE_BODY)
+        assert stack.deploy(local_template_override=local_template) == "created"
+
+        conn = boto3.client("cloudformation", region_name="eu-west-2")
+        assert (
+            conn.describe_stacks(StackName="foo-prod-euw2-bar")["Stacks"][0][
+                "Description"
+            ]
+            == "An overridden template"
+        )
+        assert local_template == json.loads(TEMPLATE_BODY)
+
+    def test_deploy_to_each_region(self, management_bucket):
+        stacks = Stack.load_stack_configs_from_file(
+            Path(__file__).parent.joinpath("test_stack_configs/config.json"),
+            ["eu-west-1", "us-west-2"],
+        )
+        assert [stack.deploy() for stack in stacks] == ["created", "created"]
+
+        for region_name, stack_name in [
+            ("eu-west-1", "foo-prod-euw1-bar"),
+            ("us-west-2", "foo-prod-usw2-bar"),
+        ]:
+            conn = boto3.client("cloudformation", region_name=region_name)
+            assert (
+                conn.describe_stacks(StackName=stack_name)["Stacks"][0]["StackStatus"]
+                == "CREATE_COMPLETE"
+            )
+
+
+class TestMultiRegionStackConfig:
+    def write_config(self, tmp_path, region):
+        config = json.loads(
+            Path(__file__).parent.joinpath("test_stack_configs/config.json").read_text()
+        )
+        config["Region"] = region
+        config_path = tmp_path.joinpath("config.json")
+        config_path.write_text(json.dumps(config))
+        return config_path
+
+    def test_load_one_stack_per_region(self, tmp_path):
+        stacks = Stack.load_stack_configs_from_file(
+            self.write_config(tmp_path, ["eu-west-2", "us-east-1"])
+        )
+        assert [stack.generate_stack_name() for stack in stacks] == [
+            "foo-prod-euw2-bar",
+            "foo-prod-use1-bar",
+        ]
+        assert stacks[0].template is stacks[1].template
+
+    def test_regions_override_config(self, tmp_path):
+        stacks = Stack.load_stack_configs_from_file(
+            self.write_config(tmp_path, "eu-west-2"), ["ap-southeast-2"]
+        )
+        assert [stack.region.name for stack in stacks] == ["ap-southeast-2"]
+
+    def test_load_stack_config_from_file_rejects_several_regions(self, tmp_path):
+        with pytest.raises(Exception):
+            Stack.load_stack_config_from_file(
+                self.write_config(tmp_path, ["eu-west-2", "us-east-1"])
+            )
+
+    def test_invalid_regions(self, tmp_path):
+        for region in [[], ["eu-west-2", "eu-west-2"], ["eu-nowhere-1"]]:
+            with pytest.raises(Exception):
+                Stack.load_stack_configs_from_file(self.write_config(tmp_path, region))
@@ -0,0 +1,339 @@
+import boto3
+import pytest
+from botocore.exceptions import ClientError, ParamValidationError
+from moto import mock_s3
+
+from bettercf.template import Template
+from bettercf.template_index import TemplateIndex
+from bettercf.utils import TEMPLATE_HASH_METADATA_KEY, generate_template_hash
+from bettercf.version import Version
+
+BUCKET_NAME = "cf-management-bucket-123456789"
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    monkeypatch.setattr(
+        "bettercf.template.get_management_bucket_name", lambda: BUCKET_NAME
+    )
+    with mock_s3():
+        conn = boto3.client("s3", region_name="us-east-1")
+        conn.create_bucket(Bucket=BUCKET_NAME)
+        yield conn
+
+
+@pytest.fixture
+def conditional_s3_client(s3_client, monkeypatch):
+    """
+    Synopsis: The s3_client, enforcing the IfMatch and IfNoneMatch conditions of its writes as S3 does (moto ignores them).
+    """
+
+    def check_condition(Bucket, Key, IfMatch=None, IfNoneMatch=None):
+        try:
+            etag = s3_client.head_object(Bucket=Bucket, Key=Key)["ETag"]
+        except ClientError:
+            etag = None
+        if (IfNoneMatch == "*" and etag) or (IfMatch and IfMatch != etag):
+            raise ClientError(
+                {
+                    "Error": {"Code": "PreconditionFailed", "Message": Key},
+                    "ResponseMetadata": {"HTTPStatusCode": 412},
+                },
+                "PutObject",
+            )
+
+    def conditional(write):
+        def conditional_write(IfMatch=None, IfNoneMatch=None, **kwargs):
+            check_condition(kwargs["Bucket"], kwargs["Key"], IfMatch, IfNoneMatch)
+            return write(**kwargs)
+
+        return conditional_write
+
+    monkeypatch.setattr(s3_client, "put_object", conditional(s3_client.put_object))
+    monkeypatch.setattr(s3_client, "copy_object", conditional(s3_client.copy_object))
+    monkeypatch.setattr("bettercf.template.get_client", lambda service: s3_client)
+    return s3_client
+
+
+@pytest.fixture
+def unconditional_s3_client(s3_client, monkeypatch):
+    """
+    Synopsis: The s3_client, behaving like a botocore release from before S3 supported conditional writes.
+    """
+
+    def unconditional(write):
+        def unconditional_write(**kwargs):
+            if "IfMatch" in kwargs or "IfNoneMatch" in kwargs:
+                raise ParamValidationError(report="Unknown parameter")
+            return write(**kwargs)
+
+        return unconditional_write
+
+    monkeypatch.setattr(s3_client, "put_object", unconditional(s3_client.put_object))
+    monkeypatch.setattr(s3_client, "copy_object", unconditional(s3_client.copy_object))
+    for module in ["bettercf.template", "bettercf.template_index"]:
+        monkeypatch.setattr(
+            f"{module}.supports_conditional_writes", lambda *args, **kwargs: False
+        )
+    monkeypatch.setattr("bettercf.template.get_client", lambda service: s3_client)
+    return s3_client
+
+
+class TestTemplateIndex:
+    def test_versions_are_sorted_numerically(self):
+        index = TemplateIndex(
+            "foo",
+            [{"Version": version, "Size": 1} for version in ["0.10", "0.9", "0.2"]],
+        )
+        assert index.get_version_strings() == ["0.2", "0.9", "0.10"]
+        assert index.get_latest_version() == "0.10"
+
+    def test_add_version_replaces_existing_entry(self):
+        index = TemplateIndex("foo")
+        index.add_version("1.0", size=1, sha256="a")
+        index.add_version("1.0", size=2, sha256="b")
+        assert index.get_version_strings() == ["1.0"]
+        assert index.get_version("1.0")["Sha256"] == "b"
+
+    def test_load_missing_index(self, s3_client):
+        assert TemplateIndex.load(s3_client, BUCKET_NAME, "foo") is None
+
+    def test_rebuild_pages_through_every_version(self, s3_client):
+        for minor in range(5):
+            s3_client.put_object(Body=b"foo", Bucket=BUCKET_NAME, Key=f"foo/0.{minor}")
+        s3_client.put_object(Body=b"foo", Bucket=BUCKET_NAME, Key="foobar/9.9")
+
+        index = TemplateIndex.rebuild(s3_client, BUCKET_NAME, "foo", page_size=2)
+        assert index.get_version_strings() == ["0.0", "0.1", "0.2", "0.3", "0.4"]
+        assert (
+            TemplateIndex.load(s3_client, BUCKET_NAME, "foo").get_version_strings()
+            == index.get_version_strings()
+        )
+
+    def test_push_updates_index(self, s3_client):
+        Template.push_mechanism("foo", Version("0.1"), '{"foo": "bar"}')
+        Template.push_mechanism("foo", Version("0.2"), b'{"foo": "baz"}')
+
+        index = TemplateIndex.load(s3_client, BUCKET_NAME, "foo")
+        assert index.get_version_strings() == ["0.1", "0.2"]
+        assert index.get_version("0.2")["Size"] == len(b'{"foo": "baz"}')
+        assert index.get_version("0.2")["Sha256"] is not None
+
+    def test_push_indexes_previously_unindexed_versions(self, s3_client):
+        s3_client.put_object(Body=b"foo", Bucket=BUCKET_NAME, Key="foo/0.1")
+        Template.push_mechanism("foo", Version("0.2"), "foo")
+        assert TemplateIndex.load(
+            s3_client, BUCKET_NAME, "foo"
+        ).get_version_strings() == ["0.1", "0.2"]
+
+    def test_detect_latest_version_reads_index(self, s3_client, monkeypatch):
+        Template.push_mechanism("foo", Version("0.9"), "foo")
+        Template.push_mechanism("foo", Version("0.10"), "foo")
+
+        def unexpected_listing(*args, **kwargs):
+            raise Exception("Should have been read from the index.")
+
+        monkeypatch.setattr(TemplateIndex, "list_version_objects", unexpected_listing)
+        assert Template.detect_latest_version("foo") == "0.10"
+        assert [entry["Version"] for entry in Template.list_versions("foo")] == [
+            "0.9",
+            "0.10",
+        ]
+
+    def test_detect_latest_version_without_index(self, s3_client):
+        s3_client.put_object(Body=b"foo", Bucket=BUCKET_NAME, Key="foo/0.1")
+        s3_client.put_object(Body=b"foo", Bucket=BUCKET_NAME, Key="foo/0.2")
+        assert Template.detect_latest_version("foo") == "0.2"
+
+    def test_detect_latest_version_no_versions(self, s3_client):
+        with pytest.raises(Exception):
+            Template.detect_latest_version("foo")
+
+    def test_push_stores_content_hash_metadata(self, s3_client):
+        assert Template.push_mechanism("foo", Version("0.1"), '{"foo": "bar"}') == (
+            "uploaded"
+        )
+        assert s3_client.head_object(Bucket=BUCKET_NAME, Key="foo/0.1")["Metadata"] == {
+            TEMPLATE_HASH_METADATA_KEY: generate_template_hash(b'{"foo": "bar"}')
+        }
+
+    def test_push_dedupe_skip(self, s3_client):
+        Template.push_mechanism("foo", Version("0.1"), '{"foo": "bar"}')
+        assert (
+            Template.push_mechanism(
+                "foo", Version("0.2"), '{ "foo":"bar" }', dedupe="skip"
+            )
+            == "deduplicated"
+        )
+        assert "Contents" not in s3_client.list_objects_v2(
+            Bucket=BUCKET_NAME, Prefix="foo/0.2"
+        )
+        assert Template.detect_latest_version("foo") == "0.1"
+
+    def test_push_dedupe_alias(self, s3_client):
+        Template.push_mechanism("foo", Version("0.1"), '{"foo": "bar"}')
+        assert (
+            Template.push_mechanism(
+                "foo", Version("0.2"), '{"foo": "bar"}', dedupe="alias"
+            )
+            == "deduplicated"
+        )
+        assert (
+            s3_client.get_object(Bucket=BUCKET_NAME, Key="foo/0.2")["Body"].read()
+            == b'{"foo": "bar"}'
+        )
+        assert (
+            TemplateIndex.load(s3_client, BUCKET_NAME, "foo").get_version("0.2")[
+                "AliasOf"
+            ]
+            == "0.1"
+        )
+
+    def test_push_dedupe_alias_without_conditional_copy(
+        self, conditional_s3_client, monkeypatch
+    ):
+        copy_object = conditional_s3_client.copy_object
+
+        def unconditional_copy_object(**kwargs):
+            if "IfNoneMatch" in kwargs:
+                raise ParamValidationError(report="Unknown parameter")
+            return copy_object(**kwargs)
+
+        monkeypatch.setattr(
+            conditional_s3_client, "copy_object", unconditional_copy_object
+        )
+        monkeypatch.setattr(
+            "bettercf.template.supports_conditional_writes",
+            lambda s3_client, operation="PutObject": operation == "PutObject",
+        )
+        Template.push_mechanism("foo", Version("0.1"), '{"foo": "bar"}')
+        assert (
+            Template.push_mechanism(
+                "foo", Version("0.2"), '{"foo": "bar"}', "alias", overwrite=False
+            )
+            == "deduplicated"
+        )
+        with pytest.raises(Exception, match="already exists"):
+            Template.push_mechanism(
+                "foo", Version("0.2"), '{"foo": "bar"}', "alias", overwrite=False
+            )
+
+    def test_push_dedupe_uploads_changed_template(self, s3_client):
+        Template.push_mechanism("foo", Version("0.1"), '{"foo": "bar"}')
+        assert (
+            Template.push_mechanism(
+                "foo", Version("0.2"), '{"foo": "baz"}', dedupe="skip"
+            )
+            == "uploaded"
+        )
+
+    def test_push_dedupe_checks_unindexed_latest_version(self, s3_client):
+        s3_client.put_object(
+            Body=b'{"foo": "bar"}',
+            Bucket=BUCKET_NAME,
+            Key="foo/0.1",
+            Metadata={
+                TEMPLATE_HASH_METADATA_KEY: generate_template_hash(b'{"foo": "bar"}')
+            },
+        )
+        assert (
+            Template.push_mechanism(
+                "foo", Version("0.2"), '{"foo": "bar"}', dedupe="skip"
+            )
+            == "deduplicated"
+        )
+
+    @pytest.mark.parametrize("existing_index", [True, False])
+    def test_interleaved_pushes_keep_both_versions(
+        self, conditional_s3_client, monkeypatch, existing_index
+    ):
+        if existing_index:
+            Template.push_mechanism("foo", Version("0.1"), "foo")
+        put_object = conditional_s3_client.put_object
+        interleaved = False
+
+        def interleaving_put_object(**kwargs):
+            # Push 0.3 between push 0.2 loading the index and saving it.
+            nonlocal interleaved
+            if kwargs["Key"] == ".index/foo.json" and not interleaved:
+                interleaved = True
+                Template.push_mechanism("foo", Version("0.3"), "bar")
+            return put_object(**kwargs)
+
+        monkeypatch.setattr(
+            conditional_s3_client, "put_object", interleaving_put_object
+        )
+        Template.push_mechanism("foo", Version("0.2"), "baz")
+
+        assert interleaved
+        assert TemplateIndex.load(
+            conditional_s3_client, BUCKET_NAME, "foo"
+        ).get_version_strings() == (["0.1"] if existing_index else []) + ["0.2", "0.3"]
+
+    def test_push_overwrites_existing_version_by_default(self, conditional_s3_client):
+        Template.push_mechanism("foo", Version("0.1"), "foo")
+        Template.push_mechanism("foo", Version("0.1"), "foobar")
+
+        assert (
+            conditional_s3_client.get_object(Bucket=BUCKET_NAME, Key="foo/0.1")[
+                "Body"
+            ].read()
+            == b"foobar"
+        )
+        assert TemplateIndex.load(
+            conditional_s3_client, BUCKET_NAME, "foo"
+        ).get_version("0.1")["Size"] == len("foobar")
+
+    def test_push_without_overwrite_keeps_existing_version(self, conditional_s3_client):
+        Template.push_mechanism("foo", Version("0.1"), "foo")
+        with pytest.raises(Exception, match="already exists"):
+            Template.push_mechanism("foo", Version("0.1"), "bar", overwrite=False)
+
+        assert (
+            conditional_s3_client.get_object(Bucket=BUCKET_NAME, Key="foo/0.1")[
+                "Body"
+            ].read()
+            == b"foo"
+        )
+        assert TemplateIndex.load(
+            conditional_s3_client, BUCKET_NAME, "foo"
+        ).get_version("0.1")["Size"] == len("foo")
+
+    def test_push_without_conditional_writes(self, unconditional_s3_client):
+        Template.push_mechanism("foo", Version("0.1"), "foo")
+        Template.push_mechanism("foo", Version("0.2"), "bar", overwrite=False)
+        with pytest.raises(Exception, match="already exists"):
+            Template.push_mechanism("foo", Version("0.2"), "baz", overwrite=False)
+
+        assert TemplateIndex.load(
+            unconditional_s3_client, BUCKET_NAME, "foo"
+        ).get_version_strings() == ["0.1", "0.2"]
+
+    def test_index_update_gives_up_after_max_attempts(
+        self, conditional_s3_client, monkeypatch
+    ):
+        TemplateIndex.rebuild(conditional_s3_client, BUCKET_NAME, "foo")
+        concurrent_pushes = []
+
+        def concurrent_change(index):
+            # Another update always saves the index first.
+            concurrent_pushes.append(f"1.{len(concurrent_pushes)}")
+            TemplateIndex.update(
+                conditional_s3_client,
+                BUCKET_NAME,
+                "foo",
+                lambda index: index.add_version(concurrent_pushes[-1], size=1),
+            )
+            index.add_version("0.1", size=1)
+
+        with pytest.raises(Exception, match="after 3 attempts"):
+            TemplateIndex.update(
+                conditional_s3_client,
+                BUCKET_NAME,
+                "foo",
+                concurrent_change,
+                max_attempts=3,
+            )
+        assert TemplateIndex.load(
+            conditional_s3_client, BUCKET_NAME, "foo"
+        ).get_version_strings() == ["1.0", "1.1", "1.2"]
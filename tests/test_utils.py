@@ -2,9 +2,13 @@ import boto3
 import pytest
 from moto import mock_cloudformation, mock_s3, mock_ssm
 
+from bettercf.clients import get_client
 from src.bettercf.utils import (
+    FINGERPRINT_TAG_KEY,
     cfn_create_or_update,
     cfn_delete_stack,
+    generate_stack_fingerprint,
+    generate_template_hash,
     get_latest_version,
     get_management_bucket_location,
     get_management_bucket_name,
@@ -175,6 +179,110 @@ class TestUtils:
             conn.list_stacks()["StackSummaries"][0]["StackStatus"] == "DELETE_COMPLETE"
         )
 
+    @mock_cloudformation
+    def test_cfn_delete_stack_describes_once(self, monkeypatch):
+        conn = boto3.client("cloudformation", region_name="eu-west-2")
+        conn.create_stack(
+            StackName="foo",
+            TemplateBody='{"AWSTemplateFormatVersion":"2010-09-09","Resources":{}}',
+        )
+        client = get_client("cloudformation", "eu-west-2")
+        describe_stacks = client.describe_stacks
+        described = []
+
+        def counting_describe_stacks(**kwargs):
+            described.append(kwargs["StackName"])
+            return describe_stacks(**kwargs)
+
+        monkeypatch.setattr(client, "describe_stacks", counting_describe_stacks)
+
+        assert cfn_delete_stack("foo", region_name="eu-west-2") == "deleted"
+        # One lookup by name, then (as the stack leaves the in-progress list) one read of its final status by id.
+        assert len(described) == 2
+        assert described[0] == "foo" and described[1].startswith("arn:")
+        assert (
+            conn.list_stacks()["StackSummaries"][0]["StackStatus"] == "DELETE_COMPLETE"
+        )
+
+    @mock_cloudformation
+    def test_cfn_delete_stack_missing(self):
+        assert cfn_delete_stack("foo", missing_ok=True) == "absent"
+        with pytest.raises(Exception, match="does not exist"):
+            cfn_delete_stack("foo")
+
+    def test_generate_stack_fingerprint_is_canonical(self):
+        fingerprint = generate_stack_fingerprint(
+            {
+                "TemplateBody": '{"Resources": {}, "AWSTemplateFormatVersion": "2010-09-09"}',
+                "Parameters": [
+                    {"ParameterKey": "A", "ParameterValue": "1"},
+                    {"ParameterKey": "B", "ParameterValue": "2"},
+                ],
+                "Capabilities": ["CAPABILITY_NAMED_IAM", "CAPABILITY_AUTO_EXPAND"],
+            }
+        )
+        assert fingerprint == generate_stack_fingerprint(
+            {
+                "TemplateBody": '{"AWSTemplateFormatVersion":"2010-09-09","Resources":{}}',
+                "Parameters": [
+                    {"ParameterKey": "B", "ParameterValue": "2"},
+                    {"ParameterKey": "A", "ParameterValue": "1"},
+                ],
+                "Capabilities": ["CAPABILITY_AUTO_EXPAND", "CAPABILITY_NAMED_IAM"],
+            }
+        )
+
+    def test_generate_template_hash_is_canonical(self):
+        assert generate_template_hash(
+            b'{"Resources": {}, "AWSTemplateFormatVersion": "2010-09-09"}'
+        ) == generate_template_hash(
+            b'{"AWSTemplateFormatVersion":"2010-09-09","Resources":{}}'
+        )
+        assert generate_template_hash(b"Resources: {}") != generate_template_hash(
+            b"Resources: []"
+        )
+
+    def test_generate_stack_fingerprint_detects_changes(self):
+        boto3_kwargs = {
+            "TemplateURL": "https://foo.s3.us-east-1.amazonaws.com/foo/0.1",
+            "Parameters": [{"ParameterKey": "A", "ParameterValue": "1"}],
+        }
+        fingerprint = generate_stack_fingerprint(boto3_kwargs, '"etag1"')
+        assert fingerprint != generate_stack_fingerprint(boto3_kwargs, '"etag2"')
+        assert fingerprint != generate_stack_fingerprint(
+            {**boto3_kwargs, "RoleARN": "foo"}, '"etag1"'
+        )
+        assert fingerprint != generate_stack_fingerprint(
+            {
+                **boto3_kwargs,
+                "Parameters": [{"ParameterKey": "A", "ParameterValue": "2"}],
+            },
+            '"etag1"',
+        )
+
+    @mock_cloudformation
+    def test_cfn_create_or_update_skips_unchanged_stack(self):
+        def boto3_kwargs(fingerprint):
+            return {
+                "StackName": "foo",
+                "TemplateBody": '{"AWSTemplateFormatVersion":"2010-09-09","Description":"A test template","Resources":{},"Outputs":{}}',
+                "TimeoutInMinutes": 30,
+                "OnFailure": "ROLLBACK",
+                "Tags": [{"Key": FINGERPRINT_TAG_KEY, "Value": fingerprint}],
+            }
+
+        assert cfn_create_or_update("foo", boto3_kwargs("abc")) == "created"
+        assert cfn_create_or_update("foo", boto3_kwargs("abc")) == "unchanged"
+        assert (
+            cfn_create_or_update("foo", boto3_kwargs("abc"), skip_unchanged=False)
+            == "updated"
+        )
+        assert cfn_create_or_update("foo", boto3_kwargs("def")) == "updated"
+        conn = boto3.client("cloudformation")
+        assert conn.describe_stacks(StackName="foo")["Stacks"][0]["Tags"] == [
+            {"Key": FINGERPRINT_TAG_KEY, "Value": "def"}
+        ]
+
     def test_is_non_empty_string_happy_path(self):
         string = "foo"
         assert is_non_empty_string(string) is True
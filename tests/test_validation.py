@@ -0,0 +1,114 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from bettercf.stack import Stack
+from bettercf.validation import (
+    summarise_validation_results,
+    validate_stack_config,
+    validate_stack_configs,
+)
+
+STACK_CONFIGS_PATH = Path(__file__).parent.joinpath("test_stack_configs")
+
+
+def load_config(file_name: str = "config.json"):
+    return json.loads(STACK_CONFIGS_PATH.joinpath(file_name).read_text())
+
+
+class TestValidateStackConfig:
+    def test_valid_config(self):
+        assert validate_stack_config(load_config()) == []
+
+    def test_reports_every_error(self):
+        config = load_config()
+        config["Extra"] = True
+        config["Region"] = "eu-nowhere-1"
+        config["Template"] = {"Name": "", "Version": "1"}
+        del config["EnvType"]
+
+        assert validate_stack_config(config) == [
+            "Unexpected key 'Extra'.",
+            "Missing required key 'EnvType'.",
+            "'Region' value \"eu-nowhere-1\" must be an AWS region name, e.g 'eu-west-2', or a non-empty list of distinct AWS region names.",
+            "'Template.Name' value \"\" must be a non-empty string.",
+            "'Template.Version' value \"1\" must be a version of the 'X.Y' or 'X.Y.Z' format.",
+        ]
+
+    def test_nested_object_of_wrong_type(self):
+        config = load_config()
+        config["Template"] = "foo"
+        assert validate_stack_config(config) == [
+            "'Template' value \"foo\" must be a dictionary."
+        ]
+
+    def test_invalid_overrides(self):
+        config = load_config()
+        config["ResourceOverrides"] = {"Bucket": {"^^Tags": "not a list or dict"}}
+        errors = validate_stack_config(config)
+        assert len(errors) == 1
+        assert errors[0].startswith("'ResourceOverrides' are invalid")
+
+    def test_depends_on_is_optional(self):
+        config = load_config()
+        config["DependsOn"] = ["../network/vpc.json"]
+        assert validate_stack_config(config) == []
+
+        config["DependsOn"] = ["vpc.json", "vpc.json", ""]
+        assert validate_stack_config(config) == [
+            '\'DependsOn\' value ["vpc.json", "vpc.json", ""] must be a list of distinct non-empty strings.'
+        ]
+
+    def test_not_an_object(self):
+        assert validate_stack_config([]) == ["A stack config must be a JSON object."]
+
+    def test_stack_load_reports_every_error(self, tmp_path):
+        config = load_config()
+        config["Unexpected"] = 1
+        config["Identifier"] = ""
+        config_path = tmp_path.joinpath("config.json")
+        config_path.write_text(json.dumps(config))
+
+        with pytest.raises(Exception) as e:
+            Stack.load_stack_config_from_file(config_path)
+        assert "Unexpected key 'Unexpected'." in str(e.value)
+        assert "'Identifier' value \"\" must be a non-empty string." in str(e.value)
+
+
+class TestValidateStackConfigs:
+    @pytest.fixture
+    def config_paths(self, tmp_path):
+        tmp_path.joinpath("bad.json").write_text("{")
+        return sorted(STACK_CONFIGS_PATH.glob("*.json")) + [tmp_path / "bad.json"]
+
+    def test_results_in_order(self, config_paths):
+        results = validate_stack_configs(config_paths, max_parallel=1)
+        assert [result.config_path for result in results] == config_paths
+        assert [result.succeeded for result in results].count(True) == 1
+        assert results[-1].errors[0].startswith("Could not read")
+
+    def test_parallel_matches_serial(self, config_paths, monkeypatch):
+        monkeypatch.setattr("bettercf.validation.PARALLEL_VALIDATION_THRESHOLD", 0)
+        assert validate_stack_configs(
+            config_paths, max_parallel=2
+        ) == validate_stack_configs(config_paths, max_parallel=1)
+
+    def test_summarise_json(self, config_paths, capsys):
+        results = validate_stack_configs(config_paths, max_parallel=1)
+        assert summarise_validation_results(results, "json") == 1
+        report = json.loads(capsys.readouterr().out)
+        assert report["Valid"] is False
+        assert len(report["Results"]) == len(config_paths)
+        assert report["Results"][0] == {
+            "ConfigPath": str(config_paths[0]),
+            "Valid": True,
+            "Errors": [],
+        }
+
+    def test_summarise_text(self, capsys):
+        results = validate_stack_configs(
+            [STACK_CONFIGS_PATH.joinpath("config.json")], max_parallel=1
+        )
+        assert summarise_validation_results(results) == 0
+        assert "1 of 1 stack config(s) valid, 0 invalid." in capsys.readouterr().out
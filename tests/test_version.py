@@ -1,6 +1,6 @@
 import pytest
 
-from bettercf.version import Version
+from bettercf.version import Version, get_latest_version
 
 
 class TestVersion:
@@ -66,12 +66,12 @@ class TestVersion:
 
     def test_major_version_increment_no_micro_happy_path(self):
         ver = Version("1.2")
-        ver.major_version_increment()
+        ver = ver.major_version_increment()
         assert (ver.major, ver.minor) == (2, 0)
 
     def test_major_version_increment_with_micro_happy_path(self):
         ver = Version("1.2.3")
-        ver.major_version_increment()
+        ver = ver.major_version_increment()
         assert (ver.major, ver.minor, ver.micro) == (2, 0, 0)
 
     """
@@ -80,12 +80,12 @@ class TestVersion:
 
     def test_minor_version_increment_no_micro_happy_path(self):
         ver = Version("1.2")
-        ver.minor_version_increment()
+        ver = ver.minor_version_increment()
         assert (ver.major, ver.minor) == (1, 3)
 
     def test_minor_version_increment_with_micro_happy_path(self):
         ver = Version("1.2.3")
-        ver.minor_version_increment()
+        ver = ver.minor_version_increment()
         assert (ver.major, ver.minor, ver.micro) == (1, 3, 0)
 
     """
@@ -94,7 +94,7 @@ class TestVersion:
 
     def test_micro_version_increment_with_micro_happy_path(self):
         ver = Version("1.2.3")
-        ver.micro_version_increment()
+        ver = ver.micro_version_increment()
         assert (ver.major, ver.minor, ver.micro) == (1, 2, 4)
 
     def test_micro_version_increment_no_micro_errors(self):
@@ -108,18 +108,18 @@ class TestVersion:
 
     def test_auto_increment_version_with_micro_happy_path(self):
         ver = Version("1.2.3")
-        ver.auto_increment_version()
+        ver = ver.auto_increment_version()
         assert (ver.major, ver.minor, ver.micro) == (1, 3, 0)
-        ver.auto_increment_version(major_increment=True)
+        ver = ver.auto_increment_version(major_increment=True)
         assert (ver.major, ver.minor, ver.micro) == (2, 0, 0)
-        ver.auto_increment_version(micro_increment=True)
+        ver = ver.auto_increment_version(micro_increment=True)
         assert (ver.major, ver.minor, ver.micro) == (2, 0, 1)
 
     def test_auto_increment_version_no_micro_happy_path(self):
         ver = Version("1.2")
-        ver.auto_increment_version()
+        ver = ver.auto_increment_version()
         assert (ver.major, ver.minor) == (1, 3)
-        ver.auto_increment_version(major_increment=True)
+        ver = ver.auto_increment_version(major_increment=True)
         assert (ver.major, ver.minor) == (2, 0)
 
     def test_auto_increment_version_no_micro_errors_when_micro_increment_is_true(self):
@@ -131,3 +131,70 @@ class TestVersion:
         ver = Version("1.2")
         with pytest.raises(Exception):
             ver.auto_increment_version(True, True)
+
+    """
+    Immutability, Ordering and Hashing Tests
+    """
+
+    def test_increment_returns_new_version(self):
+        ver = Version("1.2")
+        assert ver.auto_increment_version() == Version("1.3")
+        assert ver == Version("1.2")
+
+    def test_is_immutable(self):
+        ver = Version("1.2.3")
+        with pytest.raises(AttributeError):
+            ver.major = 2
+        with pytest.raises(AttributeError):
+            ver.micro = 4
+        with pytest.raises(AttributeError):
+            del ver.minor
+
+    def test_ordering(self):
+        versions = [Version(v) for v in ["0.10", "0.9", "1.0.0", "0.9.1", "1.0"]]
+        assert [str(ver) for ver in sorted(versions)] == [
+            "0.9",
+            "0.9.1",
+            "0.10",
+            "1.0",
+            "1.0.0",
+        ]
+        assert max(versions) == Version("1.0.0")
+        assert Version("1.2") < Version("1.2.0") < Version("1.2.1") < Version("1.3")
+        assert Version("2.0") >= Version("2.0") > Version("1.99.99")
+
+    def test_hashing(self):
+        assert Version("1.2") == Version("1.2")
+        assert Version("1.2") != Version("1.2.0")
+        assert len({Version("1.2"), Version("1.2"), Version("1.2.0")}) == 2
+        assert Version("1.2") != "1.2"
+
+    def test_pickle_and_copy(self):
+        import copy
+        import pickle
+
+        ver = Version("1.2.3")
+        assert pickle.loads(pickle.dumps(ver)) == ver
+        assert copy.deepcopy(Version("1.2")).get_version_string() == "1.2"
+
+    def test_bad_types(self):
+        for bad_version in ["1.2.3.4", "1.2\n", "v1.2", "", None, 1.2]:
+            with pytest.raises(Exception):
+                Version(bad_version)
+
+
+class TestGetLatestVersion:
+    def test_mixed_formats(self):
+        assert get_latest_version(["0.9", "0.10", "0.10.0", "0.2.5"]) == "0.10.0"
+
+    def test_keys_with_prefix(self):
+        keys = [f"foo/{major}.{minor}" for major in range(3) for minor in range(20)]
+        assert get_latest_version(reversed(keys), prefix="foo/") == "foo/2.19"
+
+    def test_key_without_prefix_errors(self):
+        with pytest.raises(Exception):
+            get_latest_version(["foo/0.1", "bar/0.2"], prefix="foo/")
+
+    def test_empty_errors(self):
+        with pytest.raises(Exception):
+            get_latest_version([])
@@ -0,0 +1,320 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pytest
+from moto import mock_cloudformation
+
+from bettercf.utils import cfn_create_or_update, cfn_delete_stack, wait_for_stack
+from bettercf.waiter import StackStatusPoller, Waiter
+
+TEMPLATE_BODY = '{"AWSTemplateFormatVersion":"2010-09-09","Description":"A test template","Resources":{},"Outputs":{}}'
+
+
+class FakeClock:
+    """
+    A clock that only moves forward when something sleeps on it.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def fake_waiter(fake_clock, **kwargs):
+    return Waiter(
+        clock=fake_clock.clock, sleep=fake_clock.sleep, random=lambda: 0.5, **kwargs
+    )
+
+
+def scripted_poll(results):
+    results = iter(results)
+    return lambda: next(results)
+
+
+class TestWaiter:
+    def test_wait_returns_immediately_on_terminal_state(self):
+        fake_clock = FakeClock()
+        result = fake_waiter(fake_clock).wait(
+            scripted_poll(["CREATE_COMPLETE"]),
+            lambda status: status.endswith("COMPLETE"),
+        )
+        assert result == "CREATE_COMPLETE"
+        assert fake_clock.sleeps == []
+
+    def test_wait_backs_off_exponentially_up_to_max_delay(self):
+        fake_clock = FakeClock()
+        waiter = fake_waiter(fake_clock, initial_delay=1, backoff=2, max_delay=5)
+        result = waiter.wait(
+            scripted_poll([False] * 5 + [True]), lambda is_done: is_done
+        )
+        assert result is True
+        assert fake_clock.sleeps == [1, 2, 4, 5, 5]
+
+    def test_wait_applies_jitter(self):
+        fake_clock = FakeClock()
+        waiter = Waiter(
+            initial_delay=10,
+            backoff=1,
+            max_delay=10,
+            jitter=0.2,
+            clock=fake_clock.clock,
+            sleep=fake_clock.sleep,
+            random=scripted_poll([0.0, 1.0]),
+        )
+        waiter.wait(scripted_poll([False, False, True]), lambda is_done: is_done)
+        assert fake_clock.sleeps == pytest.approx([8, 12])
+
+    def test_wait_times_out(self):
+        fake_clock = FakeClock()
+        waiter = fake_waiter(fake_clock, initial_delay=1, backoff=2, timeout=10)
+        with pytest.raises(Exception):
+            waiter.wait(lambda: "CREATE_IN_PROGRESS", lambda status: False)
+        assert sum(fake_clock.sleeps) <= 10
+
+    def test_wait_configured_from_environment(self, monkeypatch):
+        monkeypatch.setenv("BETTERCF_WAITER_INITIAL_DELAY", "0.5")
+        monkeypatch.setenv("BETTERCF_WAITER_MAX_DELAY", "8")
+        waiter = Waiter()
+        assert (waiter.initial_delay, waiter.max_delay, waiter.timeout) == (
+            0.5,
+            8,
+            None,
+        )
+
+    def test_invalid_configuration_errors(self):
+        for kwargs in [
+            {"initial_delay": 10, "max_delay": 1},
+            {"backoff": 0.5},
+            {"jitter": 1},
+        ]:
+            with pytest.raises(Exception):
+                Waiter(**kwargs)
+
+    @mock_cloudformation
+    def test_cfn_create_or_update_and_delete_without_sleeping(self):
+        fake_clock = FakeClock()
+        kwargs = {
+            "StackName": "foo",
+            "TemplateBody": TEMPLATE_BODY,
+            "TimeoutInMinutes": 30,
+            "OnFailure": "ROLLBACK",
+        }
+        assert (
+            cfn_create_or_update("foo", dict(kwargs), waiter=fake_waiter(fake_clock))
+            == "created"
+        )
+        cfn_delete_stack("foo", waiter=fake_waiter(fake_clock))
+
+        # moto completes stacks instantly, so the terminal state is seen on the first poll.
+        assert fake_clock.sleeps == []
+
+    @mock_cloudformation
+    def test_wait_for_stack_polls_until_terminal(self, monkeypatch):
+        fake_clock = FakeClock()
+        client = boto3.client("cloudformation")
+        client.create_stack(StackName="foo", TemplateBody=TEMPLATE_BODY)
+
+        statuses = iter(["CREATE_IN_PROGRESS", "CREATE_IN_PROGRESS"])
+        describe_stacks = client.describe_stacks
+
+        def slow_describe_stacks(**kwargs):
+            response = describe_stacks(**kwargs)
+            response["Stacks"][0]["StackStatus"] = next(
+                statuses, response["Stacks"][0]["StackStatus"]
+            )
+            return response
+
+        monkeypatch.setattr(client, "describe_stacks", slow_describe_stacks)
+
+        status = wait_for_stack(
+            client, "foo", fake_waiter(fake_clock, initial_delay=1, backoff=3)
+        )
+        assert status == "CREATE_COMPLETE"
+        assert fake_clock.sleeps == [1, 3]
+
+
+class FakeCloudFormationClient:
+    """
+    Serves ListStacks (paginated, filtered by status) and DescribeStacks from a dict of stack name to status,
+    counting the calls made.
+    """
+
+    def __init__(self, statuses, page_size=100):
+        self.statuses = statuses
+        self.page_size = page_size
+        self.list_stacks_calls = 0
+        self.describe_stacks_calls = 0
+
+    def get_paginator(self, operation_name):
+        assert operation_name == "list_stacks"
+        return self
+
+    def paginate(self, StackStatusFilter):
+        summaries = [
+            {"StackId": f"id/{name}", "StackName": name, "StackStatus": status}
+            for name, status in self.statuses.items()
+            if status in StackStatusFilter
+        ]
+        for start in range(0, max(len(summaries), 1), self.page_size):
+            self.list_stacks_calls += 1
+            yield {"StackSummaries": summaries[start : start + self.page_size]}
+
+    def describe_stacks(self, StackName):
+        self.describe_stacks_calls += 1
+        return {"Stacks": [{"StackStatus": self.statuses[StackName]}]}
+
+
+def without_thread(poller):
+    # Watch stacks without starting the background thread, so the test drives every tick.
+    poller._thread = "test"
+    return poller
+
+
+class TestStackStatusPoller:
+    def test_tick_cost_does_not_grow_with_stacks_in_flight(self):
+        names = [f"stack-{i}" for i in range(50)]
+        client = FakeCloudFormationClient(
+            {name: "CREATE_IN_PROGRESS" for name in names}
+        )
+        poller = without_thread(StackStatusPoller())
+        watches = [poller.watch(client, name) for name in names]
+
+        for _ in range(3):
+            poller.tick()
+        assert (client.list_stacks_calls, client.describe_stacks_calls) == (3, 0)
+        assert not any(watch.done.is_set() for watch in watches)
+
+        # Finished stacks are described once each, to read their final status.
+        client.statuses["stack-0"] = "CREATE_COMPLETE"
+        client.statuses["stack-1"] = "ROLLBACK_COMPLETE"
+        poller.tick()
+        assert (client.list_stacks_calls, client.describe_stacks_calls) == (4, 2)
+        assert [watches[0].status, watches[1].status] == [
+            "CREATE_COMPLETE",
+            "ROLLBACK_COMPLETE",
+        ]
+        assert not watches[2].done.is_set()
+
+        poller.tick()
+        assert (client.list_stacks_calls, client.describe_stacks_calls) == (5, 2)
+
+    def test_tick_pages_through_in_progress_stacks(self):
+        client = FakeCloudFormationClient(
+            {f"stack-{i}": "UPDATE_IN_PROGRESS" for i in range(250)}, page_size=100
+        )
+        poller = without_thread(StackStatusPoller())
+        watch = poller.watch(client, "id/stack-249")
+        poller.tick()
+        assert client.list_stacks_calls == 3
+        assert not watch.done.is_set()
+
+    def test_unlisted_stack_still_in_progress_is_kept(self):
+        # A stack that has only just been created may not be listed yet.
+        client = FakeCloudFormationClient({"foo": "CREATE_IN_PROGRESS"})
+        client.paginate = lambda StackStatusFilter: iter([{"StackSummaries": []}])
+        poller = without_thread(StackStatusPoller())
+        watch = poller.watch(client, "foo")
+        poller.tick()
+        assert not watch.done.is_set()
+        assert poller._watches == {client: [watch]}
+
+    def test_poll_errors_are_raised_to_every_waiter(self):
+        client = FakeCloudFormationClient({"foo": "CREATE_IN_PROGRESS"})
+
+        def paginate(StackStatusFilter):
+            raise Exception("Rate exceeded")
+
+        client.paginate = paginate
+        poller = StackStatusPoller()
+        with pytest.raises(Exception, match="Rate exceeded"):
+            poller.wait(client, "foo")
+        assert poller._watches == {}
+
+    def test_ticks_back_off_for_long_running_stack(self):
+        fake_clock = FakeClock()
+        client = FakeCloudFormationClient({"foo": "UPDATE_IN_PROGRESS"})
+        poller = without_thread(
+            StackStatusPoller(
+                fake_waiter(fake_clock, initial_delay=2, backoff=1.5, max_delay=10)
+            )
+        )
+        foo = poller.watch(client, "foo")
+
+        def run_ticks(count):
+            spacing = []
+            for _ in range(count):
+                delay = poller.seconds_until_next_tick()
+                spacing.append(delay)
+                fake_clock.sleep(delay)
+                poller.tick()
+            return spacing
+
+        assert run_ticks(7) == [0, 2, 3, 4.5, 6.75, 10, 10]
+        assert client.list_stacks_calls == 7
+
+        # A new stack is polled straight away and on its own backoff, without resetting the first stack's.
+        fake_clock.sleep(4)
+        client.statuses["bar"] = "UPDATE_IN_PROGRESS"
+        poller.watch(client, "bar")
+        assert run_ticks(4) == [0, 2, 3, 1]
+        assert foo.next_poll == fake_clock.now + 10
+
+    def test_quick_operation_finishes_on_first_tick(self):
+        fake_clock = FakeClock()
+        client = FakeCloudFormationClient({"foo": "UPDATE_COMPLETE"})
+        poller = without_thread(StackStatusPoller(fake_waiter(fake_clock)))
+        watch = poller.watch(client, "foo")
+        assert poller.seconds_until_next_tick() == 0
+        poller.tick()
+        assert watch.status == "UPDATE_COMPLETE"
+        assert poller.seconds_until_next_tick() is None
+
+    def test_concurrent_waits_share_ticks(self):
+        names = [f"stack-{i}" for i in range(20)]
+        client = FakeCloudFormationClient(
+            {name: "CREATE_IN_PROGRESS" for name in names}
+        )
+        paginate = client.paginate
+
+        def finishing_paginate(StackStatusFilter):
+            # Everything finishes from the fourth tick.
+            if client.list_stacks_calls == 3:
+                client.statuses.update({name: "CREATE_COMPLETE" for name in names})
+            return paginate(StackStatusFilter)
+
+        client.paginate = finishing_paginate
+        poller = StackStatusPoller(
+            Waiter(initial_delay=0.01, max_delay=0.01, backoff=1, jitter=0)
+        )
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            statuses = list(executor.map(lambda name: poller.wait(client, name), names))
+
+        assert statuses == ["CREATE_COMPLETE"] * len(names)
+        assert client.describe_stacks_calls == len(names)
+        # Every stack polled separately would have listed at least once per stack.
+        assert client.list_stacks_calls < len(names)
+        assert poller._thread is None
+
+    def test_wait_times_out(self):
+        client = FakeCloudFormationClient({"foo": "CREATE_IN_PROGRESS"})
+        poller = without_thread(StackStatusPoller(Waiter(timeout=0.01)))
+        with pytest.raises(Exception, match="Timed out"):
+            poller.wait(client, "foo")
+        assert poller._watches == {}
+
+    @mock_cloudformation
+    def test_wait_for_stack_uses_poller_by_default(self):
+        client = boto3.client("cloudformation")
+        stack_id = client.create_stack(StackName="foo", TemplateBody=TEMPLATE_BODY)[
+            "StackId"
+        ]
+        assert wait_for_stack(client, "foo") == "CREATE_COMPLETE"
+        client.delete_stack(StackName="foo")
+        assert wait_for_stack(client, stack_id) == "DELETE_COMPLETE"